@@ -14,7 +14,7 @@ KEYWORDS = 'svg parser'
 URL = 'https://github.com/miute/svgpy'
 PACKAGES = find_packages()
 PACKAGE_DATA = {}
-PYTHON_REQUIRES = '>=3.6'
+PYTHON_REQUIRES = '>=3.7'
 INSTALL_REQUIRES = [
     'cffi>=1.11',
     'cssselect',
@@ -50,7 +50,7 @@ setup(
         'License :: OSI Approved :: Apache Software License',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Multimedia :: Graphics',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
@@ -19,7 +19,7 @@ from svgpy.base import \
     HTMLElement, SVGBoundingBoxOptions, \
     SVGElement, SVGGeometryElement, SVGGradientElement, SVGGraphicsElement, \
     SVGPathData, SVGPathDataSettings, SVGPreserveAspectRatio, \
-    SVGURIReference, SVGZoomAndPan
+    SVGURIReference, SVGZoomAndPan, compute_ctms
 from svgpy.core import Font, SVGLength
 from svgpy.dom import Attr, Comment, DOMTokenList, Element, NamedNodeMap, \
     Node, ProcessingInstruction
@@ -15,16 +15,125 @@
 
 from abc import ABC, abstractmethod
 
+from lxml import etree
+
 from .core import SVGLength
 from .dom import Element, ElementCSSInlineStyle
 from .formatter import format_coordinate_pair_sequence, \
     to_coordinate_pair_sequence
 from .geometry.matrix import DOMMatrix
+from .geometry.polyline import FlattenedPath
 from .geometry.rect import DOMRect
 from .path import PathParser
 from .screen import Screen
 from .transform import SVGTransformList
-from .utils import QualifiedName
+from .utils import QualifiedName, TreeContext
+
+
+def _compute_transform_matrix(element):
+    parent = element.getparent()
+    if element.local_name in ['svg', 'symbol'] or parent is None:
+        matrix = DOMMatrix()
+    else:
+        matrix = _get_transform_matrix(parent)
+    if element.istransformable():
+        transform_list = element.transform
+        if transform_list is not None:
+            matrix = matrix * transform_list.matrix
+    return matrix
+
+
+def _compute_viewport_ctm(element):
+    matrix = _get_viewport_matrix(element)
+    parent = element.getparent()
+    if not isinstance(parent, SVGElement):
+        return matrix
+    root = parent.get_nearest_viewport_element()
+    if root is None:
+        return matrix
+    return _get_viewport_ctm(root) * matrix
+
+
+def _get_bbox_state(element):
+    # the attributes and the text content of the descendants, and the
+    # referenced elements that the bounding box depends on
+    state = list()
+    for target in element.iter(etree.Element):
+        state.append((tuple(target.attrib.items()), target.text, target.tail))
+        if isinstance(target, SVGGraphicsElement):
+            state.append(target._get_reference_state())
+    return tuple(state)
+
+
+def _get_flattened_path(element):
+    def _flatten(_element):
+        settings = SVGPathDataSettings()
+        settings.normalize = True
+        return FlattenedPath(_element.get_path_data(settings))
+
+    return TreeContext.of(element).lookup(
+        element, 'flattened_path', _flatten, volatile=True)
+
+
+def _get_painting_style(element):
+    # (fill-rule, stroke-width, stroke-linecap, stroke-linejoin,
+    # stroke-miterlimit)
+    def _compute(_element):
+        style = _element.get_computed_style()
+        return (style.get('fill-rule', 'nonzero'),
+                float(style.get('stroke-width', 1)),
+                style.get('stroke-linecap', 'butt'),
+                style.get('stroke-linejoin', 'miter'),
+                float(style.get('stroke-miterlimit', 4)))
+
+    return TreeContext.of(element).lookup(
+        element, 'painting_style', _compute, volatile=True)
+
+
+def _get_transform_matrix(element):
+    # the product of the 'transform' properties from the nearest element that
+    # establishes an SVG viewport down to the element
+    return TreeContext.of(element).lookup(
+        element, 'transform_matrix', _compute_transform_matrix,
+        volatile=True)
+
+
+def _get_viewport_ctm(element):
+    # the product of the viewport transformation matrices from the outermost
+    # element that establishes an SVG viewport down to the element
+    return TreeContext.of(element).lookup(
+        element, 'viewport_ctm', _compute_viewport_ctm, volatile=True)
+
+
+def _get_viewport_matrix(element):
+    return TreeContext.of(element).lookup(
+        element,
+        'viewport_matrix',
+        lambda _element: _element.get_viewport_transformation_matrix(
+            recursive=False),
+        volatile=True)
+
+
+def compute_ctms(root):
+    """Computes the current transformation matrices (CTMs) of all the
+    graphics elements of a tree in one pass from the top down, and caches
+    them.
+    A later SVGGraphicsElement.get_ctm() or
+    SVGGraphicsElement.get_screen_ctm() call on an unchanged tree reads the
+    cached matrices.
+
+    Arguments:
+        root (Element): The root element of the subtree.
+    Returns:
+        dict[SVGGraphicsElement, DOMMatrix]: The CTMs keyed by the element.
+    """
+    ctms = dict()
+    for element in root.iter():
+        # the parents are visited before their children
+        if isinstance(element, SVGGraphicsElement):
+            ctms[element] = element.get_ctm()
+            element.get_screen_ctm()
+    return ctms
 
 
 class HTMLOrSVGElement(ABC):
@@ -143,44 +252,43 @@ class SVGElement(ElementCSSInlineStyle, HTMLOrSVGElement):
         nearest = self.get_nearest_viewport_element()
         return nearest
 
+    @staticmethod
+    def _find_ancestor(element, local_names, farthest=False):
+        found = None
+        while element is not None:
+            if element.local_name in local_names:
+                if not farthest:
+                    return element
+                found = element
+            element = element.getparent()
+        return found
+
+    def _lookup_ancestor(self, local_names, farthest=False):
+        """Returns the nearest (or farthest) element in the ancestor-or-self
+        axis whose local name is in local_names. The result is cached in
+        the TreeContext of the tree.
+        """
+        return TreeContext.of(self).lookup(
+            self, (local_names, farthest),
+            lambda element: SVGElement._find_ancestor(element, local_names,
+                                                      farthest))
+
     def get_farthest_svg_element(self):
         """Returns the outermost 'svg' element.
 
         Returns:
             SVGSVGElement: The outermost 'svg' element.
         """
-        root = None
-        element = self
-        while element is not None:
-            if element.local_name == 'svg':
-                root = element
-            element = element.getparent()
-        return root
+        return self._lookup_ancestor(('svg',), farthest=True)
 
     def get_farthest_viewport_element(self):
-        root = None
-        element = self
-        while element is not None:
-            if element.local_name in ['svg', 'symbol']:
-                root = element
-            element = element.getparent()
-        return root
+        return self._lookup_ancestor(('svg', 'symbol'), farthest=True)
 
     def get_nearest_svg_element(self):
-        element = self
-        while element is not None:
-            if element.local_name == 'svg':
-                return element
-            element = element.getparent()
-        return None
+        return self._lookup_ancestor(('svg',))
 
     def get_nearest_viewport_element(self):
-        element = self
-        while element is not None:
-            if element.local_name in ['svg', 'symbol']:
-                return element
-            element = element.getparent()
-        return None
+        return self._lookup_ancestor(('svg', 'symbol'))
 
     def get_view_box(self, recursive=True):
         """Gets values of the 'viewBox' and 'preserveAspectRatio' attributes
@@ -347,61 +455,43 @@ class SVGGraphicsElement(SVGElement):
         Returns:
             DOMMatrix: The current transformation matrix (CTM).
         """
-        roots = list()
-        ctm = DOMMatrix()
+        ctm = TreeContext.of(self).lookup(
+            self,
+            ('ctm', viewport_type),
+            lambda element: element._compute_ctm(viewport_type),
+            volatile=True)
+        if viewport_type == SVGElement.FARTHEST_VIEWPORT:
+            farthest = self.get_farthest_svg_element()
+            if farthest is not None:
+                scale = farthest.current_scale
+                tx, ty = farthest.current_translate
+                return DOMMatrix([scale, 0, 0, scale, tx, ty]) * ctm
+        return DOMMatrix(ctm.tolist())
+
+    def _compute_ctm(self, viewport_type):
+        # the CTM without the current scale and translation of the outermost
+        # 'svg' element
         farthest = self.get_farthest_svg_element()
         if farthest is None:
-            return ctm
+            return DOMMatrix()
         elif hash(farthest) == hash(self):
-            roots.append(farthest)
+            ctm = _get_viewport_matrix(farthest)
         else:
-            element = self
-            while element is not None:
-                root = element.get_nearest_viewport_element()
-                if root is None or root in roots:
-                    break
-                roots.insert(0, root)
-                if viewport_type == SVGElement.NEAREST_VIEWPORT:
-                    if (self.local_name not in ['svg', 'symbol']
-                            or len(roots) >= 2):
-                        break
-                element = root.getparent()
-        if len(roots) == 0:
-            return ctm
-
-        if viewport_type == SVGElement.FARTHEST_VIEWPORT:
-            scale = farthest.current_scale
-            tx, ty = farthest.current_translate
-            ctm *= DOMMatrix([scale, 0, 0, scale, tx, ty])
-        for root in roots:
-            vtm = root.get_viewport_transformation_matrix(recursive=False)
-            ctm *= vtm
-
-        transform_list = SVGTransformList()
-        element = self
-        while element is not None:
-            if element.istransformable():
-                transform = element.transform
-                if transform is not None:
-                    transform_list[0:0] = transform
-            if element.local_name in ['svg', 'symbol']:
-                break
-            element = element.getparent()
-        if len(transform_list) > 0:
-            matrix = transform_list.matrix
-            ctm *= matrix
-        return ctm
-
-    def get_bbox(self, options=None, _depth=0):
-        """Returns the bounding box of the current element.
+            root = self.get_nearest_viewport_element()
+            if viewport_type == SVGElement.FARTHEST_VIEWPORT:
+                ctm = _get_viewport_ctm(root)
+            elif self.local_name in ['svg', 'symbol']:
+                ctm = _get_viewport_matrix(root)
+                parent = root.getparent()
+                parent_root = (parent.get_nearest_viewport_element()
+                               if isinstance(parent, SVGElement) else None)
+                if parent_root is not None:
+                    ctm = _get_viewport_matrix(parent_root) * ctm
+            else:
+                ctm = _get_viewport_matrix(root)
+        return ctm * _get_transform_matrix(self)
 
-        Arguments:
-            options (SVGBoundingBoxOptions, optional): Reserved.
-            _depth (int, optional): For internal use only.
-        Returns:
-            DOMRect: The bounding box of the current element.
-        """
-        # TODO: implement SVGBoundingBoxOptions option.
+    def _get_bbox(self, options, _depth):
         _depth += 1
         bbox = DOMRect()
         if self.local_name in ['defs', 'symbol']:
@@ -426,6 +516,41 @@ class SVGGraphicsElement(SVGElement):
                 bbox = PathParser.get_bbox(path_data, options)
         return bbox
 
+    def _get_reference_state(self):
+        """Returns the state of the elements that this element refers to,
+        which its bounding box depends on.
+
+        Returns:
+            tuple: The state, or None if the element does not refer to other
+                elements.
+        """
+        return None
+
+    def get_bbox(self, options=None, _depth=0):
+        """Returns the bounding box of the current element.
+        The bounding boxes are cached per element, and are recomputed after
+        the attributes or the children of the element, its ancestors or its
+        descendants, or the elements that they refer to, are changed (see
+        TreeContext). The bounding boxes of the subtrees that contain text
+        are also recomputed after the text content is changed.
+
+        Arguments:
+            options (SVGBoundingBoxOptions, optional): Reserved.
+            _depth (int, optional): For internal use only.
+        Returns:
+            DOMRect: The bounding box of the current element.
+        """
+        # TODO: implement SVGBoundingBoxOptions option.
+        if options is not None:
+            return self._get_bbox(options, _depth)
+        bbox = TreeContext.of(self).lookup(
+            self,
+            ('bbox', _depth > 0),
+            lambda element: element._get_bbox(options, _depth),
+            volatile=True,
+            state=_get_bbox_state)
+        return DOMRect(**bbox.tojson())
+
     def get_ctm(self):
         """Returns the current transformation matrix (CTM). The matrix that
         transforms the current element's coordinate system to its SVG
@@ -472,11 +597,6 @@ class SVGGraphicsElement(SVGElement):
         path_data = self.get_path_data(settings)
         if len(path_data) == 0:
             return path_data
-        if self.local_name == 'use':
-            transform_list = self.instance_root.transform
-            if transform_list is not None:
-                matrix = transform_list.matrix
-                path_data = PathParser.transform(path_data, matrix)
         transform_list = self.transform  # type: SVGTransformList
         if transform_list is not None:
             matrix = transform_list.matrix
@@ -589,6 +709,38 @@ class SVGFitToViewBox(Element):
 class SVGGeometryElement(SVGGraphicsElement):
     """Represents the [SVG2] SVGGeometryElement."""
 
+    def are_points_in_fill(self, points):
+        """Tests whether each of the points is inside the fill area of the
+        element, according to the 'fill-rule' property.
+        The flattened path is cached until the tree is changed, so repeated
+        tests on the same element do not flatten the path again.
+
+        Arguments:
+            points (array_like): An array of shape (n, 2) of the points in
+                the user coordinate system of the element.
+        Returns:
+            numpy.ndarray: An array of shape (n,) of bool.
+        """
+        fill_rule = _get_painting_style(self)[0]
+        return _get_flattened_path(self).contains(points, fill_rule)
+
+    def are_points_in_stroke(self, points):
+        """Tests whether each of the points is inside the stroke area of the
+        element, according to the 'stroke-width', 'stroke-linecap',
+        'stroke-linejoin' and 'stroke-miterlimit' properties.
+        Dashing is not taken into account.
+
+        Arguments:
+            points (array_like): An array of shape (n, 2) of the points in
+                the user coordinate system of the element.
+        Returns:
+            numpy.ndarray: An array of shape (n,) of bool.
+        """
+        _, stroke_width, line_cap, line_join, miter_limit = \
+            _get_painting_style(self)
+        return _get_flattened_path(self).stroke_contains(
+            points, stroke_width, line_cap, line_join, miter_limit)
+
     def get_path_data(self, settings=None):
         """Returns a list of path segments that corresponds to the path data.
 
@@ -616,6 +768,33 @@ class SVGGeometryElement(SVGGraphicsElement):
             return 0
         return PathParser.get_total_length(path_data)
 
+    def is_point_in_fill(self, x, y):
+        """Returns True if the point is inside the fill area of the element.
+        See SVGGeometryElement.are_points_in_fill().
+
+        Arguments:
+            x (float): The x-coordinate of the point in the user coordinate
+                system of the element.
+            y (float): The y-coordinate of the point.
+        Returns:
+            bool: True if the point is inside the fill area.
+        """
+        return bool(self.are_points_in_fill([(x, y)])[0])
+
+    def is_point_in_stroke(self, x, y):
+        """Returns True if the point is inside the stroke area of the
+        element.
+        See SVGGeometryElement.are_points_in_stroke().
+
+        Arguments:
+            x (float): The x-coordinate of the point in the user coordinate
+                system of the element.
+            y (float): The y-coordinate of the point.
+        Returns:
+            bool: True if the point is inside the stroke area.
+        """
+        return bool(self.are_points_in_stroke([(x, y)])[0])
+
 
 class SVGPathData(Element):
     """Represents the [SVG2] SVGPathData."""
@@ -0,0 +1,620 @@
+# Copyright (C) 2018 Tetsuya Miura <miute.dev@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import copy
+import math
+import os
+import re
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from itertools import count, islice
+
+import numpy as np
+from lxml import etree
+
+from .base import SVGGeometryElement
+from .css import CSSRule
+from .dom import Element
+from .element import SVGParser, SVGUseElement
+from .geometry.extraction import FIELDS, OPTIONAL_FIELDS, extract, \
+    isrendered
+from .path import SVGPathSegment
+from .style import get_css_rules
+
+BatchResult = namedtuple('BatchResult', ['index', 'source', 'value', 'error'])
+
+# the selectors that depend on the siblings, which are not all copied into
+# the fragments
+_RE_SIBLING_SELECTOR = re.compile(
+    r'[+~]|:(first|last|only|nth|nth-last)-(child|of-type)')
+
+# the per-process state of a worker
+_worker_parser = None
+
+
+class PackedPathData(object):
+    """Represents a list of path segments packed into flat arrays.
+    It pickles as three buffers instead of one object per path segment.
+    """
+
+    def __init__(self, types='', values=None, sizes=None):
+        """Constructs a PackedPathData object.
+
+        Arguments:
+            types (str, optional): The path types of the path segments.
+            values (numpy.ndarray, optional): The values of all the path
+                segments.
+            sizes (numpy.ndarray, optional): The number of values of each
+                path segment.
+        """
+        self.types = types
+        self.values = (np.asarray(values, dtype=np.float64)
+                       if values is not None
+                       else np.empty(0, dtype=np.float64))
+        self.sizes = (np.asarray(sizes, dtype=np.int32)
+                      if sizes is not None
+                      else np.empty(0, dtype=np.int32))
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedPathData):
+            return NotImplemented
+        return (self.types == other.types
+                and np.array_equal(self.sizes, other.sizes)
+                and np.array_equal(self.values, other.values))
+
+    def __len__(self):
+        return len(self.types)
+
+    def __repr__(self):
+        return '<{} object at {} ({} segments)>'.format(
+            type(self).__name__, hex(id(self)), len(self))
+
+    @staticmethod
+    def pack(path_data):
+        """Packs a list of path segments.
+
+        Arguments:
+            path_data (list[SVGPathSegment]): A list of path segments.
+        Returns:
+            PackedPathData: A new PackedPathData object.
+        """
+        path_data = [x for x in path_data if x.isvalid()]
+        types = ''.join(x.type for x in path_data)
+        sizes = [len(x.values) for x in path_data]
+        values = [value for x in path_data for value in x.values]
+        return PackedPathData(types, values, sizes)
+
+    def unpack(self):
+        """Unpacks the path segments.
+
+        Returns:
+            list[SVGPathSegment]: A list of path segments.
+        """
+        values = self.values.tolist()
+        offsets = np.concatenate(([0], np.cumsum(self.sizes))).tolist()
+        return [SVGPathSegment(path_type, *values[start:end])
+                for path_type, start, end
+                in zip(self.types, offsets[:-1], offsets[1:])]
+
+
+def _create_fragment(chain, subtrees, referenced):
+    # copies the ancestors without their rendered children, their
+    # non-rendered children (e.g., <defs> and <style>), and the subtrees
+    fragment = None
+    parent = None
+    last = chain[-1]
+    ancestors = set(chain)
+    subtrees = set(subtrees)
+    for element in chain:
+        element_copy = etree.Element(element.tag, attrib=dict(element.attrib),
+                                     nsmap=element.nsmap)
+        if fragment is None:
+            fragment = element_copy
+        else:
+            parent.append(element_copy)
+        for child in element:
+            if (not isinstance(child.tag, str) or child in ancestors
+                    or (isrendered(child)
+                        and (element is not last or child not in subtrees))):
+                continue
+            element_copy.append(copy.deepcopy(child))
+        parent = element_copy
+    if len(referenced) > 0:
+        # the rendered siblings that are referenced by the <use> elements
+        defs = etree.SubElement(
+            parent, '{{{}}}defs'.format(Element.SVG_NAMESPACE_URI))
+        for element in referenced:
+            defs.append(copy.deepcopy(element))
+    return etree.tostring(fragment)
+
+
+def _depends_on_siblings(chain):
+    # True if the style sheets of the document may match the elements of the
+    # fragments created by _create_fragment() differently
+    document_element = chain[0]
+    for sibling in document_element.itersiblings(preceding=True):
+        if (isinstance(sibling, etree.PIBase)
+                and sibling.target == 'xml-stylesheet'):
+            return True  # not copied into the fragments
+    ancestors = set(chain)
+    for element in document_element.iter('{*}link', '{*}style'):
+        child = element
+        while child.getparent() not in ancestors:
+            child = child.getparent()
+        if isrendered(child):
+            return True  # inside a rendered subtree
+    for css_rule in get_css_rules(document_element):
+        if (css_rule.type == CSSRule.STYLE_RULE
+                and _RE_SIBLING_SELECTOR.search(css_rule.selector_text)):
+            return True
+    return False
+
+
+def _extract_fragment(depth, fields, root):
+    # extracts the geometry of the subtrees of a fragment created by
+    # _create_fragment()
+    parent = root
+    for _ in range(depth):
+        parent = parent[-1]  # the next ancestor follows the copied children
+    subtree_columns = [extract(child, fields)
+                       for child in parent if isrendered(child)]
+    columns = dict()
+    for field in fields:
+        values = [x[field] for x in subtree_columns]
+        if field == 'path':
+            path_data = [path_data for x in values for path_data in x]
+            sizes = [sum(1 for path_segment in x if path_segment.isvalid())
+                     for x in path_data]
+            columns[field] = (
+                PackedPathData.pack(
+                    path_segment for x in path_data for path_segment in x),
+                np.array(sizes, dtype=np.int32))
+        else:
+            columns[field] = np.concatenate(values)
+    return columns
+
+
+def _get_element_key(element):
+    element_id = element.id
+    if len(element_id) > 0:
+        return element_id
+    return element.getroottree().getpath(element)
+
+
+def extract_bbox(root):
+    """Returns the bounding box of the document.
+
+    Arguments:
+        root (SVGSVGElement): The root element of the document.
+    Returns:
+        DOMRect: The bounding box of the document.
+    """
+    return root.get_bbox()
+
+
+def extract_text_paths(root):
+    """Returns the outlines of the text elements.
+
+    Arguments:
+        root (SVGSVGElement): The root element of the document.
+    Returns:
+        dict[str, PackedPathData]: The outlines keyed by the element ID, or
+            by the XPath expression of an element without an ID.
+    """
+    return dict((_get_element_key(element),
+                 PackedPathData.pack(element.get_path_data()))
+                for element in root.iter('{*}text'))
+
+
+def extract_total_lengths(root):
+    """Returns the total lengths of the shapes.
+
+    Arguments:
+        root (SVGSVGElement): The root element of the document.
+    Returns:
+        dict[str, float]: The total lengths keyed by the element ID, or by
+            the XPath expression of an element without an ID.
+    """
+    return dict((_get_element_key(element), element.get_total_length())
+                for element in root.iter('{*}*')
+                if isinstance(element, SVGGeometryElement))
+
+
+EXTRACTORS = {
+    'bbox': extract_bbox,
+    'text_paths': extract_text_paths,
+    'total_lengths': extract_total_lengths,
+}
+
+
+def _init_worker(parser_options, font_families, initializer, initargs):
+    global _worker_parser
+    _worker_parser = SVGParser(**parser_options)
+    if len(font_families) > 0:
+        # load the font faces and the HarfBuzz fonts once per worker
+        text = ''.join(
+            '<text font-family="{}">a</text>'.format(family)
+            for family in font_families)
+        root = _worker_parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">{}</svg>'.format(text))
+        for element in root:
+            element.get_computed_text_length()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _get_referenced_subtrees(chain, subtrees):
+    # the elements that are referenced by the <use> elements in the subtrees
+    # and in the non-rendered children of the ancestors, directly or
+    # indirectly, and are not copied into the fragment: the rendered
+    # children of the last ancestor that contain them, or the elements
+    # themselves if they are in the rendered children of the other ancestors
+    parent = chain[-1]
+    ancestors = set(chain)
+    positions = dict((child, position)
+                     for position, child in enumerate(parent))
+    visited = set(subtrees)
+    stack = [child for element in chain for child in element
+             if child not in ancestors
+             and (child in visited or not isrendered(child))]
+    referenced = list()
+    while len(stack) > 0:
+        for use in stack.pop().iter('{*}use'):
+            if not isinstance(use, SVGUseElement):
+                continue
+            try:
+                element = use.instance_root
+            except NotImplementedError:
+                continue  # an external reference
+            child = element
+            while child is not None and child.getparent() not in ancestors:
+                child = child.getparent()
+            if (child is None or child in ancestors
+                    or not isrendered(child)):
+                continue  # not found, or copied into the fragment
+            elif child.getparent() is not parent:
+                child = element
+            if child in visited:
+                continue
+            visited.add(child)
+            referenced.append(child)
+            stack.append(child)
+    return sorted(referenced, key=lambda x: positions.get(x, len(positions)))
+
+
+def _parse(source):
+    if isinstance(source, bytes):
+        return _worker_parser.fromstring(source)
+    return _worker_parser.parse(source).getroot()
+
+
+def _partition(weights, num_chunks):
+    # splits the items into contiguous chunks of about the same weight
+    total = sum(weights)
+    chunks = list()
+    chunk = list()
+    cumulative = 0
+    for index, weight in enumerate(weights):
+        chunk.append(index)
+        cumulative += weight
+        if cumulative >= total * (len(chunks) + 1) / num_chunks:
+            chunks.append(chunk)
+            chunk = list()
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+def _process_chunk(func, chunk):
+    if isinstance(func, str):
+        func = EXTRACTORS[func]
+    elif isinstance(func, (list, tuple)):
+        names = func
+
+        def func(_root):
+            return dict((name, EXTRACTORS[name](_root)) for name in names)
+
+    results = list()
+    for index, source in chunk:
+        try:
+            value = func(_parse(source))
+            error = None
+        except Exception as exp:
+            value = None
+            error = '{}: {}'.format(type(exp).__name__, exp)
+        results.append(BatchResult(
+            index, source if not isinstance(source, bytes) else None,
+            value, error))
+    return results
+
+
+class BatchProcessor(object):
+    """Processes many independent SVG documents in a pool of worker
+    processes.
+
+    Each worker is initialized once with its own SVGParser (and its own
+    font faces), and parses and processes the documents of a chunk in
+    turn.
+
+    Examples:
+        >>> from svgpy.batch import BatchProcessor
+        >>> with BatchProcessor(chunk_size=32) as processor:
+        ...     for result in processor.map('bbox', filenames):
+        ...         print(result.source, result.value, result.error)
+    """
+
+    def __init__(self, max_workers=None, chunk_size=16, font_families=None,
+                 initializer=None, initargs=(), mp_context=None,
+                 **parser_options):
+        """Constructs a BatchProcessor object.
+
+        Arguments:
+            max_workers (int, optional): The maximum number of worker
+                processes. Defaults to the number of processors.
+            chunk_size (int, optional): The number of documents that are
+                sent to a worker at once.
+            font_families (list[str], optional): The font families to be
+                loaded by each worker before processing the documents.
+            initializer (callable, optional): A function that is called
+                once by each worker with initargs.
+            initargs (tuple, optional): The arguments of initializer.
+            mp_context (multiprocessing.context.BaseContext, optional): The
+                multiprocessing context of the worker processes.
+            **parser_options: The keyword arguments of the SVGParser of each
+                worker (e.g., huge_tree=True).
+        """
+        if chunk_size < 1:
+            raise ValueError(
+                'Expected chunk_size >= 1, got {}'.format(chunk_size))
+        self._max_workers = (max_workers if max_workers is not None
+                             else os.cpu_count() or 1)
+        self._chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(parser_options,
+                      tuple(font_families or ()),
+                      initializer,
+                      initargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @property
+    def chunk_size(self):
+        """int: The number of documents that are sent to a worker at once.
+        """
+        return self._chunk_size
+
+    @property
+    def max_workers(self):
+        """int: The maximum number of worker processes."""
+        return self._max_workers
+
+    def map(self, func, sources, ordered=True):
+        """Processes the documents, and yields the results.
+
+        Arguments:
+            func (callable, str, list[str]): A picklable function that takes
+                the root element of a document and returns a picklable
+                value, the name of a built-in extractor ('bbox',
+                'text_paths' or 'total_lengths'), or a list of the names of
+                the built-in extractors.
+            sources (iterable[str, os.PathLike, bytes]): The filenames or
+                the contents of the documents. It is consumed lazily.
+            ordered (bool, optional): If True, yields the results in the
+                order of the sources, otherwise yields them as soon as they
+                are completed.
+        Returns:
+            iterator[BatchResult]: An iterator of the results. If the
+                function raised an exception, BatchResult.value is None and
+                BatchResult.error describes the exception.
+        """
+        if isinstance(func, (str, list, tuple)):
+            names = [func] if isinstance(func, str) else func
+            for name in names:
+                if name not in EXTRACTORS:
+                    raise ValueError(
+                        'Unknown extractor: ' + repr(name))
+        items = zip(count(), sources)
+        max_pending = self._max_workers * 2
+        pending = deque()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(islice(items, self._chunk_size))
+                if len(chunk) == 0:
+                    break
+                pending.append(
+                    self._executor.submit(_process_chunk, func, chunk))
+            if len(pending) == 0:
+                break
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                for result in future.result():
+                    yield result
+
+    def shutdown(self, wait=True):
+        """Shuts down the worker processes.
+
+        Arguments:
+            wait (bool, optional): If True, waits for the pending documents
+                to be processed.
+        """
+        self._executor.shutdown(wait=wait)
+
+
+def process(func, sources, ordered=True, **kwargs):
+    """Processes the documents in a pool of worker processes, and yields the
+    results.
+    See BatchProcessor.map().
+
+    Arguments:
+        func (callable, str, list[str]): See BatchProcessor.map().
+        sources (iterable[str, os.PathLike, bytes]): See
+            BatchProcessor.map().
+        ordered (bool, optional): See BatchProcessor.map().
+        **kwargs: See BatchProcessor().
+    Returns:
+        iterator[BatchResult]: An iterator of the results.
+    """
+    with BatchProcessor(**kwargs) as processor:
+        for result in processor.map(func, sources, ordered=ordered):
+            yield result
+
+
+def parallel_extract(root, fields=None, processor=None, **kwargs):
+    """Extracts the geometry of all the rendered elements of a subtree in a
+    pool of worker processes.
+    See svgpy.geometry.extraction.extract().
+
+    The rendered children of the subtree (or of the first descendant that
+    has more than one rendered child) are split into chunks of about the
+    same number of elements. Each chunk is serialized into a fragment that
+    also contains the ancestors of the chunk (with their attributes but
+    without their rendered children), the non-rendered children of the
+    ancestors (e.g., <defs> and <style>), and the rendered siblings that are
+    referenced by <use> elements. The ancestors of the subtree itself are
+    copied in the same way. So the CTMs, the computed styles and the
+    references are resolved in each worker as they are in the document.
+    Each worker returns the columns as numpy arrays, and the path data
+    packed into flat arrays, which are copied as buffers.
+
+    The subtree is extracted in the calling process if the style sheets of
+    the document may match differently in the fragments: if a selector
+    depends on the siblings (e.g., '+' or ':nth-child()'), or a style sheet
+    is inside a rendered element or is linked by an 'xml-stylesheet'
+    processing instruction.
+
+    Arguments:
+        root (SVGGraphicsElement): The root element of the subtree.
+        fields (list[str], optional): The fields to be extracted (see
+            extract()). Defaults to all the fields except the optional ones.
+        processor (BatchProcessor, optional): The processor that runs the
+            workers. If not specified, a new processor is created with
+            kwargs, and is shut down before returning.
+        **kwargs: See BatchProcessor(). chunk_size defaults to 1.
+    Returns:
+        dict[str, numpy.ndarray | list[PackedPathData]]: The columns keyed
+            by the field name, as returned by extract(). 'path' is a list of
+            PackedPathData.
+
+    Examples:
+        >>> from svgpy.batch import parallel_extract
+        >>> columns = parallel_extract(root, ['bbox', 'length'],
+        ...                            max_workers=4)
+        >>> columns['length'].sum()
+        123456.789
+    """
+    if fields is None:
+        fields = FIELDS
+    elif isinstance(fields, str):
+        fields = (fields,)
+    for field in fields:
+        if field not in FIELDS and field not in OPTIONAL_FIELDS:
+            raise ValueError('Unknown field: ' + repr(field))
+    fields = tuple(fields)
+
+    # the ancestors of the subtrees to be split
+    chain = [root]
+    subtrees = [child for child in root if isrendered(child)]
+    while len(subtrees) == 1 and subtrees[0].iscontainer():
+        chain.append(subtrees[0])
+        subtrees = [child for child in subtrees[0] if isrendered(child)]
+    ancestors = list(root.iterancestors())
+    ancestors.reverse()
+    if (not isrendered(root) or not root.iscontainer() or len(subtrees) == 0
+            or _depends_on_siblings(ancestors + chain)):
+        columns = extract(root, fields)
+        if 'path' in fields:
+            columns['path'] = [PackedPathData.pack(x)
+                               for x in columns['path']]
+        return columns
+
+    if processor is None:
+        kwargs.setdefault('chunk_size', 1)
+        with BatchProcessor(**kwargs) as processor:
+            return parallel_extract(root, fields, processor)
+
+    num_chunks = min(len(subtrees),
+                     processor.max_workers * processor.chunk_size * 4)
+    weights = [sum(1 for _ in subtree.iter()) for subtree in subtrees]
+    sources = list()
+    for chunk in _partition(weights, num_chunks):
+        chunk = [subtrees[index] for index in chunk]
+        sources.append(_create_fragment(
+            ancestors + chain, chunk,
+            _get_referenced_subtrees(ancestors + chain, chunk)))
+    func = partial(_extract_fragment, len(ancestors) + len(chain) - 1,
+                   fields)
+    results = list()
+    for result in processor.map(func, sources):
+        if result.error is not None:
+            raise RuntimeError(
+                'Failed to extract the geometry: ' + result.error)
+        results.append(result.value)
+
+    # the ancestors precede the subtrees in document order
+    columns = dict()
+    for field in fields:
+        values = [x[field] for x in results]
+        if field == 'id':
+            values.insert(0, np.array([x.id for x in chain], dtype=str))
+        elif field == 'tag':
+            values.insert(0, np.array([x.local_name for x in chain],
+                                      dtype=str))
+        elif field == 'ctm':
+            ctms = [x.get_screen_ctm() for x in chain]
+            values.insert(0, np.array(
+                [(x.a, x.b, x.c, x.d, x.e, x.f) for x in ctms],
+                dtype=np.float64).reshape(-1, 6))
+        elif field == 'bbox':
+            # the union of the bounding boxes of the subtrees
+            bboxes = np.concatenate(values)
+            bboxes = bboxes[~np.isnan(bboxes[:, 0])]
+            bbox = (math.nan,) * 4
+            if len(bboxes) > 0:
+                x1, y1 = bboxes[:, :2].min(axis=0)
+                x2, y2 = (bboxes[:, :2] + bboxes[:, 2:]).max(axis=0)
+                bbox = x1, y1, x2 - x1, y2 - y1
+            values.insert(0, np.array([bbox] * len(chain), dtype=np.float64))
+        elif field == 'length':
+            values.insert(0, np.full(len(chain), math.nan))
+        if field == 'path':
+            paths = [PackedPathData() for _ in chain]
+            for packed, sizes in values:
+                offsets = np.concatenate(([0], np.cumsum(sizes)))
+                value_offsets = np.concatenate(
+                    ([0], np.cumsum(packed.sizes)))[offsets]
+                for start, end, value_start, value_end in zip(
+                        offsets[:-1], offsets[1:],
+                        value_offsets[:-1], value_offsets[1:]):
+                    paths.append(PackedPathData(
+                        packed.types[start:end],
+                        packed.values[value_start:value_end],
+                        packed.sizes[start:end]))
+            columns[field] = paths
+        else:
+            columns[field] = np.concatenate(values)
+    return columns
@@ -18,7 +18,10 @@ import html
 import math
 import re
 import shlex
+import threading
 import unicodedata
+import weakref
+from collections import OrderedDict
 from decimal import Decimal, InvalidOperation
 
 import numpy as np
@@ -26,8 +29,13 @@ import numpy as np
 from .fontconfig import FontConfig
 from .formatter import format_number_sequence
 from .freetype import FreeType, FTFace
+from .harfbuzz import HBBuffer, HBFTFont, HBFeature, HBLanguage, HBScript
+from .icu import UBiDi, UBreakIterator, ULocale
+from .opentype import features_from_style, iso639_codes_from_language_tag
 from .screen import Screen
 
+_XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
 
 class CSSUtils(object):
     _ABSOLUTE_FONT_SIZE_MAP = {
@@ -703,6 +711,13 @@ class Font(object):
     def family(self):
         return self._face.family_name
 
+    @property
+    def hb_font(self):
+        """harfbuzz.HBFTFont: A HarfBuzz HBFTFont object bound to the font
+        face.
+        """
+        return FontManager.get_hb_font(self._face)
+
     @property
     def height(self):
         return self._face.size.metrics.y_ppem
@@ -735,14 +750,175 @@ class Font(object):
         self._face.load_char('x', FreeType.FT_LOAD_NO_BITMAP)
         return self._face.glyph.metrics.height / 64
 
+    @staticmethod
+    def measure_text(text, style, owner_document=None):
+        """Returns the advance measure of the text.
+        The text is shaped with the font that matches the style, but the
+        glyph outlines are not loaded.
+
+        Arguments:
+            text (str): A text to be measured.
+            style (dict): The computed style. See
+                Element.get_computed_style().
+            owner_document (Document, optional): The owner document to get the
+                screen resolution.
+        Returns:
+            float: The sum of the advances of the shaped glyphs.
+        """
+        if len(text) == 0:
+            return 0
+        face = FontManager.get_face(style, owner_document, text)
+        hb_font = FontManager.get_hb_font(face)
+        hb_features = [HBFeature.fromstring(feature)
+                       for feature in features_from_style(style)]
+        horizontal = style['writing-mode'] in [
+            'horizontal-tb', 'lr', 'lr-tb', 'rl', 'rl-tb']
+        _, hb_language, hb_script = _shaping_context.get_language(style)
+        buf = _shaping_context.shape(text, hb_font, hb_features,
+                                     hb_language, hb_script)
+        positions = buf.get_glyph_positions_array()
+        if horizontal:
+            return int(positions['x_advance'].sum()) / 64
+        return -int(positions['y_advance'].sum()) / 64
+
     def set_point_size(self, width, height, hori_resolution=0,
                        vert_resolution=0):
-        self._face.request_size(FreeType.FT_SIZE_REQUEST_TYPE_NOMINAL,
-                                width, height,
-                                hori_resolution, vert_resolution)
+        # the font face is shared, so switch to the face of the new size
+        # instead of resizing it.
+        self._face = FontManager.get_sized_face(self._face,
+                                                width, height,
+                                                hori_resolution,
+                                                vert_resolution)
+
+
+class _FacePool(threading.local):
+    """Holds the font faces and the HarfBuzz fonts of the current thread.
+    FreeType faces are not thread-safe, so each thread opens its own faces.
+    The pool keeps at most _FacePool.MAX_SIZED_FACES sized faces, and
+    releases the least recently used ones. An evicted face is closed when it
+    is no longer referenced.
+    """
+
+    MAX_SIZED_FACES = 64
+
+    def __init__(self):
+        # (filename, index) -> FTFace
+        self.faces = dict()
+
+        # (filename, index, width, height, hori_resolution, vert_resolution)
+        #  -> FTFace
+        self.sized_faces = OrderedDict()
+
+        # FTFace -> (filename, index)
+        self.face_sources = weakref.WeakKeyDictionary()
+
+    def add_sized_face(self, key, sized_face, source):
+        self.sized_faces[key] = sized_face
+        self.face_sources[sized_face] = source
+        while len(self.sized_faces) > _FacePool.MAX_SIZED_FACES:
+            self.sized_faces.popitem(last=False)
+
+
+_face_pool = _FacePool()
+
+
+class _ShapingContext(threading.local):
+    """Holds the reusable HarfBuzz buffer, ICU bidi object and ICU line break
+    iterators of the current thread.
+    """
+
+    def __init__(self):
+        self.buffer = HBBuffer.create()
+        self.bidi = UBiDi()
+        self._break_iterators = dict()
+
+    @staticmethod
+    def get_language(style):
+        """Returns the language and the script of the text.
+
+        Arguments:
+            style (dict): The computed style.
+        Returns:
+            ULocale: The locale of the text.
+            HBLanguage: The HarfBuzz language.
+            HBScript: The HarfBuzz script, or None if it is not specified.
+        """
+        locale = None
+        font_language_override = style['font-language-override']
+        if font_language_override != 'normal':
+            codes = iso639_codes_from_language_tag(font_language_override)
+            if codes is not None:
+                # FIXME: use correct language code.
+                locale = ULocale(codes[0])
+        else:
+            xml_lang = style.get(_XML_LANG)
+            if xml_lang is None:
+                xml_lang = style.get('lang')
+            if xml_lang is not None:
+                locale = ULocale(xml_lang)
+        if locale is None:
+            locale = ULocale.get_default()
+        hb_language = HBLanguage.fromstring(locale.get_language())
+        script = locale.get_script()
+        if script is not None and len(script) == 4:
+            hb_script = HBScript.fromstring(script)
+        else:
+            hb_script = None
+        return locale, hb_language, hb_script
+
+    def get_line_break_iterator(self, locale):
+        bi = self._break_iterators.get(locale)
+        if bi is None:
+            bi = UBreakIterator(UBreakIterator.UBRK_LINE, locale)
+            self._break_iterators[locale] = bi
+        return bi
+
+    def shape(self, text, hb_font, hb_features, hb_language, hb_script):
+        """Shapes the text with the reusable HarfBuzz buffer.
+        The direction and the unspecified script are guessed from the text.
+
+        Arguments:
+            text (str): A text to be shaped.
+            hb_font (HBFont): The HarfBuzz font.
+            hb_features (list[HBFeature]): The font features.
+            hb_language (HBLanguage): The HarfBuzz language.
+            hb_script (HBScript): The HarfBuzz script, or None.
+        Returns:
+            HBBuffer: The buffer that holds the shaped glyphs.
+        """
+        buf = self.buffer
+        buf.clear_contents()
+        buf.set_cluster_level(HBBuffer.CLUSTER_LEVEL_MONOTONE_CHARACTERS)
+        buf.set_language(hb_language)
+        if hb_script is not None:
+            buf.set_script(hb_script)
+        buf.add_utf8(text)
+        buf.guess_segment_properties()
+        buf.shape(hb_font, hb_features)
+        return buf
+
+
+_shaping_context = _ShapingContext()
 
 
 class FontManager(object):
+    """Finds the font faces that match the computed styles.
+
+    The font catalog (the results of FontManager.list() and
+    FontManager.match()) is shared by all threads. The font faces and the
+    HarfBuzz fonts are pooled per thread, so a face returned by
+    FontManager.get_face() must be used only by the thread that requested
+    it.
+    """
+
+    # family -> list[dict]
+    _families = dict()
+
+    # family -> str
+    _matched_families = dict()
+
+    _catalog_lock = threading.Lock()
+
     @staticmethod
     def __debug_print(matched):
         # for style in matched:
@@ -864,8 +1040,8 @@ class FontManager(object):
 
             # check the glyph
             for fc in iter(matched):
-                face = FTFace.new_face(fc[FontConfig.FC_FILE],
-                                       fc[FontConfig.FC_INDEX])
+                face = FontManager._open_face(fc[FontConfig.FC_FILE],
+                                              fc[FontConfig.FC_INDEX])
                 glyph_not_found = False
                 if text is not None:
                     for ch in iter(text):
@@ -896,32 +1072,11 @@ class FontManager(object):
 
         # fallback font
         filename = FontConfig.match(Font.default_font_family, '%{file}')[0]
-        face = FTFace.new_face(filename)
-        return face
-
-    @staticmethod
-    def get_face(style, owner_document, text=None):
-        face = FontManager._find_face(style, text)
-        face.select_charmap(FreeType.FT_ENCODING_UNICODE)
-        pixel_size = style['font-size']
-        point_size = int(SVGLength(pixel_size).value(SVGLength.TYPE_PT) * 64)
-        if (owner_document is not None
-                and owner_document.default_view is not None):
-            screen = owner_document.default_view.screen
-            horizontal_resolution = screen.horizontal_resolution
-            vertical_resolution = screen.vertical_resolution
-        else:
-            horizontal_resolution = Screen.DEFAULT_HORIZONTAL_RESOLUTION
-            vertical_resolution = Screen.DEFAULT_VERTICAL_RESOLUTION
-        face.request_size(FreeType.FT_SIZE_REQUEST_TYPE_NOMINAL,
-                          0,
-                          point_size,
-                          horizontal_resolution,
-                          vertical_resolution)
+        face = FontManager._open_face(filename, 0)
         return face
 
     @staticmethod
-    def list(family):
+    def _list(family):
         fc_elements = [FontConfig.FC_FAMILY, FontConfig.FC_FILE,
                        FontConfig.FC_FONT_FORMAT, FontConfig.FC_INDEX,
                        FontConfig.FC_PIXEL_SIZE, FontConfig.FC_SLANT,
@@ -945,12 +1100,131 @@ class FontManager(object):
             style_sequence.append(style)
         return style_sequence
 
+    @staticmethod
+    def _open_face(filename, index):
+        key = filename, index
+        face = _face_pool.faces.get(key)
+        if face is None:
+            face = FTFace.new_face(filename, index)
+            _face_pool.faces[key] = face
+            _face_pool.face_sources[face] = key
+        return face
+
+    @staticmethod
+    def clear():
+        """Releases all font faces and HarfBuzz fonts in the pool of the
+        current thread, and clears the font catalog.
+        """
+        _face_pool.sized_faces.clear()
+        _face_pool.face_sources.clear()
+        _face_pool.faces.clear()
+        with FontManager._catalog_lock:
+            FontManager._families.clear()
+            FontManager._matched_families.clear()
+
+    @staticmethod
+    def get_face(style, owner_document, text=None):
+        """Returns the font face that matches the specified style.
+        The returned face is shared with other callers in the current thread
+        and should not be resized.
+
+        Arguments:
+            style (dict): The computed style.
+            owner_document (Document): The owner document.
+            text (str, optional): The text to be rendered.
+        Returns:
+            FTFace: A FTFace object.
+        """
+        face = FontManager._find_face(style, text)
+        pixel_size = style['font-size']
+        point_size = int(SVGLength(pixel_size).value(SVGLength.TYPE_PT) * 64)
+        if (owner_document is not None
+                and owner_document.default_view is not None):
+            screen = owner_document.default_view.screen
+            horizontal_resolution = screen.horizontal_resolution
+            vertical_resolution = screen.vertical_resolution
+        else:
+            horizontal_resolution = Screen.DEFAULT_HORIZONTAL_RESOLUTION
+            vertical_resolution = Screen.DEFAULT_VERTICAL_RESOLUTION
+        return FontManager.get_sized_face(face,
+                                          0,
+                                          point_size,
+                                          horizontal_resolution,
+                                          vertical_resolution)
+
+    @staticmethod
+    def get_hb_font(face):
+        """Returns the HarfBuzz font object bound to the font face.
+        The HarfBuzz font is cached with the face, and keeps the face alive
+        while it is referenced.
+
+        Arguments:
+            face (FTFace): A FTFace object.
+        Returns:
+            HBFTFont: A HBFTFont object.
+        """
+        hb_font = getattr(face, '_hb_font', None)
+        if hb_font is None:
+            hb_font = HBFTFont.create(face)
+            face._hb_font = hb_font
+        return hb_font
+
+    @staticmethod
+    def get_sized_face(face, width, height, hori_resolution=0,
+                       vert_resolution=0):
+        """Returns the font face of the specified nominal size, which is
+        opened from the same font file as the specified face.
+
+        Arguments:
+            face (FTFace): A FTFace object.
+            width (int): The nominal width, in 26.6 fractional points.
+            height (int): The nominal height, in 26.6 fractional points.
+            hori_resolution (int, optional): The horizontal resolution in
+                dpi.
+            vert_resolution (int, optional): The vertical resolution in dpi.
+        Returns:
+            FTFace: A FTFace object.
+        """
+        source = _face_pool.face_sources.get(face)
+        if source is None:
+            face.request_size(FreeType.FT_SIZE_REQUEST_TYPE_NOMINAL,
+                              width, height,
+                              hori_resolution, vert_resolution)
+            return face
+        key = source + (width, height, hori_resolution, vert_resolution)
+        sized_face = _face_pool.sized_faces.get(key)
+        if sized_face is not None:
+            _face_pool.sized_faces.move_to_end(key)
+        else:
+            filename, index = source
+            sized_face = FTFace.new_face(filename, index)
+            sized_face.select_charmap(FreeType.FT_ENCODING_UNICODE)
+            sized_face.request_size(FreeType.FT_SIZE_REQUEST_TYPE_NOMINAL,
+                                    width, height,
+                                    hori_resolution, vert_resolution)
+            _face_pool.add_sized_face(key, sized_face, source)
+        return sized_face
+
+    @staticmethod
+    def list(family):
+        with FontManager._catalog_lock:
+            style_sequence = FontManager._families.get(family)
+        if style_sequence is None:
+            style_sequence = FontManager._list(family)
+            with FontManager._catalog_lock:
+                FontManager._families[family] = style_sequence
+        return list(style_sequence)
+
     @staticmethod
     def match(family):
+        with FontManager._catalog_lock:
+            if family in FontManager._matched_families:
+                return FontManager._matched_families[family]
         matched = FontConfig.match(family, '%{family[0]}')
-        if len(matched) == 0:
-            return None
-        return matched[0]
+        name = matched[0] if len(matched) > 0 else None
+        with FontManager._catalog_lock:
+            FontManager._matched_families[family] = name
+        return name
 
 
 class SVGLength(object):
@@ -16,13 +16,14 @@
 import re
 from abc import ABC, abstractmethod
 from collections.abc import MutableMapping, MutableSequence
+from contextlib import contextmanager
 from logging import getLogger
 from urllib.error import URLError
 
 import tinycss2
 
-from ..utils import CaseInsensitiveMapping, dict_to_style, get_content_type, \
-    load, normalize_url, style_to_dict
+from ..utils import CaseInsensitiveMapping, TreeContext, dict_to_style, \
+    get_content_type, load, normalize_url, style_to_dict
 
 _RE_COLLAPSIBLE_WHITESPACE = re.compile(r'(\x20){2,}')
 
@@ -649,6 +650,7 @@ class CSSStyleDeclaration(MutableMapping):
         self._values = dict()
         self._priorities = dict()
         self._owner_node = owner_node
+        self._batch_items = None
         if rule is not None:
             self._css_text = normalize_text(tinycss2.serialize(rule.content))
             self._parse_content(rule.content)
@@ -701,6 +703,8 @@ class CSSStyleDeclaration(MutableMapping):
     def _items(self):
         if self._owner_node is None:
             return self._values
+        elif self._batch_items is not None:
+            return self._batch_items
         else:
             style = self._owner_node.get('style')
             if style is None:
@@ -724,12 +728,7 @@ class CSSStyleDeclaration(MutableMapping):
         items = self._items()
         del items[name]
         self._priorities.pop(name, None)
-        if self._owner_node is not None:
-            if len(items) == 0:
-                del self._owner_node.attrib['style']
-            else:
-                style = dict_to_style(items)
-                self._owner_node.set('style', style)
+        self._write_items(items)
 
     def _set_item(self, name, value, priority=None):
         # TODO: support shorthand property.
@@ -751,12 +750,20 @@ class CSSStyleDeclaration(MutableMapping):
                 return
         items = self._items()
         items[name] = value
-        if self._owner_node is not None:
-            style = dict_to_style(items)
-            self._owner_node.set('style', style)
+        self._write_items(items)
         if priority is not None:
             self._priorities[name] = priority
 
+    def _write_items(self, items):
+        if self._owner_node is None or self._batch_items is not None:
+            return
+        if len(items) == 0:
+            self._owner_node.attrib.pop('style', None)
+            TreeContext.touch(self._owner_node)
+        else:
+            style = dict_to_style(items)
+            self._owner_node.set('style', style)
+
     @property
     def css_text(self):
         """str: A serialization of the CSS rule."""
@@ -773,6 +780,32 @@ class CSSStyleDeclaration(MutableMapping):
         """CSSRule: The parent CSS rule."""
         return self._parent_rule
 
+    @contextmanager
+    def batch(self):
+        """Returns a context manager that coalesces the property writes of the
+        inline style into a single update of the 'style' attribute, which is
+        made when the outermost context exits.
+
+        Returns:
+            CSSStyleDeclaration: The current declaration block.
+
+        Examples:
+            >>> with element.style.batch():
+            ...     element.style['fill'] = 'none'
+            ...     element.style['stroke'] = 'blue'
+            ...     element.style['stroke-width'] = '3'
+        """
+        if self._owner_node is None or self._batch_items is not None:
+            yield self
+            return
+        self._batch_items = self._items()
+        try:
+            yield self
+        finally:
+            items = self._batch_items
+            self._batch_items = None
+            self._write_items(items)
+
     def get_property_priority(self, name):
         """Returns the important flag of the first exact match of name in the
         declarations.
@@ -22,10 +22,10 @@ from lxml import cssselect, etree
 from .core import CSSUtils, Font, SVGLength
 from .css import CSSStyleDeclaration
 from .style import get_css_rules, get_css_style, \
-    get_css_style_sheet_from_element
-from .utils import QualifiedName, get_elements_by_class_name, \
-    get_elements_by_tag_name, get_elements_by_tag_name_ns, \
-    is_ascii_whitespace, style_to_dict
+    get_css_style_sheet_from_element, has_sibling_selectors
+from .utils import ElementIndex, QualifiedName, TreeContext, \
+    get_elements_by_class_name, get_elements_by_tag_name, \
+    get_elements_by_tag_name_ns, is_ascii_whitespace, style_to_dict
 
 
 class DOMTokenList(MutableSequence):
@@ -90,6 +90,7 @@ class DOMTokenList(MutableSequence):
         if (len(value) == 0
                 and self._local_name in self._owner_element.attrib):
             del self._owner_element.attrib[self._local_name]
+            TreeContext.touch(self._owner_element)
         else:
             self._owner_element.set(self._local_name, value)
 
@@ -231,6 +232,10 @@ class NamedNodeMap(MutableMapping):
         attr = self._attr_map.pop(name, None)
         if attr is not None:
             attr.detach_element()
+        if name in ElementIndex.INDEXED_ATTRIBUTES:
+            ElementIndex.of(self._owner_element).set_attribute(
+                self._owner_element, name, self._attrib.get(name), None)
+        TreeContext.touch(self._owner_element)
         del self._attrib[name]
 
     def __getitem__(self, name):
@@ -274,7 +279,7 @@ class NamedNodeMap(MutableMapping):
                 if name in self._attrib:
                     self.__delitem__(name)
                 return
-            self._attrib[name] = value
+            self._owner_element.set(name, value)
             self._set_default_named_item(name)
         elif isinstance(value, Attr):
             if name != value.name:
@@ -770,6 +775,7 @@ class Attr(Node):
         if self._owner_element is not None:
             if value is None or len(value) == 0:
                 if self._qualified_name in self._owner_element.attrib:
+                    TreeContext.touch(self._owner_element)
                     del self._owner_element.attrib[self._qualified_name]
                 return
             self._owner_element.set(self._qualified_name, value)
@@ -963,7 +969,9 @@ class Comment(etree.CommentBase, CharacterData):
         Adds the element as a following sibling directly after this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addnext(element)
+        TreeContext.invalidate(element)
 
     def addprevious(self, element):
         """Reimplemented from lxml.etree.CommentBase.addprevious().
@@ -971,7 +979,9 @@ class Comment(etree.CommentBase, CharacterData):
         Adds the element as a preceding sibling directly before this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addprevious(element)
+        TreeContext.invalidate(element)
 
     def append_child(self, node):
         """Adds a node to the end of this node.
@@ -1117,8 +1127,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
     RE_DIGIT_SEQUENCE_SPLITTER = re.compile(r'\s*,\s*|\s+')
 
     def _init(self):
+        # lxml calls _init() whenever it creates a proxy for the element, so
+        # the attribute map is created on first access
         Node.__init__(self)
-        self._attributes = NamedNodeMap(self)
+        self._attributes = None
 
     @property
     def attributes(self):
@@ -1137,6 +1149,8 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
             >>> root.tostring()
             b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 600 400" xml:lang="ja"/>'
         """
+        if self._attributes is None:
+            self._attributes = NamedNodeMap(self)
         return self._attributes
 
     @property
@@ -1209,6 +1223,14 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
     def node_value(self, value):
         pass  # do nothing
 
+    @property
+    def owner_document(self):
+        """Document: An associated document."""
+        if self._owner_document is not None:
+            return self._owner_document
+        return TreeContext.of(self).lookup(self, 'owner_document',
+                                           Node.owner_document.fget)
+
     @property
     def parent_node(self):
         """Node: A parent node."""
@@ -1281,8 +1303,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Adds the element as a following sibling directly after this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addnext(element)
-
+        TreeContext.invalidate(self)
+        ElementIndex.of(self).insert_subtree(element)
 
     def addprevious(self, element):
         """Reimplemented from lxml.etree.ElementBase.addprevious().
@@ -1290,7 +1314,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Adds the element as a preceding sibling directly before this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addprevious(element)
+        TreeContext.invalidate(self)
+        ElementIndex.of(self).insert_subtree(element)
 
     def append(self, node):
         """Reimplemented from lxml.etree.ElementBase.append().
@@ -1301,7 +1328,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
             node (Node): A node to be added.
         """
         node.attach_document(self.owner_document)
+        TreeContext.invalidate(node)
         super().append(node)
+        TreeContext.invalidate(self)
+        ElementIndex.of(self).insert_subtree(node)
 
     def append_child(self, node):
         """Adds a sub-node to the end of this node.
@@ -1324,10 +1354,13 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Returns:
             bool: Returns True if successful; otherwise False.
         """
+        changed = document is not self._owner_document
         if not super().attach_document(document):
             return False
         for child in self:
             child.attach_document(document)
+        if changed:
+            TreeContext.invalidate(self)
         return True
 
     def create_sub_element(self, local_name, index=None, attrib=None,
@@ -1407,6 +1440,8 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         owner_document = super().detach_document()
         for child in self:
             child.detach_document()
+        if owner_document is not None:
+            TreeContext.invalidate(self)
         return owner_document
 
     def extend(self, elements):
@@ -1415,9 +1450,16 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Extends the current children by the elements in the iterable.
         """
         owner_document = self.owner_document
+        elements = list(elements)
         for node in elements:
             node.attach_document(owner_document)
+        for node in elements:
+            TreeContext.invalidate(node)
         super().extend(elements)
+        TreeContext.invalidate(self)
+        index = ElementIndex.of(self)
+        for node in elements:
+            index.insert_subtree(node)
 
     def get_attribute(self, qualified_name):
         """Returns an attribute's value with the specified name.
@@ -1674,6 +1716,9 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         # 'transform', 'transform-box', 'transform-origin',
         # 'vertical-align',
         css_rules = get_css_rules(self)
+        if has_sibling_selectors(css_rules):
+            # the cached styles depend on the attributes of the siblings
+            TreeContext.of(self).has_sibling_selectors = True
         element = self
         while element is not None:
             css_style, css_style_important = get_css_style(element, css_rules)
@@ -1750,6 +1795,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Returns:
             list[Element]: A list of elements.
         """
+        elements = ElementIndex.of(self).get_elements_by_local_name(
+            self, local_name)
+        if elements is not None:
+            return elements
         return self.xpath('.//*[local-name() = $local_name]',
                           namespaces=nsmap,
                           local_name=local_name)
@@ -1830,7 +1879,10 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         Inserts a subelement at the given position in this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().insert(index, element)
+        TreeContext.invalidate(self)
+        ElementIndex.of(self).insert_subtree(element)
 
     def insert_before(self, node, child):
         """Inserts a node into a parent before a child.
@@ -1901,7 +1953,9 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         """
         if element not in self:
             raise ValueError('The object can not be found here')
+        ElementIndex.of(self).remove_subtree(element)
         super().remove(element)
+        TreeContext.invalidate(self)
 
     def remove_attribute(self, qualified_name):
         """Removes an attribute with the specified name.
@@ -1953,7 +2007,12 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         if old_element not in self:
             raise ValueError('The object can not be found here')
         new_element.attach_document(self.owner_document)
+        index = ElementIndex.of(self)
+        index.remove_subtree(old_element)
+        TreeContext.invalidate(new_element)
         super().replace(old_element, new_element)
+        TreeContext.invalidate(self)
+        index.insert_subtree(new_element)
 
     def replace_child(self, node, child):
         """Replaces a child with node.
@@ -1967,6 +2026,21 @@ class Element(etree.ElementBase, Node, ParentNode, NonDocumentTypeChildNode):
         self.replace(child, node)
         return node
 
+    def set(self, key, value):
+        """Reimplemented from lxml.etree.ElementBase.set().
+
+        Sets an element attribute.
+        """
+        if key not in ElementIndex.INDEXED_ATTRIBUTES:
+            super().set(key, value)
+        else:
+            old_value = self.get(key)
+            if key == 'id':
+                TreeContext.touch(self)  # the referrers of the old id
+            super().set(key, value)
+            ElementIndex.of(self).set_attribute(self, key, old_value, value)
+        TreeContext.touch(self)
+
     def set_attribute(self, qualified_name, value):
         """Sets an attribute with the specified name.
 
@@ -2048,7 +2122,7 @@ class ElementCSSInlineStyle(Element):
 
     def _init(self):
         super()._init()
-        self._style = CSSStyleDeclaration(owner_node=self)
+        self._style = None
 
     @property
     def style(self):
@@ -2064,6 +2138,8 @@ class ElementCSSInlineStyle(Element):
             >>> g.attributes['style'].value
             'fill: none; stroke-width: 3; stroke: blue;'
         """
+        if self._style is None:
+            self._style = CSSStyleDeclaration(owner_node=self)
         return self._style
 
 
@@ -2149,7 +2225,9 @@ class ProcessingInstruction(etree.PIBase, CharacterData):
         Adds the element as a following sibling directly after this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addnext(element)
+        TreeContext.invalidate(element)
 
     def addprevious(self, element):
         """Reimplemented from lxml.etree.PIBase.addprevious().
@@ -2157,7 +2235,9 @@ class ProcessingInstruction(etree.PIBase, CharacterData):
         Adds the element as a preceding sibling directly before this element.
         """
         element.attach_document(self.owner_document)
+        TreeContext.invalidate(element)
         super().addprevious(element)
+        TreeContext.invalidate(element)
 
     def append_child(self, node):
         """Adds a node to the end of this node.
@@ -13,6 +13,12 @@
 # limitations under the License.
 
 
+import gzip
+import math
+import mmap
+import os
+import re
+
 from lxml import etree
 
 from .base import HTMLElement, \
@@ -23,13 +29,151 @@ from .base import HTMLElement, \
 from .core import CSSUtils, SVGLength
 from .dom import Attr, Comment, DOMTokenList, Element, LinkStyle, \
     ProcessingInstruction
+from .geometry.rtree import SpatialIndex
 from .path import PathParser, SVGPathSegment
 from .text import SVGTextContentElement, SVGTextPositioningElement
 from .transform import SVGTransform, SVGTransformList
-from .utils import QualifiedName, get_element_by_id, \
+from .utils import QualifiedName, TreeContext, get_element_by_id, \
     get_elements_by_class_name, get_elements_by_tag_name, \
     get_elements_by_tag_name_ns
 
+# The id of a url() reference (e.g., 'url(#clip1)').
+_RE_URL_REFERENCE = re.compile(r'url\(\s*[\'"]?#([^\'")\s]+)')
+
+# The control points of the cubic Bézier curves that approximate the
+# quarters of the unit circle, clockwise from (1, 0) (see
+# PathSegment.normalize()).
+_KAPPA = 4 * (math.sqrt(2) - 1) / 3
+
+_UNIT_CIRCLE_QUARTERS = (
+    (1, _KAPPA, _KAPPA, 1, 0, 1),
+    (-_KAPPA, 1, -1, _KAPPA, -1, 0),
+    (-1, -_KAPPA, -_KAPPA, -1, 0, -1),
+    (_KAPPA, -1, 1, -_KAPPA, 1, 0),
+)
+
+
+def _create_ellipse_path_data(cx, cy, rx, ry, normalize):
+    path_data = [SVGPathSegment('M', cx + rx, cy)]
+    if normalize:
+        path_data.extend(_create_quarter_ellipse(cx, cy, rx, ry, quarter)
+                         for quarter in range(4))
+    else:
+        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx, cy + ry))
+        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx - rx, cy))
+        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx, cy - ry))
+        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx + rx, cy))
+    path_data.append(SVGPathSegment('Z'))
+    return path_data
+
+
+def _create_quarter_ellipse(cx, cy, rx, ry, quarter):
+    x1, y1, x2, y2, x, y = _UNIT_CIRCLE_QUARTERS[quarter]
+    return SVGPathSegment('C',
+                          cx + rx * x1, cy + ry * y1,
+                          cx + rx * x2, cy + ry * y2,
+                          cx + rx * x, cy + ry * y)
+
+
+def _get_computed_geometry(element):
+    return TreeContext.of(element).lookup(
+        element,
+        'computed_geometry',
+        lambda _element: _element.get_computed_geometry(),
+        volatile=True)
+
+
+def _get_instance_bbox(instance_root):
+    # the bounding box of the untransformed path data of a referenced
+    # element, shared by all the <use> elements that reference it
+    def _compute(_element):
+        return PathParser.get_bbox(_get_instance_path_data(_element, True))
+
+    return TreeContext.of(instance_root).lookup(
+        instance_root, 'instance_bbox', _compute, volatile=True,
+        state=_get_instance_state)
+
+
+def _get_instance_path_data(instance_root, normalize):
+    # the untransformed path data of a referenced element, shared by all the
+    # <use> elements that reference it
+    def _compute(_element):
+        settings = SVGPathDataSettings()
+        settings.normalize = normalize
+        return _element.get_path_data(settings)
+
+    return TreeContext.of(instance_root).lookup(
+        instance_root, ('instance_path_data', normalize), _compute,
+        volatile=True, state=_get_instance_state)
+
+
+def _get_instance_state(instance_root):
+    # the attributes of the subtree of a referenced element, and of the
+    # elements that its nested <use> elements refer to
+    state = list()
+    visited = set()
+    pending = [instance_root]
+    while len(pending) > 0:
+        root = pending.pop()
+        state.append(root)
+        if root is None or root in visited:
+            continue
+        visited.add(root)
+        state.extend(tuple(element.attrib.items())
+                     for element in root.iter(etree.Element))
+        pending.extend(use.instance_root for use in _get_nested_uses(root))
+    return tuple(state)
+
+
+def _get_nested_uses(instance_root):
+    # the <use> elements in the subtree of a referenced element
+    return TreeContext.of(instance_root).lookup(
+        instance_root,
+        'nested_uses',
+        lambda _element: [element for element in _element.iter('{*}use')
+                          if isinstance(element, SVGUseElement)])
+
+
+def _get_outline(element, create_path_data, settings):
+    # returns a copy of the path data of a basic shape, which is cached
+    # per element and keyed on the resolved geometry values
+    normalize = False
+    if settings is not None:
+        if not isinstance(settings, SVGPathDataSettings):
+            raise TypeError('Expected SVGPathDataSettings, got {}'.format(
+                type(settings)))
+        normalize = settings.normalize
+    geometry = _get_computed_geometry(element)
+    key = normalize, tuple(
+        tuple(value) if isinstance(value, list) else value
+        for value in geometry.values())
+    outlines = TreeContext.of(element).lookup(
+        element, 'outlines', lambda _element: dict())
+    path_data = outlines.get(key)
+    if path_data is None:
+        if len(outlines) > 1:
+            outlines.clear()
+        path_data = create_path_data(dict(geometry), normalize)
+        outlines[key] = path_data
+    return [SVGPathSegment(path_segment.type, *path_segment.values)
+            for path_segment in path_data]
+
+
+def _is_circular(use):
+    # True if the <use> element references itself directly or indirectly
+    visited = set()
+    stack = [use]
+    while len(stack) > 0:
+        instance_root = stack.pop().instance_root
+        if instance_root is None or instance_root in visited:
+            continue
+        visited.add(instance_root)
+        for nested_use in _get_nested_uses(instance_root):
+            if nested_use is use:
+                return True
+            stack.append(nested_use)
+    return False
+
 
 class HTMLAudioElement(HTMLMediaElement):
     """Represents the [HTML] <audio> element."""
@@ -167,6 +311,18 @@ class SVGAElement(SVGGraphicsElement, SVGURIReference,
 class SVGCircleElement(SVGGeometryElement):
     """Represents the [SVG2] <circle> element."""
 
+    @staticmethod
+    def _create_path_data(geometry, normalize):
+        # 'r' property
+        r = geometry['r']
+        if r <= 0:
+            return []
+
+        # 'cx', 'cy' properties
+        cx = geometry['cx']
+        cy = geometry['cy']
+        return _create_ellipse_path_data(cx, cy, r, r, normalize)
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -212,31 +368,8 @@ class SVGCircleElement(SVGGeometryElement):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        geometry = self.get_computed_geometry()
-        path_data = list()
-
-        # 'r' property
-        r = geometry['r']
-        if r <= 0:
-            return path_data
-
-        # 'cx', 'cy' properties
-        cx = geometry['cx']
-        cy = geometry['cy']
-
-        path_data.append(SVGPathSegment('M', cx + r, cy))
-        path_data.append(SVGPathSegment('A', r, r, 0, 0, 1, cx, cy + r))
-        path_data.append(SVGPathSegment('A', r, r, 0, 0, 1, cx - r, cy))
-        path_data.append(SVGPathSegment('A', r, r, 0, 0, 1, cx, cy - r))
-        path_data.append(SVGPathSegment('A', r, r, 0, 0, 1, cx + r, cy))
-        path_data.append(SVGPathSegment('Z'))
-        if settings is not None:
-            if not isinstance(settings, SVGPathDataSettings):
-                raise TypeError('Expected SVGPathDataSettings, got {}'.format(
-                    type(settings)))
-            if settings.normalize:
-                path_data = PathParser.normalize(path_data)
-        return path_data
+        return _get_outline(self, SVGCircleElement._create_path_data,
+                            settings)
 
 
 class SVGClipPathElement(SVGElement):
@@ -269,6 +402,19 @@ class SVGDescElement(SVGElement):
 class SVGEllipseElement(SVGGeometryElement):
     """Represents the [SVG2] <ellipse> element."""
 
+    @staticmethod
+    def _create_path_data(geometry, normalize):
+        # 'rx', 'ry' properties
+        rx = geometry['rx']
+        ry = geometry['ry']
+        if rx <= 0 or ry <= 0:
+            return []
+
+        # 'cx', 'cy' properties
+        cx = geometry['cx']
+        cy = geometry['cy']
+        return _create_ellipse_path_data(cx, cy, rx, ry, normalize)
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -336,32 +482,8 @@ class SVGEllipseElement(SVGGeometryElement):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        style = self.get_computed_geometry()
-        path_data = list()
-
-        # 'rx', 'ry' properties
-        rx = style['rx']
-        ry = style['ry']
-        if rx <= 0 or ry <= 0:
-            return path_data
-
-        # 'cx', 'cy' properties
-        cx = style['cx']
-        cy = style['cy']
-
-        path_data.append(SVGPathSegment('M', cx + rx, cy))
-        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx, cy + ry))
-        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx - rx, cy))
-        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx, cy - ry))
-        path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, cx + rx, cy))
-        path_data.append(SVGPathSegment('Z'))
-        if settings is not None:
-            if not isinstance(settings, SVGPathDataSettings):
-                raise TypeError('Expected SVGPathDataSettings, got {}'.format(
-                    type(settings)))
-            if settings.normalize:
-                path_data = PathParser.normalize(path_data)
-        return path_data
+        return _get_outline(self, SVGEllipseElement._create_path_data,
+                            settings)
 
 
 class SVGForeignObjectElement(SVGGraphicsElement):
@@ -410,6 +532,19 @@ class SVGLinearGradientElement(SVGGradientElement):
 class SVGLineElement(SVGGeometryElement):
     """Represents the [SVG2] <line> element."""
 
+    @staticmethod
+    def _create_path_data(geometry, normalize):
+        # 'x1', 'y1', 'x2', 'y2' properties
+        x1 = geometry['x1']
+        y1 = geometry['y1']
+        x2 = geometry['x2']
+        y2 = geometry['y2']
+        if (SVGLength(x2 - x1) == SVGLength(0)
+                and SVGLength(y2 - y1) == SVGLength(0)):
+            return []
+
+        return [SVGPathSegment('M', x1, y1), SVGPathSegment('L', x2, y2)]
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -451,21 +586,7 @@ class SVGLineElement(SVGGeometryElement):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        geometry = self.get_computed_geometry()
-        path_data = list()
-
-        # 'x1', 'y1', 'x2', 'y2' properties
-        x1 = geometry['x1']
-        y1 = geometry['y1']
-        x2 = geometry['x2']
-        y2 = geometry['y2']
-        if (SVGLength(x2 - x1) == SVGLength(0)
-                and SVGLength(y2 - y1) == SVGLength(0)):
-            return path_data
-
-        path_data.append(SVGPathSegment('M', x1, y1))
-        path_data.append(SVGPathSegment('L', x2, y2))
-        return path_data
+        return _get_outline(self, SVGLineElement._create_path_data, settings)
 
 
 class SVGMarkerElement(SVGGraphicsElement):
@@ -564,6 +685,22 @@ class SVGPatternElement(SVGGraphicsElement, SVGFitToViewBox, SVGURIReference):
 class SVGPolygonElement(SVGGeometryElement, SVGAnimatedPoints):
     """Represents the [SVG2] <polygon> element."""
 
+    @staticmethod
+    def _create_path_data(geometry, normalize):
+        path_data = list()
+
+        points = list(geometry['points'])
+        if len(points) == 0:
+            return path_data
+
+        x, y = points.pop(0)
+        path_data.append(SVGPathSegment('M', x, y))
+        if len(points) > 0:
+            for x, y in iter(points):
+                path_data.append(SVGPathSegment('L', x, y))
+            path_data.append(SVGPathSegment('Z'))
+        return path_data
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -582,10 +719,18 @@ class SVGPolygonElement(SVGGeometryElement, SVGAnimatedPoints):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        geometry = self.get_computed_geometry()
+        return _get_outline(self, SVGPolygonElement._create_path_data,
+                            settings)
+
+
+class SVGPolylineElement(SVGGeometryElement, SVGAnimatedPoints):
+    """Represents the [SVG2] <polyline> element."""
+
+    @staticmethod
+    def _create_path_data(geometry, normalize):
         path_data = list()
 
-        points = geometry['points']
+        points = list(geometry['points'])
         if len(points) == 0:
             return path_data
 
@@ -594,13 +739,8 @@ class SVGPolygonElement(SVGGeometryElement, SVGAnimatedPoints):
         if len(points) > 0:
             for x, y in iter(points):
                 path_data.append(SVGPathSegment('L', x, y))
-            path_data.append(SVGPathSegment('Z'))
         return path_data
 
-
-class SVGPolylineElement(SVGGeometryElement, SVGAnimatedPoints):
-    """Represents the [SVG2] <polyline> element."""
-
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -619,19 +759,8 @@ class SVGPolylineElement(SVGGeometryElement, SVGAnimatedPoints):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        geometry = self.get_computed_geometry()
-        path_data = list()
-
-        points = geometry['points']
-        if len(points) == 0:
-            return path_data
-
-        x, y = points.pop(0)
-        path_data.append(SVGPathSegment('M', x, y))
-        if len(points) > 0:
-            for x, y in iter(points):
-                path_data.append(SVGPathSegment('L', x, y))
-        return path_data
+        return _get_outline(self, SVGPolylineElement._create_path_data,
+                            settings)
 
 
 class SVGRadialGradientElement(SVGGradientElement):
@@ -642,6 +771,67 @@ class SVGRadialGradientElement(SVGGradientElement):
 class SVGRectElement(SVGGeometryElement):
     """Represents the [SVG2] <rect> element."""
 
+    @staticmethod
+    def _create_path_data(geometry, normalize):
+        path_data = list()
+
+        w = geometry['width']
+        h = geometry['height']
+        if w <= 0 or h <= 0:
+            return path_data
+
+        x = geometry['x']
+        y = geometry['y']
+        square_corners = False
+        rx = geometry['rx']
+        ry = geometry['ry']
+        if rx <= 0 or ry <= 0:
+            square_corners = True
+            rx = 0
+            ry = 0
+
+        if normalize:
+            # the corners are the quarters of the ellipses
+            path_data.append(SVGPathSegment('M', x + rx, y))
+            path_data.append(SVGPathSegment('L', x + w - rx, y))
+            if not square_corners:
+                path_data.append(_create_quarter_ellipse(
+                    x + w - rx, y + ry, rx, ry, 3))
+            path_data.append(SVGPathSegment('L', x + w, y + h - ry))
+            if not square_corners:
+                path_data.append(_create_quarter_ellipse(
+                    x + w - rx, y + h - ry, rx, ry, 0))
+            path_data.append(SVGPathSegment('L', x + rx, y + h))
+            if not square_corners:
+                path_data.append(_create_quarter_ellipse(
+                    x + rx, y + h - ry, rx, ry, 1))
+            path_data.append(SVGPathSegment('L', x, y + ry))
+            if not square_corners:
+                path_data.append(_create_quarter_ellipse(
+                    x + rx, y + ry, rx, ry, 2))
+            path_data.append(SVGPathSegment('Z'))
+            return path_data
+
+        path_data.append(SVGPathSegment('M', x + rx, y))
+        path_data.append(SVGPathSegment('H', x + w - rx))
+        if not square_corners:
+            path_data.append(SVGPathSegment('A',
+                                            rx, ry, 0, 0, 1, x + w, y + ry))
+        path_data.append(SVGPathSegment('V', y + h - ry))
+        if not square_corners:
+            path_data.append(SVGPathSegment(
+                'A',
+                rx, ry, 0, 0, 1, x + w - rx, y + h))
+        path_data.append(SVGPathSegment('H', x + rx))
+        if not square_corners:
+            path_data.append(SVGPathSegment('A',
+                                            rx, ry, 0, 0, 1, x, y + h - ry))
+        path_data.append(SVGPathSegment('V', y + ry))
+        if not square_corners:
+            path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, x + rx, y))
+        path_data.append(SVGPathSegment('Z'))
+        return path_data
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -746,49 +936,7 @@ class SVGRectElement(SVGGeometryElement):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        geometry = self.get_computed_geometry()
-        path_data = list()
-
-        w = geometry['width']
-        h = geometry['height']
-        if w <= 0 or h <= 0:
-            return path_data
-
-        x = geometry['x']
-        y = geometry['y']
-        square_corners = False
-        rx = geometry['rx']
-        ry = geometry['ry']
-        if rx <= 0 or ry <= 0:
-            square_corners = True
-            rx = 0
-            ry = 0
-
-        path_data.append(SVGPathSegment('M', x + rx, y))
-        path_data.append(SVGPathSegment('H', x + w - rx))
-        if not square_corners:
-            path_data.append(SVGPathSegment('A',
-                                            rx, ry, 0, 0, 1, x + w, y + ry))
-        path_data.append(SVGPathSegment('V', y + h - ry))
-        if not square_corners:
-            path_data.append(SVGPathSegment(
-                'A',
-                rx, ry, 0, 0, 1, x + w - rx, y + h))
-        path_data.append(SVGPathSegment('H', x + rx))
-        if not square_corners:
-            path_data.append(SVGPathSegment('A',
-                                            rx, ry, 0, 0, 1, x, y + h - ry))
-        path_data.append(SVGPathSegment('V', y + ry))
-        if not square_corners:
-            path_data.append(SVGPathSegment('A', rx, ry, 0, 0, 1, x + rx, y))
-        path_data.append(SVGPathSegment('Z'))
-        if settings is not None:
-            if not isinstance(settings, SVGPathDataSettings):
-                raise TypeError('Expected SVGPathDataSettings, got {}'.format(
-                    type(settings)))
-            if settings.normalize:
-                path_data = PathParser.normalize(path_data)
-        return path_data
+        return _get_outline(self, SVGRectElement._create_path_data, settings)
 
 
 class SVGScriptElement(SVGElement, SVGURIReference):
@@ -856,6 +1004,7 @@ class SVGSVGElement(SVGGraphicsElement, SVGFitToViewBox, SVGZoomAndPan):
         if farthest is not None and hash(farthest) != hash(self):
             return
         self._current_scale = scale
+        TreeContext.touch(self)
 
     @property
     def current_translate(self):
@@ -872,6 +1021,72 @@ class SVGSVGElement(SVGGraphicsElement, SVGFitToViewBox, SVGZoomAndPan):
         if farthest is not None and hash(farthest) != hash(self):
             return
         self._current_translate = translate
+        TreeContext.touch(self)
+
+    def _get_graphics_elements(self, elements, reference_element):
+        return [element for element in elements
+                if not element.iscontainer()
+                and (reference_element is None
+                     or reference_element in element.iterancestors())]
+
+    def _get_query_rect(self, rect):
+        # transforms the rectangle in the user space into the coordinate
+        # system of the spatial index
+        matrix = self.get_screen_ctm()
+        x1, y1 = rect.x, rect.y
+        x2, y2 = x1 + rect.width, y1 + rect.height
+        points = [matrix.transform_point(x, y)
+                  for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))]
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        x, y = min(xs), min(ys)
+        return x, y, max(xs) - x, max(ys) - y
+
+    def check_enclosure(self, element, rect):
+        """Returns True if the bounding box of the element is entirely within
+        the rectangle.
+        The bounding boxes are read from the spatial index (see
+        SVGSVGElement.get_spatial_index()).
+
+        Arguments:
+            element (SVGGraphicsElement): A rendered element of the current
+                'svg' element.
+            rect (DOMRectReadOnly): The rectangle in the user space of the
+                current 'svg' element.
+        Returns:
+            bool: True if the element is enclosed, otherwise False.
+        """
+        bbox = self.get_spatial_index().get_bbox(element)
+        if bbox is None or bbox.x is None:
+            return False
+        x, y, width, height = self._get_query_rect(rect)
+        return (x <= bbox.x
+                and y <= bbox.y
+                and bbox.x + bbox.width <= x + width
+                and bbox.y + bbox.height <= y + height)
+
+    def check_intersection(self, element, rect):
+        """Returns True if the bounding box of the element intersects the
+        rectangle.
+        The bounding boxes are read from the spatial index (see
+        SVGSVGElement.get_spatial_index()).
+
+        Arguments:
+            element (SVGGraphicsElement): A rendered element of the current
+                'svg' element.
+            rect (DOMRectReadOnly): The rectangle in the user space of the
+                current 'svg' element.
+        Returns:
+            bool: True if the element intersects, otherwise False.
+        """
+        bbox = self.get_spatial_index().get_bbox(element)
+        if bbox is None or bbox.x is None:
+            return False
+        x, y, width, height = self._get_query_rect(rect)
+        return (bbox.x <= x + width
+                and x <= bbox.x + bbox.width
+                and bbox.y <= y + height
+                and y <= bbox.y + bbox.height)
 
     def get_computed_geometry(self):
         geometry = dict()
@@ -948,6 +1163,42 @@ class SVGSVGElement(SVGGraphicsElement, SVGFitToViewBox, SVGZoomAndPan):
                                            nsmap=nsmap,
                                            include_self=True)
 
+    def get_enclosure_list(self, rect, reference_element=None):
+        """Returns the graphics elements whose bounding boxes are entirely
+        within the rectangle.
+        The elements are found by the spatial index (see
+        SVGSVGElement.get_spatial_index()).
+
+        Arguments:
+            rect (DOMRectReadOnly): The rectangle in the user space of the
+                current 'svg' element.
+            reference_element (Element, optional): If not None, only the
+                descendants of the reference element are returned.
+        Returns:
+            list[SVGGraphicsElement]: The elements in document order.
+        """
+        elements = self.get_spatial_index().search(
+            *self._get_query_rect(rect), enclosed=True)
+        return self._get_graphics_elements(elements, reference_element)
+
+    def get_intersection_list(self, rect, reference_element=None):
+        """Returns the graphics elements whose bounding boxes intersect the
+        rectangle.
+        The elements are found by the spatial index (see
+        SVGSVGElement.get_spatial_index()).
+
+        Arguments:
+            rect (DOMRectReadOnly): The rectangle in the user space of the
+                current 'svg' element.
+            reference_element (Element, optional): If not None, only the
+                descendants of the reference element are returned.
+        Returns:
+            list[SVGGraphicsElement]: The elements in document order.
+        """
+        elements = self.get_spatial_index().search(
+            *self._get_query_rect(rect))
+        return self._get_graphics_elements(elements, reference_element)
+
     def get_path_data(self, settings=None):
         """Returns a list of path segments that corresponds to the path data.
 
@@ -960,6 +1211,25 @@ class SVGSVGElement(SVGGraphicsElement, SVGFitToViewBox, SVGZoomAndPan):
         """
         return self.get_descendant_path_data(settings)
 
+    def get_spatial_index(self):
+        """Returns the spatial index of the rendered elements of the current
+        'svg' element.
+        The index is built on the first call, and is cached until the tree
+        is modified structurally.
+
+        Returns:
+            SpatialIndex: The spatial index.
+
+        Examples:
+            >>> index = root.get_spatial_index()
+            >>> index.search(0, 0, 100, 100)  # intersect a rectangle
+            [<Element {http://www.w3.org/2000/svg}svg at 0x...>, ...]
+            >>> index.search_point(50, 50)  # contain a point
+            [<Element {http://www.w3.org/2000/svg}svg at 0x...>, ...]
+        """
+        return TreeContext.of(self).lookup(self, 'spatial_index',
+                                           SpatialIndex)
+
 
 class SVGSwitchElement(SVGGraphicsElement):
     # TODO: implement the SVGSwitchElement.
@@ -1035,6 +1305,7 @@ class SVGUseElement(SVGGraphicsElement, SVGURIReference):
 
     @property
     def instance_root(self):
+        """Element: The element referenced by 'href', or None."""
         href = self.href
         if href is None or len(href) == 0:
             return None
@@ -1045,6 +1316,71 @@ class SVGUseElement(SVGGraphicsElement, SVGURIReference):
         element = root.get_element_by_id(href[1:])
         return element
 
+    def _compute_instance_matrix(self, transformed=False):
+        root = self.instance_root
+        transform_list = self.transform
+        if transform_list is None:
+            transform_list = SVGTransformList()
+
+        geometry = self.get_computed_geometry()
+        x = geometry['x']
+        y = geometry['y']
+        if x != 0 or y != 0:
+            transform = SVGTransform()
+            transform.set_translate(x, y)
+            transform_list.append(transform)
+        if root.local_name in ['svg', 'symbol']:
+            # TODO: test 'width' and 'height' properties on the 'use' element.
+            width = geometry['width']
+            height = geometry['height']
+            if width > 0 or height > 0:
+                bbox = _get_instance_bbox(root)
+                sx = width / bbox.width
+                if sx == 0:
+                    sx = 1
+                sy = height / bbox.height
+                if sy == 0:
+                    sy = 1
+                transform = SVGTransform()
+                transform.set_scale(sx, sy)
+                transform_list.append(transform)
+        if transformed:
+            root_transform_list = root.transform
+            if root_transform_list is not None:
+                transform_list.extend(root_transform_list)
+        if len(transform_list) == 0:
+            return None
+        return transform_list.matrix
+
+    def _get_instance(self, settings, transformed=False):
+        # returns the path data of the referenced element, which is shared by
+        # all the instances, and the transformation matrix of this instance.
+        # if transformed is True, the matrix also includes the 'transform'
+        # attribute of the referenced element
+        normalize = False
+        if settings is not None:
+            if not isinstance(settings, SVGPathDataSettings):
+                raise TypeError('Expected SVGPathDataSettings, got {}'.format(
+                    type(settings)))
+            normalize = settings.normalize
+        root = self.instance_root
+        if (root is None or not isinstance(root, SVGGraphicsElement)
+                or _is_circular(self)):
+            return [], None
+        path_data = _get_instance_path_data(root, normalize)
+        if len(path_data) == 0:
+            return path_data, None
+        matrix = TreeContext.of(self).lookup(
+            self,
+            ('instance_matrix', transformed),
+            lambda _element: _element._compute_instance_matrix(transformed),
+            volatile=True,
+            state=lambda _element: _element._get_reference_state())
+        return path_data, matrix
+
+    def _get_reference_state(self):
+        return _get_instance_state(self.instance_root)
+
     def get_computed_geometry(self):
         geometry = dict()
 
@@ -1092,41 +1428,20 @@ class SVGUseElement(SVGGraphicsElement, SVGURIReference):
         Returns:
             list[SVGPathSegment]: A list of path segments.
         """
-        root = self.instance_root
-        if root is None or not isinstance(root, SVGGraphicsElement):
+        path_data, matrix = self._get_instance(settings)
+        if matrix is not None:
+            return PathParser.transform(path_data, matrix)
+        return [SVGPathSegment(path_segment.type, *path_segment.values)
+                for path_segment in path_data]
+
+    def get_transformed_path_data(self, settings=None):
+        path_data, matrix = self._get_instance(settings, transformed=True)
+        if len(path_data) == 0:
             return []
-        path_data = root.get_path_data(settings)
-
-        transform_list = self.transform
-        if transform_list is None:
-            transform_list = SVGTransformList()
-
-        geometry = self.get_computed_geometry()
-        x = geometry['x']
-        y = geometry['y']
-        if x != 0 or y != 0:
-            transform = SVGTransform()
-            transform.set_translate(x, y)
-            transform_list.append(transform)
-        if root.local_name in ['svg', 'symbol']:
-            # TODO: test 'width' and 'height' properties on the 'use' element.
-            width = geometry['width']
-            height = geometry['height']
-            if width > 0 or height > 0:
-                bbox = PathParser.get_bbox(path_data)
-                sx = width / bbox.width
-                if sx == 0:
-                    sx = 1
-                sy = height / bbox.height
-                if sy == 0:
-                    sy = 1
-                transform = SVGTransform()
-                transform.set_scale(sx, sy)
-                transform_list.append(transform)
-        if len(transform_list) > 0:
-            matrix = transform_list.matrix
-            path_data = PathParser.transform(path_data, matrix)
-        return path_data
+        if matrix is not None:
+            return PathParser.transform(path_data, matrix)
+        return [SVGPathSegment(path_segment.type, *path_segment.values)
+                for path_segment in path_data]
 
 
 class SVGViewElement(SVGGraphicsElement, SVGFitToViewBox, SVGZoomAndPan):
@@ -1199,6 +1514,17 @@ class SVGElementClassLookup(etree.CustomElementClassLookup):
 
 
 class SVGParser(object):
+    _GZIP_MAGIC = b'\x1f\x8b'
+
+    _ITERPARSE_KEPT_ELEMENTS = (
+        'clipPath', 'defs', 'link', 'linearGradient', 'marker', 'mask',
+        'pattern', 'radialGradient', 'style', 'symbol')
+
+    _ITERPARSE_TEXT_PARENTS = (Element.TEXT_CONTENT_ELEMENTS
+                               + Element.TEXT_CONTENT_CHILD_ELEMENTS)
+
+    _XLINK_HREF = '{{{}}}href'.format(Element.XLINK_NAMESPACE_URI)
+
     def __init__(self, **kwargs):
         """Constructs an SVGParser object.
 
@@ -1207,6 +1533,7 @@ class SVGParser(object):
         """
         self._parser = etree.XMLParser(**kwargs)
         self._parser.set_element_class_lookup(SVGElementClassLookup())
+        self._parser_options = kwargs
         etree.set_default_parser(self._parser)
 
     @property
@@ -1339,6 +1666,26 @@ class SVGParser(object):
         pi = etree.ProcessingInstruction(target, data)
         return pi
 
+    def create_pull_parser(self, events=('end',), encoding=None):
+        """Creates a new feed parser with the same options as this parser,
+        and returns it.
+        See also SVGParser.iterfeed().
+
+        Arguments:
+            events (tuple[str, ...], optional): The events to be reported.
+                See lxml.etree.XMLPullParser.__init__().
+            encoding (str, optional): Overrides the document encoding.
+        Returns:
+            lxml.etree.XMLPullParser: A feed parser that creates the svgpy
+                elements.
+        """
+        options = dict(self._parser_options)
+        if encoding is not None:
+            options['encoding'] = encoding
+        parser = etree.XMLPullParser(events=events, **options)
+        parser.set_element_class_lookup(SVGElementClassLookup())
+        return parser
+
     def fromstring(self, text):
         """Parses an SVG document or fragment from a string, and returns the
         root node.
@@ -1351,14 +1698,211 @@ class SVGParser(object):
         root = etree.fromstring(text, parser=self._parser)
         return root
 
-    def parse(self, source):
+    def iterfeed(self, chunks, events=('end',), encoding=None):
+        """Parses the chunks of an SVG document as they arrive, and yields the
+        parser events and the elements.
+
+        Arguments:
+            chunks (iterable[bytes]): The content of an SVG document.
+            events (tuple[str, ...], optional): The events to be reported.
+                See lxml.etree.XMLPullParser.__init__().
+            encoding (str, optional): Overrides the document encoding.
+        Returns:
+            iterator[tuple[str, Element]]: An iterator of the event and the
+                element.
+        Examples:
+            >>> from svgpy import SVGParser
+            >>> from svgpy.utils import load_chunks
+            >>> parser = SVGParser()
+            >>> chunks, _ = load_chunks('https://example.com/sample.svg')
+            >>> for event, element in parser.iterfeed(chunks):
+            ...     print(event, element.local_name)
+        """
+        parser = self.create_pull_parser(events=events, encoding=encoding)
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event in parser.read_events():
+                yield event
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    def iterparse(self, source, events=('end',), tags=None, **kwargs):
+        """Parses the source incrementally, and yields the parser events and
+        the elements.
+
+        The ancestors of the current element are kept, so that its computed
+        style, geometry and CTM are available. After an element is ended,
+        the preceding siblings that have already been processed are
+        released, except the elements that can be referenced by the other
+        elements (e.g., <defs>, <style>, <symbol> and the elements whose id
+        is referred to by an 'href' attribute or a url() reference), the
+        elements that contain them and the children of the text content
+        elements. An element must be processed before the next event of its
+        parent.
+        If the source can be read twice (a filename or a seekable file
+        object), the references are collected by a first pass over the
+        source. Otherwise, only the elements that are referred to by the
+        preceding elements are kept.
+        The parser options of the SVGParser object are also applied.
+
+        Arguments:
+            source (file, str, os.PathLike): A filename or a file object of
+                an SVG document. A gzip-compressed file (e.g., '.svgz') is
+                decompressed as it is parsed.
+            events (tuple[str, ...], optional): The events to be reported.
+                See lxml.etree.iterparse().
+            tags (list[str], optional): If specified, reports only the
+                elements that match any of the tags. A tag is a local name
+                or '{namespace}local-name', and the namespace and the local
+                name can be '*'.
+            **kwargs: See lxml.etree.iterparse(). Overrides the parser
+                options.
+        Returns:
+            iterator[tuple[str, Element]]: An iterator of the event and the
+                element.
+        Examples:
+            >>> from svgpy import SVGParser
+            >>> parser = SVGParser()
+            >>> for _, element in parser.iterparse('large.svg', tags=['path']):
+            ...     bbox = element.get_bbox()
+        """
+        if tags is not None:
+            tags = [QualifiedName(None, tag) for tag in tags]
+        fp = None
+        if SVGParser._is_gzip_file(source):
+            source = fp = gzip.open(source, 'rb')
+        options = dict(self._parser_options)
+        options.update(kwargs)
+        try:
+            references = SVGParser._collect_references(source, options)
+            collect = references is None
+            if collect:
+                references = set()
+            # the elements that are or contain a referable element
+            kept = set()
+            context = etree.iterparse(source,
+                                      events=tuple(set(events) | {'end'}),
+                                      **options)
+            context.set_element_class_lookup(SVGElementClassLookup())
+            for event, element in context:
+                if (event in events
+                        and (tags is None
+                             or (isinstance(element, Element)
+                                 and SVGParser._match_tags(element, tags)))):
+                    yield event, element
+                if event != 'end':
+                    continue
+                if collect:
+                    SVGParser._add_references(element, references)
+                parent = element.getparent()
+                if parent is None:
+                    continue
+                if (element in kept
+                        or SVGParser._is_referable(element, references)):
+                    kept.add(element)
+                    kept.add(parent)
+                if parent.local_name in SVGParser._ITERPARSE_TEXT_PARENTS:
+                    continue
+                # the siblings before the previous one are already released
+                previous = element.getprevious()
+                if previous is not None and previous not in kept:
+                    TreeContext.release(previous)
+                    etree.ElementBase.remove(parent, previous)
+        finally:
+            if fp is not None:
+                fp.close()
+
+    @staticmethod
+    def _add_references(element, references):
+        # adds the ids that are referred to by the element
+        href = element.get('href') or element.get(SVGParser._XLINK_HREF)
+        if href is not None and href.startswith('#'):
+            references.add(href[1:])
+        for value in element.attrib.values():
+            if 'url(' in value:
+                references.update(_RE_URL_REFERENCE.findall(value))
+        if element.text is not None and 'url(' in element.text:
+            references.update(_RE_URL_REFERENCE.findall(element.text))
+
+    @staticmethod
+    def _collect_references(source, options):
+        # the ids that are referred to by the elements of the source, or None
+        # if the source cannot be read twice
+        if isinstance(source, (str, os.PathLike)):
+            position = None
+        elif hasattr(source, 'seekable') and source.seekable():
+            position = source.tell()
+        else:
+            return None
+        references = set()
+        try:
+            for _, element in etree.iterparse(source, events=('end',),
+                                              **options):
+                SVGParser._add_references(element, references)
+                element.clear(keep_tail=True)
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+        finally:
+            if position is not None:
+                source.seek(position)
+        return references
+
+    @staticmethod
+    def _is_referable(element, references):
+        # whether the element can be referenced by the other elements
+        if not isinstance(element, Element):
+            return False
+        return (element.local_name in SVGParser._ITERPARSE_KEPT_ELEMENTS
+                or element.get('id') in references)
+
+    @staticmethod
+    def _match_tags(element, tags):
+        qname = element.qname
+        for tag in tags:
+            if (tag.local_name in ('*', qname.localname)
+                    and tag.namespace_uri in (None, '*', qname.namespace)):
+                return True
+        return False
+
+    @staticmethod
+    def _is_gzip_file(source):
+        if (not isinstance(source, (str, os.PathLike))
+                or not os.path.isfile(source)):
+            return False
+        with open(source, 'rb') as fp:
+            return fp.read(2) == SVGParser._GZIP_MAGIC
+
+    def parse(self, source, use_mmap=False):
         """Parses the source into an ElementTree object, and returns it.
         To parse from a string, use the fromstring() method instead.
+        A gzip-compressed file (e.g., '.svgz') is decompressed as it is
+        parsed.
 
         Arguments:
-            source (file, str): A filename or a file object of an SVG document.
+            source (file, str, os.PathLike): A filename or a file object of an
+                SVG document.
+            use_mmap (bool, optional): If True and the source is an
+                uncompressed file, maps the file into memory and parses the
+                mapped buffer without reading it into a Python object.
+                Use with SVGParser(huge_tree=True) for very large documents.
         Returns:
             lxml.etree._ElementTree: An ElementTree object.
         """
+        if SVGParser._is_gzip_file(source):
+            base_url = os.fspath(source)
+            with gzip.open(source, 'rb') as fp:
+                tree = etree.parse(fp, parser=self._parser, base_url=base_url)
+            return tree
+        elif use_mmap and isinstance(source, (str, os.PathLike)):
+            base_url = os.fspath(source)
+            with open(source, 'rb') as fp, \
+                    mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                root = etree.fromstring(buf,
+                                        parser=self._parser,
+                                        base_url=base_url)
+            return root.getroottree()
         tree = etree.parse(source, parser=self._parser)
         return tree
@@ -15,6 +15,7 @@
 
 import copy
 import math
+import threading
 
 import numpy as np
 
@@ -163,9 +164,11 @@ class FTCharMap(object):
 class FTFace(object):
     """Represents the 'FT_Face' data type."""
 
-    def __init__(self, ft_face, reference=False, _memory_base=None):
+    def __init__(self, ft_face, reference=False, _memory_base=None,
+                 _library=None):
         self._face = ft_face
         self._memory_base = _memory_base  # keep a reference
+        self._library = _library  # keep a reference
         if reference:
             self.reference_face()
 
@@ -362,13 +365,14 @@ class FTFace(object):
     @staticmethod
     def new_face(filename, index=0):
         face = ffi.new('FT_Face *')
-        error = lib.FT_New_Face(FreeType.library.ft_library,
+        library = FreeType.get_library()
+        error = lib.FT_New_Face(library.ft_library,
                                 filename.encode(),
                                 index,
                                 face)
         if error:
             raise RuntimeError('FT_New_Face() failed: ' + hex(error))
-        return FTFace(face[0])
+        return FTFace(face[0], _library=library)
 
     @staticmethod
     def new_memory_face(file_base, file_size=0, face_index=0):
@@ -376,14 +380,15 @@ class FTFace(object):
         if file_size <= 0:
             file_size = len(file_base)
         face = ffi.new('FT_Face *')
-        error = lib.FT_New_Memory_Face(FreeType.library.ft_library,
+        library = FreeType.get_library()
+        error = lib.FT_New_Memory_Face(library.ft_library,
                                        memory_base,
                                        file_size,
                                        face_index,
                                        face)
         if error:
             raise RuntimeError('FT_New_Memory_Face() failed: ' + hex(error))
-        return FTFace(face[0], _memory_base=memory_base)
+        return FTFace(face[0], _memory_base=memory_base, _library=library)
 
     def reference_face(self):
         error = lib.FT_Reference_Face(self._face)
@@ -735,6 +740,29 @@ class FreeType(object):
 
     library = FTLibrary()
 
+    @staticmethod
+    def get_library():
+        """Returns the FreeType library object of the current thread.
+        The main thread uses FreeType.library, and each of the other threads
+        creates its own library object.
+        A face belongs to the library of the thread that created it, and
+        must not be used by several threads at the same time.
+
+        Returns:
+            FTLibrary: A FTLibrary object.
+        """
+        library = getattr(_thread_context, 'library', None)
+        if library is None:
+            if threading.current_thread() is threading.main_thread():
+                library = FreeType.library
+            else:
+                library = FTLibrary()
+            _thread_context.library = library
+        return library
+
+
+_thread_context = threading.local()
+
 
 class FTOutline(object):
     """Represents the 'FT_Outline' data type."""
@@ -0,0 +1,253 @@
+# Copyright (C) 2018 Tetsuya Miura <miute.dev@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+
+import numpy as np
+
+from .rect import DOMRect
+from ..base import SVGGeometryElement, SVGGraphicsElement, \
+    SVGPathDataSettings
+from ..dom import Element
+from ..path import PathParser
+from ..style import shared_styles
+
+FIELDS = ('id', 'tag', 'ctm', 'bbox', 'length')
+
+# the fields that are extracted only on request
+OPTIONAL_FIELDS = ('path',)
+
+_NAN_BBOX = (math.nan, math.nan, math.nan, math.nan)
+
+
+def _check_fields(fields):
+    if fields is None:
+        return FIELDS
+    elif isinstance(fields, str):
+        fields = (fields,)
+    for field in fields:
+        if field not in FIELDS and field not in OPTIONAL_FIELDS:
+            raise ValueError('Unknown field: ' + repr(field))
+    return tuple(fields)
+
+
+def _create_record(element, ctm, fields):
+    record = dict()
+    if 'id' in fields:
+        record['id'] = element.id
+    if 'tag' in fields:
+        record['tag'] = element.local_name
+    if 'ctm' in fields:
+        record['ctm'] = tuple(
+            float(x) for x in (ctm.a, ctm.b, ctm.c, ctm.d, ctm.e, ctm.f))
+    return record
+
+
+def _get_leaf_geometry(element, ctm, parent_ctm, fields):
+    bbox = DOMRect()
+    path_data = list()
+    length = math.nan
+    has_path = 'bbox' in fields or 'path' in fields
+    matrix = ctm
+    if element.local_name == 'use':
+        if has_path:
+            # the instance is also placed by the 'x' and 'y' attributes of
+            # the use element and the transform of the referenced element
+            settings = SVGPathDataSettings()
+            settings.normalize = True
+            path_data = element.get_transformed_path_data(settings)
+            matrix = parent_ctm
+    elif 'length' in fields and isinstance(element, SVGGeometryElement):
+        # measures the path data before it is normalized, as
+        # SVGGeometryElement.get_total_length() does
+        path_data = element.get_path_data()
+        if len(path_data) > 0:
+            length = PathParser.get_total_length(path_data)
+            if has_path:
+                path_data = PathParser.normalize(path_data)
+        else:
+            length = 0
+    elif has_path:
+        settings = SVGPathDataSettings()
+        settings.normalize = True
+        path_data = element.get_path_data(settings)
+    if not has_path:
+        path_data = list()
+    elif len(path_data) > 0:
+        path_data = PathParser.transform(path_data, matrix)
+        if 'bbox' in fields:
+            bbox = PathParser.get_bbox(path_data)
+    return bbox, length, path_data
+
+
+def _iter_records(root, fields, records=None, elements=None):
+    # walks the rendered elements without recursion, and yields a record
+    # when its subtree is done
+    if not isrendered(root):
+        return
+    parent = root.getparent()
+    parent_ctm = (parent.get_screen_ctm()
+                  if isinstance(parent, SVGGraphicsElement)
+                  else root.get_screen_ctm())
+    # the style sheets and the cascaded styles are shared by the whole
+    # traversal, but the context is not left active between the records
+    styles = dict()
+    stack = list()
+    element = root
+    while True:
+        if element is not None:
+            ctm = element.get_screen_ctm()
+            record = _create_record(element, ctm, fields)
+            if records is not None:
+                records.append(record)
+            if elements is not None:
+                elements.append(element)
+            stack.append((element, ctm, record, DOMRect(), iter(element)))
+            element = None
+        element_, ctm, record, bbox, children = stack[-1]
+        if element_.iscontainer():
+            element = next((child for child in children
+                            if isrendered(child)), None)
+            if element is not None:
+                continue
+            length = math.nan
+            path_data = list()
+        else:
+            with shared_styles(styles):
+                bbox, length, path_data = _get_leaf_geometry(
+                    element_, ctm,
+                    stack[-2][1] if len(stack) > 1 else parent_ctm,
+                    fields)
+        stack.pop()
+        if 'bbox' in fields:
+            record['bbox'] = (
+                _NAN_BBOX if bbox.x is None
+                else tuple(float(x) for x in (bbox.x, bbox.y, bbox.width,
+                                              bbox.height)))
+            if len(stack) > 0:
+                stack[-1][3].unite_self(bbox.x, bbox.y, bbox.width,
+                                        bbox.height)
+        if 'length' in fields:
+            record['length'] = float(length)
+        if 'path' in fields:
+            record['path'] = path_data
+        yield record
+        if len(stack) == 0:
+            break
+
+
+def extract(root, fields=None, stream=False):
+    """Extracts the geometry of all the rendered elements of a subtree in one
+    traversal.
+    The screen CTMs are read from the cache that is shared with
+    SVGGraphicsElement.get_screen_ctm() (see svgpy.compute_ctms()), the
+    path data of each element is computed once for all the fields, and the
+    style sheets and the cascaded styles are shared by all the elements (see
+    svgpy.style.shared_styles()). The tree must not be modified while the
+    records are streamed.
+
+    The fields are:
+        'id': The element ID ('' if the element has no ID).
+        'tag': The local name of the element.
+        'ctm': The screen CTM as a tuple of (a, b, c, d, e, f).
+        'bbox': The bounding box in the coordinate system of the outermost
+            SVG viewport as a tuple of (x, y, width, height). A container's
+            bounding box is the union of its children's. NaN if empty.
+        'length': The total length of a shape in user units (see
+            SVGGeometryElement.get_total_length()). NaN for other elements.
+
+    The optional fields, which are extracted only if they are requested,
+    are:
+        'path': The normalized path data in the coordinate system of the
+            outermost SVG viewport as a list of SVGPathSegment. Empty for
+            the containers.
+
+    Arguments:
+        root (SVGGraphicsElement): The root element of the subtree.
+        fields (list[str], optional): The fields to be extracted. Defaults
+            to all the fields.
+        stream (bool, optional): If True, returns an iterator of the
+            records, otherwise returns the columns.
+    Returns:
+        dict[str, numpy.ndarray] | iterator[dict[str, object]]: The columns
+            keyed by the field name, whose rows are in document order.
+            'ctm' is an array of shape (n, 6), 'bbox' is an array of
+            shape (n, 4) and 'path' is a list. In streaming mode, yields a
+            record for each element; a container is yielded after its
+            descendants.
+
+    Examples:
+        >>> from svgpy.geometry.extraction import extract
+        >>> columns = extract(root, fields=['id', 'bbox'])
+        >>> columns['bbox'][:, 2]  # the widths
+        array([200., 100.,  50.])
+    """
+    fields = _check_fields(fields)
+    if stream:
+        return _iter_records(root, fields)
+    records = list()
+    for _ in _iter_records(root, fields, records):
+        pass
+    columns = dict()
+    for field in fields:
+        values = [record[field] for record in records]
+        if field in ('id', 'tag'):
+            columns[field] = np.array(values, dtype=str)
+        elif field == 'ctm':
+            columns[field] = np.array(values, dtype=np.float64).reshape(-1, 6)
+        elif field == 'bbox':
+            columns[field] = np.array(values, dtype=np.float64).reshape(-1, 4)
+        elif field == 'path':
+            columns[field] = values
+        else:
+            columns[field] = np.array(values, dtype=np.float64)
+    return columns
+
+
+def get_bboxes(root):
+    """Returns the rendered elements of a subtree and their bounding boxes in
+    the coordinate system of the outermost SVG viewport.
+    See extract().
+
+    Arguments:
+        root (SVGGraphicsElement): The root element of the subtree.
+    Returns:
+        tuple[list[SVGGraphicsElement], numpy.ndarray]: The elements in
+            document order, and an array of shape (n, 4) of their bounding
+            boxes (x, y, width, height).
+    """
+    elements = list()
+    records = list()
+    for _ in _iter_records(root, ('bbox',), records, elements):
+        pass
+    bboxes = np.array([record['bbox'] for record in records],
+                      dtype=np.float64).reshape(-1, 4)
+    return elements, bboxes
+
+
+def isrendered(element):
+    """Returns True if the element is a renderable graphics element whose
+    'display' attribute is not 'none'.
+    extract() visits only such elements, and does not descend into the
+    others (e.g., <defs>).
+
+    Arguments:
+        element (Element): An element.
+    Returns:
+        bool: True if the element is rendered.
+    """
+    return (isinstance(element, SVGGraphicsElement)
+            and element.local_name in Element.RENDERABLE_ELEMENTS
+            and element.get('display', 'inline') != 'none')
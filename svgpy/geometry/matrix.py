@@ -82,7 +82,14 @@ def matrix3d(m11, m12, m13, m14,
 
 
 class DOMMatrixReadOnly(object):
-    """Represents the [geometry] DOMMatrixReadOnly."""
+    """Represents the [geometry] DOMMatrixReadOnly.
+
+    An affine 2d matrix is stored as the six components (a, b, c, d, e, f),
+    and is promoted to a 4x4 matrix object only when a 3d transformation is
+    applied.
+    """
+
+    __slots__ = ('_a', '_b', '_c', '_d', '_e', '_f', '_matrix', '_is2d')
 
     def __init__(self, values=None, **init):
         """Constructs a DOMMatrixReadOnly object.
@@ -135,7 +142,11 @@ class DOMMatrixReadOnly(object):
     def __eq__(self, other):
         if not isinstance(other, DOMMatrixReadOnly):
             return NotImplemented
-        return (self._matrix == other.matrix).all()
+        if self._matrix is None and other._matrix is None:
+            return ((self._a, self._b, self._c, self._d, self._e, self._f)
+                    == (other._a, other._b, other._c, other._d, other._e,
+                        other._f))
+        return (self.matrix == other.matrix).all()
 
     def __imul__(self, other):
         return None
@@ -143,43 +154,55 @@ class DOMMatrixReadOnly(object):
     def __mul__(self, other):
         if not isinstance(other, DOMMatrixReadOnly):
             return NotImplemented
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.multiply_self(other)
         return m
 
     def __repr__(self):
         return '<{}.{} object at {} {}>'.format(
             type(self).__module__, type(self).__name__, hex(id(self)),
-            self._matrix.tolist())
+            self.matrix.tolist())
 
     @property
     def a(self):
         """float: The a component of the matrix."""
+        if self._matrix is None:
+            return self._a
         return self._matrix[0, 0]
 
     @property
     def b(self):
         """float: The b component of the matrix."""
+        if self._matrix is None:
+            return self._b
         return self._matrix[1, 0]
 
     @property
     def c(self):
         """float: The c component of the matrix."""
+        if self._matrix is None:
+            return self._c
         return self._matrix[0, 1]
 
     @property
     def d(self):
         """float: The d component of the matrix."""
+        if self._matrix is None:
+            return self._d
         return self._matrix[1, 1]
 
     @property
     def e(self):
         """float: The e component of the matrix."""
+        if self._matrix is None:
+            return self._e
         return self._matrix[0, 3]
 
     @property
     def f(self):
         """float: The f component of the matrix."""
+        if self._matrix is None:
+            return self._f
         return self._matrix[1, 3]
 
     @property
@@ -209,93 +232,139 @@ class DOMMatrixReadOnly(object):
     @property
     def m11(self):
         """float: The m11 component of the matrix."""
+        if self._matrix is None:
+            return self._a
         return self._matrix[0, 0]
 
     @property
     def m12(self):
         """float: The m12 component of the matrix."""
+        if self._matrix is None:
+            return self._b
         return self._matrix[1, 0]
 
     @property
     def m13(self):
         """float: The m13 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[2, 0]
 
     @property
     def m14(self):
         """float: The m14 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[3, 0]
 
     @property
     def m21(self):
         """float: The m21 component of the matrix."""
+        if self._matrix is None:
+            return self._c
         return self._matrix[0, 1]
 
     @property
     def m22(self):
         """float: The m22 component of the matrix."""
+        if self._matrix is None:
+            return self._d
         return self._matrix[1, 1]
 
     @property
     def m23(self):
         """float: The m23 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[2, 1]
 
     @property
     def m24(self):
         """float: The m24 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[3, 1]
 
     @property
     def m31(self):
         """float: The m31 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[0, 2]
 
     @property
     def m32(self):
         """float: The m32 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[1, 2]
 
     @property
     def m33(self):
         """float: The m33 component of the matrix."""
+        if self._matrix is None:
+            return 1.0
         return self._matrix[2, 2]
 
     @property
     def m34(self):
         """float: The m34 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[3, 2]
 
     @property
     def m41(self):
         """float: The m41 component of the matrix."""
+        if self._matrix is None:
+            return self._e
         return self._matrix[0, 3]
 
     @property
     def m42(self):
         """float: The m42 component of the matrix."""
+        if self._matrix is None:
+            return self._f
         return self._matrix[1, 3]
 
     @property
     def m43(self):
         """float: The m43 component of the matrix."""
+        if self._matrix is None:
+            return 0.0
         return self._matrix[2, 3]
 
     @property
     def m44(self):
+        """float: The m44 component of the matrix."""
+        if self._matrix is None:
+            return 1.0
         return self._matrix[3, 3]
 
     @property
     def matrix(self):
-        """numpy.array: The current matrix."""
+        """numpy.array: The current matrix as a 4x4 matrix object."""
+        if self._matrix is None:
+            return matrix2d(self._a, self._b, self._c, self._d, self._e,
+                            self._f)
         return self._matrix
 
+    def _copy(self):
+        m = DOMMatrix.__new__(DOMMatrix)
+        if self._matrix is None:
+            m._set_matrix2d(self._a, self._b, self._c, self._d, self._e,
+                            self._f)
+        else:
+            m._matrix = self._matrix.copy()
+        m._is2d = self._is2d
+        return m
+
     def _init_from_array(self, values):
         if len(values) == 6:
-            self._matrix = matrix2d(*values)
+            self._set_matrix2d(*values)
             self._is2d = True
         elif len(values) == 16:
-            self._matrix = matrix3d(*values)
+            self._set_matrix3d(*values)
             self._is2d = False
         else:
             raise TypeError("'values' required 6 elements for a 2d matrix"
@@ -303,7 +372,7 @@ class DOMMatrixReadOnly(object):
 
     def _init_from_matrix(self, **init):
         if len(init) == 0:
-            self._matrix = matrix2d(1, 0, 0, 1, 0, 0)
+            self._set_matrix2d(1, 0, 0, 1, 0, 0)
             self._is2d = True
             return
         a = init.pop('a', None)
@@ -387,7 +456,7 @@ class DOMMatrixReadOnly(object):
                     or (m44 is not None and m44 != 1)):
                 raise ValueError('Invalid keyword argument(s) for a 2d matrix')
         if is2d is None or is2d:
-            self._matrix = matrix2d(m11, m12, m21, m22, m41, m42)
+            self._set_matrix2d(m11, m12, m21, m22, m41, m42)
             self._is2d = True
         else:
             if m13 is None:
@@ -410,11 +479,41 @@ class DOMMatrixReadOnly(object):
                 m43 = 0
             if m44 is None:
                 m44 = 1
+            self._set_matrix3d(m11, m12, m13, m14,
+                               m21, m22, m23, m24,
+                               m31, m32, m33, m34,
+                               m41, m42, m43, m44)
+            self._is2d = False
+
+    def _promote(self):
+        # returns the 4x4 matrix object, and stores the matrix in it
+        if self._matrix is None:
+            self._matrix = matrix2d(self._a, self._b, self._c, self._d,
+                                    self._e, self._f)
+        return self._matrix
+
+    def _set_matrix2d(self, a, b, c, d, e, f):
+        self._a = float(a)
+        self._b = float(b)
+        self._c = float(c)
+        self._d = float(d)
+        self._e = float(e)
+        self._f = float(f)
+        self._matrix = None
+
+    def _set_matrix3d(self, m11, m12, m13, m14,
+                      m21, m22, m23, m24,
+                      m31, m32, m33, m34,
+                      m41, m42, m43, m44):
+        if (m13 == 0 and m14 == 0 and m23 == 0 and m24 == 0
+                and m31 == 0 and m32 == 0 and m33 == 1 and m34 == 0
+                and m43 == 0 and m44 == 1):
+            self._set_matrix2d(m11, m12, m21, m22, m41, m42)
+        else:
             self._matrix = matrix3d(m11, m12, m13, m14,
                                     m21, m22, m23, m24,
                                     m31, m32, m33, m34,
                                     m41, m42, m43, m44)
-            self._is2d = False
 
     def flip_x(self):
         """Post-multiplies the transformation [-1 0 0 1 0 0] on the current
@@ -529,7 +628,7 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.invert_self()
         return m
 
@@ -558,17 +657,17 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.rotate_self(rot_x, rot_y, rot_z)
         return m
 
     def rotate_axis_angle(self, x=0, y=0, z=0, angle=0):
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.rotate_axis_angle_self(x, y, z, angle)
         return m
 
     def rotate_from_vector(self, x=0, y=0):
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.rotate_from_vector_self(x, y)
         return m
 
@@ -588,12 +687,12 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.scale_self(scale_x, scale_y, scale_z, origin_x, origin_y, origin_z)
         return m
 
     def scale3d(self, scale=1, origin_x=0, origin_y=0, origin_z=0):
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.scale3d_self(scale, origin_x, origin_y, origin_z)
         return m
 
@@ -607,7 +706,7 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.skew_x_self(angle)
         return m
 
@@ -621,7 +720,7 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.skew_y_self(angle)
         return m
 
@@ -693,6 +792,12 @@ class DOMMatrixReadOnly(object):
         Returns:
              tuple[float, ...]: The resulting coordinates.
         """
+        if self._matrix is None:
+            x, y = (self._a * x + self._c * y + self._e * w,
+                    self._b * x + self._d * y + self._f * w)
+            if self._is2d and z == 0 and w == 1:
+                return x, y
+            return float(x), float(y), float(z), float(w)
         pt = np.array([[float(x)], [float(y)], [float(z)], [float(w)]])
         pt = np.dot(self._matrix, pt)
         if self._is2d and z == 0 and w == 1:
@@ -711,7 +816,7 @@ class DOMMatrixReadOnly(object):
         Returns:
             DOMMatrix: The resulting matrix.
         """
-        m = DOMMatrix(self.tolist())
+        m = self._copy()
         m.translate_self(tx, ty, tz)
         return m
 
@@ -720,6 +825,8 @@ class DOMMatrix(DOMMatrixReadOnly):
     # TODO: implement DOMMatrix.setMatrixValue().
     """Represents the [geometry] DOMMatrix."""
 
+    __slots__ = ()
+
     def __init__(self, values=None, **init):
         """Constructs a DOMMatrix object.
 
@@ -762,116 +869,165 @@ class DOMMatrix(DOMMatrixReadOnly):
     def __repr__(self):
         return '<{}.{} object at {} {}>'.format(
             type(self).__module__, type(self).__name__, hex(id(self)),
-            self._matrix.tolist())
+            self.matrix.tolist())
 
     @DOMMatrixReadOnly.a.setter
     def a(self, value):
-        self._matrix[0, 0] = float(value)
+        if self._matrix is None:
+            self._a = float(value)
+        else:
+            self._matrix[0, 0] = float(value)
 
     @DOMMatrixReadOnly.b.setter
     def b(self, value):
-        self._matrix[1, 0] = float(value)
+        if self._matrix is None:
+            self._b = float(value)
+        else:
+            self._matrix[1, 0] = float(value)
 
     @DOMMatrixReadOnly.c.setter
     def c(self, value):
-        self._matrix[0, 1] = float(value)
+        if self._matrix is None:
+            self._c = float(value)
+        else:
+            self._matrix[0, 1] = float(value)
 
     @DOMMatrixReadOnly.d.setter
     def d(self, value):
-        self._matrix[1, 1] = float(value)
+        if self._matrix is None:
+            self._d = float(value)
+        else:
+            self._matrix[1, 1] = float(value)
 
     @DOMMatrixReadOnly.e.setter
     def e(self, value):
-        self._matrix[0, 3] = float(value)
+        if self._matrix is None:
+            self._e = float(value)
+        else:
+            self._matrix[0, 3] = float(value)
 
     @DOMMatrixReadOnly.f.setter
     def f(self, value):
-        self._matrix[1, 3] = float(value)
+        if self._matrix is None:
+            self._f = float(value)
+        else:
+            self._matrix[1, 3] = float(value)
 
     @DOMMatrixReadOnly.m11.setter
     def m11(self, value):
-        self._matrix[0, 0] = float(value)
+        if self._matrix is None:
+            self._a = float(value)
+        else:
+            self._matrix[0, 0] = float(value)
 
     @DOMMatrixReadOnly.m12.setter
     def m12(self, value):
-        self._matrix[1, 0] = float(value)
+        if self._matrix is None:
+            self._b = float(value)
+        else:
+            self._matrix[1, 0] = float(value)
 
     @DOMMatrixReadOnly.m13.setter
     def m13(self, value):
-        self._matrix[2, 0] = float(value)
+        self._promote()[2, 0] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m14.setter
     def m14(self, value):
-        self._matrix[3, 0] = float(value)
+        self._promote()[3, 0] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m21.setter
     def m21(self, value):
-        self._matrix[0, 1] = float(value)
+        if self._matrix is None:
+            self._c = float(value)
+        else:
+            self._matrix[0, 1] = float(value)
 
     @DOMMatrixReadOnly.m22.setter
     def m22(self, value):
-        self._matrix[1, 1] = float(value)
+        if self._matrix is None:
+            self._d = float(value)
+        else:
+            self._matrix[1, 1] = float(value)
 
     @DOMMatrixReadOnly.m23.setter
     def m23(self, value):
-        self._matrix[2, 1] = float(value)
+        self._promote()[2, 1] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m24.setter
     def m24(self, value):
-        self._matrix[3, 1] = float(value)
+        self._promote()[3, 1] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m31.setter
     def m31(self, value):
-        self._matrix[0, 2] = float(value)
+        self._promote()[0, 2] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m32.setter
     def m32(self, value):
-        self._matrix[1, 2] = float(value)
+        self._promote()[1, 2] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m33.setter
     def m33(self, value):
-        self._matrix[2, 2] = float(value)
+        self._promote()[2, 2] = float(value)
         if value != 1:
             self._is2d = False
 
     @DOMMatrixReadOnly.m34.setter
     def m34(self, value):
-        self._matrix[3, 2] = float(value)
+        self._promote()[3, 2] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m41.setter
     def m41(self, value):
-        self._matrix[0, 3] = float(value)
+        if self._matrix is None:
+            self._e = float(value)
+        else:
+            self._matrix[0, 3] = float(value)
 
     @DOMMatrixReadOnly.m42.setter
     def m42(self, value):
-        self._matrix[1, 3] = float(value)
+        if self._matrix is None:
+            self._f = float(value)
+        else:
+            self._matrix[1, 3] = float(value)
 
     @DOMMatrixReadOnly.m43.setter
     def m43(self, value):
-        self._matrix[2, 3] = float(value)
+        self._promote()[2, 3] = float(value)
         if value:
             self._is2d = False
 
     @DOMMatrixReadOnly.m44.setter
     def m44(self, value):
-        self._matrix[3, 3] = float(value)
+        self._promote()[3, 3] = float(value)
         if value != 1:
             self._is2d = False
 
+    def _multiply2d(self, a, b, c, d, e, f):
+        # post-multiplies the affine 2d matrix [a b c d e f]
+        if self._matrix is not None:
+            self._matrix = np.dot(self._matrix, matrix2d(a, b, c, d, e, f))
+            return
+        a1, b1, c1, d1 = self._a, self._b, self._c, self._d
+        self._a = a1 * a + c1 * b
+        self._b = b1 * a + d1 * b
+        self._c = a1 * c + c1 * d
+        self._d = b1 * c + d1 * d
+        self._e = a1 * e + c1 * f + self._e
+        self._f = b1 * e + d1 * f + self._f
+
     def clear(self, is2d=None):
         """Sets the matrix [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1].
 
@@ -920,7 +1076,19 @@ class DOMMatrix(DOMMatrixReadOnly):
         Returns:
             DOMMatrix: Returns itself.
         """
-        self._matrix = np.linalg.inv(self._matrix)
+        if self._matrix is None:
+            a, b, c, d, e, f = (self._a, self._b, self._c, self._d, self._e,
+                                self._f)
+            det = a * d - b * c
+            if det != 0:
+                self._a = d / det
+                self._b = -b / det
+                self._c = -c / det
+                self._d = a / det
+                self._e = (c * f - d * e) / det
+                self._f = (b * e - a * f) / det
+                return self
+        self._matrix = np.linalg.inv(self._promote())
         return self
 
     def multiply_self(self, other):
@@ -931,7 +1099,11 @@ class DOMMatrix(DOMMatrixReadOnly):
         Returns:
             DOMMatrix: Returns itself.
         """
-        self._matrix = np.dot(self._matrix, other._matrix)
+        if other._matrix is None:
+            self._multiply2d(other._a, other._b, other._c, other._d,
+                             other._e, other._f)
+        else:
+            self._matrix = np.dot(self._promote(), other._matrix)
         if not other._is2d:
             self._is2d = False
         return self
@@ -950,10 +1122,8 @@ class DOMMatrix(DOMMatrixReadOnly):
         cos = math.cos(t)
         if x == 0 and y == 0 and z == 1:
             # [0, 0, 1, rot_z]
-            r = matrix3d(cos, sin, 0, 0,
-                         -sin, cos, 0, 0,
-                         0, 0, 1, 0,
-                         0, 0, 0, 1)
+            self._multiply2d(cos, sin, -sin, cos, 0, 0)
+            return self
         elif x == 0 and y == 1 and z == 0:
             # [0, 1, 0, rot_y]
             r = matrix3d(cos, 0, -sin, 0,
@@ -987,7 +1157,7 @@ class DOMMatrix(DOMMatrixReadOnly):
                          m21, m22, m23, m24,
                          m31, m32, m33, m34,
                          m41, m42, m43, m44)
-        self._matrix = np.dot(self._matrix, r)
+        self._matrix = np.dot(self._promote(), r)
         if x != 0 or y != 0:
             self._is2d = False
         return self
@@ -1040,11 +1210,14 @@ class DOMMatrix(DOMMatrixReadOnly):
             return self
         if origin_x != 0 or origin_y != 0 or origin_z != 0:
             self.translate_self(origin_x, origin_y, origin_z)
-        m = matrix3d(scale_x, 0, 0, 0,
-                     0, scale_y, 0, 0,
-                     0, 0, scale_z, 0,
-                     0, 0, 0, 1)
-        self._matrix = np.dot(self._matrix, m)
+        if scale_z == 1:
+            self._multiply2d(scale_x, 0, 0, scale_y, 0, 0)
+        else:
+            m = matrix3d(scale_x, 0, 0, 0,
+                         0, scale_y, 0, 0,
+                         0, 0, scale_z, 0,
+                         0, 0, 0, 1)
+            self._matrix = np.dot(self._promote(), m)
         if scale_z != 1 or origin_z != 0:
             self._is2d = False
         if origin_x != 0 or origin_y != 0 or origin_z != 0:
@@ -1063,8 +1236,7 @@ class DOMMatrix(DOMMatrixReadOnly):
         Returns:
             DOMMatrix: Returns itself.
         """
-        m = matrix2d(1, 0, math.tan(math.radians(angle)), 1, 0, 0)
-        self._matrix = np.dot(self._matrix, m)
+        self._multiply2d(1, 0, math.tan(math.radians(angle)), 1, 0, 0)
         return self
 
     def skew_y_self(self, angle):
@@ -1075,8 +1247,7 @@ class DOMMatrix(DOMMatrixReadOnly):
         Returns:
             DOMMatrix: Returns itself.
         """
-        m = matrix2d(1, math.tan(math.radians(angle)), 0, 1, 0, 0)
-        self._matrix = np.dot(self._matrix, m)
+        self._multiply2d(1, math.tan(math.radians(angle)), 0, 1, 0, 0)
         return self
 
     def translate_self(self, tx=0, ty=0, tz=0):
@@ -1092,11 +1263,14 @@ class DOMMatrix(DOMMatrixReadOnly):
         """
         if tx == 0 and ty == 0 and tz == 0:
             return self
-        m = matrix3d(1, 0, 0, 0,
-                     0, 1, 0, 0,
-                     0, 0, 1, 0,
-                     tx, ty, tz, 1)
-        self._matrix = np.dot(self._matrix, m)
+        if tz == 0:
+            self._multiply2d(1, 0, 0, 1, tx, ty)
+        else:
+            m = matrix3d(1, 0, 0, 0,
+                         0, 1, 0, 0,
+                         0, 0, 1, 0,
+                         tx, ty, tz, 1)
+            self._matrix = np.dot(self._promote(), m)
         if tz != 0:
             self._is2d = False
         return self
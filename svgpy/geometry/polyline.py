@@ -0,0 +1,404 @@
+# Copyright (C) 2018 Tetsuya Miura <miute.dev@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+
+import numpy as np
+
+# the maximum number of the points that are tested at once
+_CHUNK_SIZE = 4096
+
+
+def _flatten_cubic(x0, y0, x1, y1, x2, y2, x3, y3, tolerance):
+    # Wang's formula: the number of the line segments that keeps the
+    # distance from the curve within the tolerance
+    ddx = max(abs(x0 - 2 * x1 + x2), abs(x1 - 2 * x2 + x3))
+    ddy = max(abs(y0 - 2 * y1 + y2), abs(y1 - 2 * y2 + y3))
+    count = math.ceil(math.sqrt(0.75 * math.hypot(ddx, ddy) / tolerance))
+    count = min(max(count, 1), 256)
+    t = np.arange(1, count + 1) / count
+    mt = 1 - t
+    a = mt * mt * mt
+    b = 3 * mt * mt * t
+    c = 3 * mt * t * t
+    d = t * t * t
+    return np.column_stack((a * x0 + b * x1 + c * x2 + d * x3,
+                            a * y0 + b * y1 + c * y2 + d * y3))
+
+
+def _in_convex_polygons(px, py, polygons):
+    # polygons: an array of shape (K, N, 2) of the convex polygons
+    # returns an array of shape (G, K)
+    positive = None
+    negative = None
+    count = polygons.shape[1]
+    for i in range(count):
+        ax = polygons[:, i, 0]
+        ay = polygons[:, i, 1]
+        bx = polygons[:, (i + 1) % count, 0]
+        by = polygons[:, (i + 1) % count, 1]
+        cross = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        if positive is None:
+            positive = cross >= 0
+            negative = cross <= 0
+        else:
+            positive &= cross >= 0
+            negative &= cross <= 0
+    return positive | negative
+
+
+class FlattenedPath(object):
+    """Represents path data flattened into polylines, for hit testing.
+
+    The edges are bucketed into horizontal bands, so each point is tested
+    only against the edges of the bands around it.
+    """
+
+    def __init__(self, path_data, tolerance=0.1):
+        """Constructs a FlattenedPath object.
+
+        Arguments:
+            path_data (list[SVGPathSegment]): A list of normalized path
+                segments, which consists of the absolute 'M', 'L', 'C' and
+                'Z' commands only. See PathParser.normalize().
+            tolerance (float, optional): The maximum distance between the
+                curves and the flattened line segments, in user units.
+        """
+        self._tolerance = tolerance
+        subpaths = self._flatten(path_data, tolerance)
+        self._build_edges(subpaths)
+        self._build_bands()
+
+    def __len__(self):
+        return len(self._x0)
+
+    @staticmethod
+    def _flatten(path_data, tolerance):
+        subpaths = list()  # list[tuple[list[numpy.ndarray], bool]]
+        points = None
+        start = current = None
+        for path_segment in path_data:
+            command = path_segment.type
+            values = path_segment.values
+            if command == 'M':
+                if points is not None:
+                    subpaths.append((points, False))
+                start = current = values[0], values[1]
+                points = [np.array([current], dtype=np.float64)]
+                continue
+            elif command == 'Z':
+                if points is not None:
+                    subpaths.append((points, True))
+                    points = None
+                current = start
+                continue
+            if points is None:
+                # a segment after 'Z' starts a new subpath
+                points = [np.array([current], dtype=np.float64)]
+            if command == 'L':
+                current = values[0], values[1]
+                points.append(np.array([current], dtype=np.float64))
+            elif command == 'C':
+                x1, y1, x2, y2, x, y = values
+                points.append(_flatten_cubic(current[0], current[1],
+                                             x1, y1, x2, y2, x, y,
+                                             tolerance))
+                current = x, y
+        if points is not None:
+            subpaths.append((points, False))
+        return subpaths
+
+    def _build_edges(self, subpaths):
+        x0 = list()
+        y0 = list()
+        x1 = list()
+        y1 = list()
+        stroked = list()
+        cap_start = list()
+        cap_end = list()
+        next_edge = list()
+        dots = list()
+        for points, closed in subpaths:
+            points = np.concatenate(points)
+            # remove the zero-length segments
+            keep = np.ones(len(points), dtype=bool)
+            keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+            points = points[keep]
+            if len(points) == 1:
+                dots.append(points[0])
+                continue
+            if closed and np.any(points[0] != points[-1]):
+                points = np.concatenate((points, points[:1]))
+            elif not closed and np.all(points[0] == points[-1]):
+                closed = True
+            offset = len(x0)
+            count = len(points) - 1
+            x0.extend(points[:-1, 0])
+            y0.extend(points[:-1, 1])
+            x1.extend(points[1:, 0])
+            y1.extend(points[1:, 1])
+            stroked.extend([True] * count)
+            cap_start.extend([not closed] + [False] * (count - 1))
+            cap_end.extend([False] * (count - 1) + [not closed])
+            # the index of the edge that follows each edge at its end vertex
+            joined = list(range(offset + 1, offset + count))
+            joined.append(offset if closed else -1)
+            next_edge.extend(joined)
+            if not closed and count > 1:
+                # the implicit closing edge is filled but not stroked
+                x0.append(points[-1, 0])
+                y0.append(points[-1, 1])
+                x1.append(points[0, 0])
+                y1.append(points[0, 1])
+                stroked.append(False)
+                cap_start.append(False)
+                cap_end.append(False)
+                next_edge.append(-1)
+        self._x0 = np.array(x0, dtype=np.float64)
+        self._y0 = np.array(y0, dtype=np.float64)
+        self._x1 = np.array(x1, dtype=np.float64)
+        self._y1 = np.array(y1, dtype=np.float64)
+        self._stroked = np.array(stroked, dtype=bool)
+        self._cap_start = np.array(cap_start, dtype=bool)
+        self._cap_end = np.array(cap_end, dtype=bool)
+        self._next_edge = np.array(next_edge, dtype=np.intp)
+        self._dots = np.array(dots, dtype=np.float64).reshape(-1, 2)
+
+        # the unit direction vectors
+        dx = self._x1 - self._x0
+        dy = self._y1 - self._y0
+        length = np.hypot(dx, dy)
+        self._length = length
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._ux = dx / length
+            self._uy = dy / length
+
+    def _build_bands(self):
+        count = len(self)
+        if count == 0:
+            self._ymin = 0
+            self._band_height = 1
+            self._band_starts = np.zeros(2, dtype=np.intp)
+            self._band_edges = np.empty(0, dtype=np.intp)
+            return
+        ey0 = np.minimum(self._y0, self._y1)
+        ey1 = np.maximum(self._y0, self._y1)
+        ymin = float(ey0.min())
+        ymax = float(ey1.max())
+        num_bands = min(max(int(math.sqrt(count)), 1), 1024)
+        band_height = max((ymax - ymin) / num_bands, 1e-9)
+        first = self._get_bands(ey0, ymin, band_height, num_bands)
+        last = self._get_bands(ey1, ymin, band_height, num_bands)
+        spans = last - first + 1
+        edges = np.repeat(np.arange(count), spans)
+        offsets = np.repeat(np.cumsum(spans) - spans, spans)
+        bands = np.arange(len(edges)) - offsets + np.repeat(first, spans)
+        order = np.argsort(bands, kind='stable')
+        self._ymin = ymin
+        self._band_height = band_height
+        self._band_starts = np.concatenate(
+            ([0], np.cumsum(np.bincount(bands, minlength=num_bands))))
+        self._band_edges = edges[order]
+
+    @staticmethod
+    def _get_bands(y, ymin, band_height, num_bands):
+        bands = np.floor((y - ymin) / band_height).astype(np.intp)
+        return np.clip(bands, 0, num_bands - 1)
+
+    def _iter_groups(self, px, py, reach):
+        # yields the indices of the points and their candidate edges
+        num_bands = len(self._band_starts) - 1
+        if len(self) == 0:
+            return
+        bands = self._get_bands(py, self._ymin, self._band_height, num_bands)
+        reach_bands = (math.ceil(reach / self._band_height)
+                       if reach > 0 else 0)
+        order = np.argsort(bands, kind='stable')
+        sorted_bands = bands[order]
+        boundaries = np.flatnonzero(np.diff(sorted_bands)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(order)]))
+        ymax = self._ymin + self._band_height * num_bands
+        for start, end in zip(starts, ends):
+            indices = order[start:end]
+            band = sorted_bands[start]
+            first = max(band - reach_bands, 0)
+            last = min(band + reach_bands, num_bands - 1)
+            edges = self._band_edges[self._band_starts[first]:
+                                     self._band_starts[last + 1]]
+            if reach_bands > 0:
+                edges = np.unique(edges)
+            # the points above or below all the bands
+            ys = py[indices]
+            if reach <= 0:
+                inside = (ys >= self._ymin) & (ys <= ymax)
+                indices = indices[inside]
+            if len(edges) == 0 or len(indices) == 0:
+                continue
+            for chunk in range(0, len(indices), _CHUNK_SIZE):
+                yield indices[chunk:chunk + _CHUNK_SIZE], edges
+
+    def contains(self, points, fill_rule='nonzero'):
+        """Tests whether the points are inside the fill area.
+
+        Arguments:
+            points (array_like): An array of shape (n, 2) of the points.
+            fill_rule (str, optional): The fill rule: 'nonzero' or
+                'evenodd'.
+        Returns:
+            numpy.ndarray: An array of shape (n,) of bool.
+        """
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        result = np.zeros(len(points), dtype=bool)
+        px = points[:, 0]
+        py = points[:, 1]
+        for indices, edges in self._iter_groups(px, py, 0):
+            gx = px[indices, np.newaxis]
+            gy = py[indices, np.newaxis]
+            x0 = self._x0[edges]
+            y0 = self._y0[edges]
+            x1 = self._x1[edges]
+            y1 = self._y1[edges]
+            upward = (y0 <= gy) & (y1 > gy)
+            downward = (y1 <= gy) & (y0 > gy)
+            cross = (x1 - x0) * (gy - y0) - (gx - x0) * (y1 - y0)
+            if fill_rule == 'evenodd':
+                crossings = (upward & (cross > 0)) | (downward & (cross < 0))
+                result[indices] = np.count_nonzero(crossings, axis=1) % 2 == 1
+            else:
+                winding = (np.count_nonzero(upward & (cross > 0), axis=1)
+                           - np.count_nonzero(downward & (cross < 0), axis=1))
+                result[indices] = winding != 0
+        return result
+
+    def stroke_contains(self, points, stroke_width=1, line_cap='butt',
+                        line_join='miter', miter_limit=4):
+        """Tests whether the points are inside the stroke area.
+        Dashing is not taken into account.
+
+        Arguments:
+            points (array_like): An array of shape (n, 2) of the points.
+            stroke_width (float, optional): The width of the stroke.
+            line_cap (str, optional): The shape at the end of open
+                subpaths: 'butt', 'round' or 'square'.
+            line_join (str, optional): The shape at the corners: 'miter',
+                'miter-clip', 'round', 'bevel' or 'arcs'.
+            miter_limit (float, optional): The limit on the ratio of the
+                miter length to the stroke width.
+        Returns:
+            numpy.ndarray: An array of shape (n,) of bool.
+        """
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        result = np.zeros(len(points), dtype=bool)
+        hw = stroke_width / 2
+        if hw <= 0:
+            return result
+        px = points[:, 0]
+        py = points[:, 1]
+        round_join = line_join in ('round', 'arcs')
+        miter_join = line_join in ('miter', 'miter-clip')
+        reach = hw * max(miter_limit if miter_join else 1, math.sqrt(2))
+        for indices, edges in self._iter_groups(px, py, reach):
+            edges = edges[self._stroked[edges]]
+            if len(edges) == 0:
+                continue
+            gx = px[indices, np.newaxis]
+            gy = py[indices, np.newaxis]
+            x0 = self._x0[edges]
+            y0 = self._y0[edges]
+            x1 = self._x1[edges]
+            y1 = self._y1[edges]
+            ux = self._ux[edges]
+            uy = self._uy[edges]
+            length = self._length[edges]
+
+            # the bodies of the segments (and the square caps)
+            along = (gx - x0) * ux + (gy - y0) * uy
+            across = np.abs((gy - y0) * ux - (gx - x0) * uy)
+            lower = np.zeros(len(edges))
+            upper = length.copy()
+            if line_cap == 'square':
+                lower[self._cap_start[edges]] = -hw
+                upper[self._cap_end[edges]] += hw
+            hit = (along >= lower) & (along <= upper) & (across <= hw)
+
+            # the round caps
+            if line_cap == 'round':
+                hit |= (self._cap_start[edges]
+                        & (np.hypot(gx - x0, gy - y0) <= hw))
+                hit |= (self._cap_end[edges]
+                        & (np.hypot(gx - x1, gy - y1) <= hw))
+
+            # the joins at the end vertices
+            joined = self._next_edge[edges]
+            has_join = joined >= 0
+            if np.any(has_join):
+                hit |= self._hit_joins(gx, gy, edges, joined, has_join, hw,
+                                       round_join, miter_join, miter_limit)
+            result[indices] |= np.any(hit, axis=1)
+
+        if len(self._dots) > 0 and line_cap in ('round', 'square'):
+            dx = px[:, np.newaxis] - self._dots[:, 0]
+            dy = py[:, np.newaxis] - self._dots[:, 1]
+            if line_cap == 'round':
+                hit = np.hypot(dx, dy) <= hw
+            else:
+                hit = (np.abs(dx) <= hw) & (np.abs(dy) <= hw)
+            result |= np.any(hit, axis=1)
+        return result
+
+    def _hit_joins(self, gx, gy, edges, joined, has_join, hw, round_join,
+                   miter_join, miter_limit):
+        x1 = self._x1[edges]
+        y1 = self._y1[edges]
+        if round_join:
+            return has_join & (np.hypot(gx - x1, gy - y1) <= hw)
+        next_edges = np.where(has_join, joined, edges)
+        ux1 = self._ux[edges]
+        uy1 = self._uy[edges]
+        ux2 = self._ux[next_edges]
+        uy2 = self._uy[next_edges]
+        # the outer side of the corner
+        turn = ux1 * uy2 - uy1 * ux2
+        side = np.where(turn > 0, -1.0, 1.0)
+        nx1 = -uy1 * side * hw
+        ny1 = ux1 * side * hw
+        nx2 = -uy2 * side * hw
+        ny2 = ux2 * side * hw
+        cos_turn = ux1 * ux2 + uy1 * uy2
+        polygons = np.empty((len(edges), 4, 2))
+        polygons[:, 0, 0] = x1
+        polygons[:, 0, 1] = y1
+        polygons[:, 1, 0] = x1 + nx1
+        polygons[:, 1, 1] = y1 + ny1
+        polygons[:, 2, 0] = x1 + nx2
+        polygons[:, 2, 1] = y1 + ny2
+        polygons[:, 3] = polygons[:, 2]
+        if miter_join:
+            # the miter length ratio is 1 / cos(turning angle / 2)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ratio = 1 / np.sqrt((1 + cos_turn) / 2)
+                mitered = ratio <= miter_limit
+                scale = 1 / (1 + cos_turn)
+            mitered &= has_join
+            tip_x = x1 + (nx1 + nx2) * scale
+            tip_y = y1 + (ny1 + ny2) * scale
+            polygons[mitered, 2, 0] = tip_x[mitered]
+            polygons[mitered, 2, 1] = tip_y[mitered]
+            polygons[mitered, 3, 0] = (x1 + nx2)[mitered]
+            polygons[mitered, 3, 1] = (y1 + ny2)[mitered]
+        # the straight joins need no area
+        has_join = has_join & (turn != 0)
+        return has_join & _in_convex_polygons(gx, gy, polygons)
@@ -0,0 +1,407 @@
+# Copyright (C) 2018 Tetsuya Miura <miute.dev@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import itertools
+import math
+
+import numpy as np
+from lxml import etree
+
+from .extraction import get_bboxes, isrendered
+from .rect import DOMRectReadOnly
+from ..utils import TreeContext
+
+
+def _expand_ranges(starts, ends):
+    # concatenates np.arange(start, end) of each range
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(total) - offsets + np.repeat(starts, lengths)
+
+
+def _encloses(coords, x1, y1, x2, y2):
+    # the NaN coordinates are never enclosed
+    return ((coords[:, 0] >= x1) & (coords[:, 2] <= x2)
+            & (coords[:, 1] >= y1) & (coords[:, 3] <= y2))
+
+
+def _intersects(coords, x1, y1, x2, y2):
+    # the NaN coordinates never intersect
+    return ((coords[:, 0] <= x2) & (coords[:, 2] >= x1)
+            & (coords[:, 1] <= y2) & (coords[:, 3] >= y1))
+
+
+def _sort_tile(coords, node_capacity):
+    # Sort-Tile-Recursive: returns the order of the boxes
+    count = len(coords)
+    centers = (coords[:, :2] + coords[:, 2:]) / 2
+    centers = np.where(np.isnan(centers), np.inf, centers)
+    num_nodes = math.ceil(count / node_capacity)
+    slice_size = max(math.ceil(math.sqrt(num_nodes)), 1) * node_capacity
+    order = np.argsort(centers[:, 0], kind='stable')
+    for start in range(0, count, slice_size):
+        sliced = order[start:start + slice_size]
+        order[start:start + slice_size] = sliced[
+            np.argsort(centers[sliced, 1], kind='stable')]
+    return order
+
+
+class RTree(object):
+    """Represents a static R-tree over numpy arrays, packed by the
+    Sort-Tile-Recursive (STR) algorithm.
+
+    The updated items are tested one by one until the tree is repacked.
+
+    Examples:
+        >>> from svgpy.geometry.rtree import RTree
+        >>> tree = RTree([(0, 0, 10, 10), (20, 20, 10, 10)])
+        >>> tree.search(5, 5, 20, 20)
+        array([0, 1])
+        >>> tree.search(25, 25)
+        array([1])
+    """
+
+    def __init__(self, bboxes, node_capacity=16):
+        """Constructs an RTree object.
+
+        Arguments:
+            bboxes (array_like): An array of shape (n, 4) of the bounding
+                boxes (x, y, width, height) of the items. The items with the
+                NaN coordinates are never found.
+            node_capacity (int, optional): The maximum number of the
+                children of a node.
+        """
+        if node_capacity < 2:
+            raise ValueError(
+                'Expected node_capacity >= 2, got {}'.format(node_capacity))
+        bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._coords = np.concatenate(
+            (bboxes[:, :2], bboxes[:, :2] + bboxes[:, 2:]), axis=1)
+        self._node_capacity = node_capacity
+        self._items = None
+        self._item_coords = None
+        self._levels = None
+        self._updated = np.zeros(len(bboxes), dtype=bool)
+        self._updated_items = np.empty(0, dtype=np.intp)
+        self._pack()
+
+    def __len__(self):
+        return len(self._coords)
+
+    def _pack(self):
+        node_capacity = self._node_capacity
+        order = _sort_tile(self._coords, node_capacity)
+        self._items = order
+        coords = self._coords[order]
+        self._item_coords = coords
+        levels = list()
+        while len(coords) > node_capacity or len(levels) == 0:
+            starts = np.arange(0, len(coords), node_capacity)
+            ends = np.minimum(starts + node_capacity, len(coords))
+            if len(coords) > 0:
+                node_coords = np.concatenate(
+                    (np.fmin.reduceat(coords[:, :2], starts, axis=0),
+                     np.fmax.reduceat(coords[:, 2:], starts, axis=0)),
+                    axis=1)
+            else:
+                node_coords = np.empty((0, 4), dtype=np.float64)
+            if len(node_coords) > node_capacity:
+                # sort the nodes of the upper level
+                order = _sort_tile(node_coords, node_capacity)
+                node_coords = node_coords[order]
+                starts = starts[order]
+                ends = ends[order]
+            levels.append((node_coords, starts, ends))
+            coords = node_coords
+        levels.reverse()
+        self._levels = levels
+        self._updated[:] = False
+        self._updated_items = np.empty(0, dtype=np.intp)
+
+    def get_bboxes(self, items):
+        """Returns the bounding boxes of the items.
+
+        Arguments:
+            items (array_like): The indices of the items.
+        Returns:
+            numpy.ndarray: An array of shape (len(items), 4) of the bounding
+                boxes (x, y, width, height).
+        """
+        coords = self._coords[np.asarray(items, dtype=np.intp).reshape(-1)]
+        return np.concatenate((coords[:, :2], coords[:, 2:] - coords[:, :2]),
+                              axis=1)
+
+    def search(self, x, y, width=0, height=0, enclosed=False):
+        """Returns the items whose bounding boxes intersect the rectangle.
+        The edges are inclusive, so a point (width=0 and height=0) finds
+        the items that contain it.
+
+        Arguments:
+            x (float): The x-coordinate of the rectangle's left edge.
+            y (float): The y-coordinate of the rectangle's top edge.
+            width (float, optional): The width of the rectangle.
+            height (float, optional): The height of the rectangle.
+            enclosed (bool, optional): If True, returns the items whose
+                bounding boxes are entirely within the rectangle instead.
+        Returns:
+            numpy.ndarray: The sorted indices of the items.
+        """
+        x1, y1, x2, y2 = x, y, x + width, y + height
+        matches = _encloses if enclosed else _intersects
+        node_coords, starts, ends = self._levels[0]
+        hits = _intersects(node_coords, x1, y1, x2, y2)
+        positions = _expand_ranges(starts[hits], ends[hits])
+        for node_coords, starts, ends in self._levels[1:]:
+            positions = positions[_intersects(node_coords[positions],
+                                              x1, y1, x2, y2)]
+            positions = _expand_ranges(starts[positions], ends[positions])
+        positions = positions[matches(self._item_coords[positions],
+                                      x1, y1, x2, y2)]
+        items = self._items[positions]
+        if len(self._updated_items) > 0:
+            items = items[~self._updated[items]]
+            updated_items = self._updated_items
+            items = np.concatenate((items, updated_items[matches(
+                self._coords[updated_items], x1, y1, x2, y2)]))
+        return np.sort(items)
+
+    def update(self, items, bboxes):
+        """Updates the bounding boxes of the items.
+
+        Arguments:
+            items (array_like): The indices of the items.
+            bboxes (array_like): An array of shape (len(items), 4) of the
+                new bounding boxes (x, y, width, height).
+        """
+        items = np.asarray(items, dtype=np.intp).reshape(-1)
+        bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        self._coords[items, :2] = bboxes[:, :2]
+        self._coords[items, 2:] = bboxes[:, :2] + bboxes[:, 2:]
+        self._updated[items] = True
+        if np.count_nonzero(self._updated) > max(64, len(self) // 8):
+            self._pack()
+        else:
+            self._updated_items = np.flatnonzero(self._updated)
+
+
+class SpatialIndex(object):
+    """Represents a spatial index of the rendered elements of a subtree.
+    The bounding boxes are in the coordinate system of the outermost SVG
+    viewport (see svgpy.geometry.extraction.extract()).
+
+    The index is updated before each query. The elements whose attributes
+    were changed (see TreeContext.touch()) are updated with their
+    descendants and ancestors, and so are the 'use' elements that refer to
+    them. Structural changes of the tree, and changes whose element becomes
+    rendered, rebuild the whole index.
+    """
+
+    def __init__(self, root, node_capacity=16):
+        """Constructs a SpatialIndex object.
+
+        Arguments:
+            root (SVGGraphicsElement): The root element of the subtree.
+            node_capacity (int, optional): The maximum number of the
+                children of a node of the R-tree.
+        """
+        self._root = root
+        self._node_capacity = node_capacity
+        self._context = None
+        self._elements = None
+        self._positions = None
+        self._tree = None
+        self._changed = list()
+        self._rebuild = True
+
+    def __len__(self):
+        self._update()
+        return len(self._elements)
+
+    def _build(self):
+        elements, bboxes = get_bboxes(self._root)
+        context = TreeContext.of(self._root)
+        if context is not self._context:
+            if self._context is not None:
+                self._context.remove_observer(self)
+            context.add_observer(self)
+            self._context = context
+        self._elements = elements
+        self._positions = dict(
+            (element, position) for position, element in enumerate(elements))
+        self._tree = RTree(bboxes, self._node_capacity)
+        self._changed.clear()
+        self._rebuild = False
+
+    def _get_dependents(self, element):
+        # the indexed 'use' elements that refer to the element, its ancestors
+        # or descendants, directly or through other 'use' elements
+        context = self._context
+        positions = self._positions
+        dependents = list()
+        visited = set()
+        pending = [element]
+        while len(pending) > 0:
+            element = pending.pop()
+            for target in itertools.chain(element.iterancestors(),
+                                          element.iter(etree.Element)):
+                if target in visited:
+                    continue
+                visited.add(target)
+                element_id = target.get('id')
+                if element_id is None:
+                    continue
+                for referrer in context.get_referrers(element_id):
+                    if referrer in positions:
+                        dependents.append(referrer)
+                    pending.append(referrer)
+        return dependents
+
+    def _isindexed(self, element):
+        # True if the element is in the subtree and rendered
+        root = self._root
+        while element is not None:
+            if not isrendered(element):
+                return False
+            elif element is root:
+                return True
+            element = element.getparent()
+        return False
+
+    def _update(self):
+        if self._rebuild or TreeContext.of(self._root) is not self._context:
+            self._build()
+            return
+        if len(self._changed) == 0:
+            return
+        changed = self._changed
+        self._changed = list()
+        positions = self._positions
+        for element in changed:
+            if TreeContext.of(element) is not self._context:
+                continue  # another tree
+            elif element not in positions:
+                if self._isindexed(element):
+                    self._build()  # newly rendered
+                    return
+            elif not self._update_subtree(element):
+                self._build()
+                return
+            for dependent in self._get_dependents(element):
+                if not self._update_subtree(dependent):
+                    self._build()
+                    return
+
+    def _update_ancestors(self, element):
+        # a container's bounding box is the union of its children's
+        tree = self._tree
+        positions = self._positions
+        root = self._root
+        while element is not root:
+            element = element.getparent()
+            position = positions.get(element)
+            if position is None:
+                break
+            children = [positions[child] for child in element
+                        if child in positions]
+            bboxes = tree.get_bboxes(children)
+            bboxes = bboxes[~np.isnan(bboxes[:, 0])]
+            if len(bboxes) == 0:
+                bbox = (math.nan,) * 4
+            else:
+                x1, y1 = bboxes[:, :2].min(axis=0)
+                x2, y2 = (bboxes[:, :2] + bboxes[:, 2:]).max(axis=0)
+                bbox = x1, y1, x2 - x1, y2 - y1
+            tree.update([position], [bbox])
+
+    def _update_subtree(self, element):
+        # updates an indexed element, its descendants and ancestors. returns
+        # False if the index must be rebuilt
+        positions = self._positions
+        elements, bboxes = get_bboxes(element)
+        if len(elements) == 0:
+            return False  # no longer rendered
+        items = [positions.get(x) for x in elements]
+        if None in items:
+            return False  # newly rendered
+        self._tree.update(items, bboxes)
+        self._update_ancestors(element)
+        return True
+
+    def element_changed(self, element):
+        """Called by TreeContext.touch().
+
+        Arguments:
+            element (Element): The changed element, or None if it is unknown.
+        """
+        if self._rebuild:
+            return
+        elif element is None or len(self._changed) > 1024:
+            self._rebuild = True
+            self._changed.clear()
+        else:
+            self._changed.append(element)
+
+    def get_bbox(self, element):
+        """Returns the indexed bounding box of the element.
+
+        Arguments:
+            element (SVGGraphicsElement): A rendered element of the subtree.
+        Returns:
+            DOMRectReadOnly: The bounding box, or None if the element is not
+                indexed.
+        """
+        self._update()
+        position = self._positions.get(element)
+        if position is None:
+            return None
+        x, y, width, height = self._tree.get_bboxes([position])[0].tolist()
+        if math.isnan(x):
+            return DOMRectReadOnly()
+        return DOMRectReadOnly(x, y, width, height)
+
+    def search(self, x, y, width=0, height=0, enclosed=False):
+        """Returns the rendered elements whose bounding boxes intersect the
+        rectangle.
+
+        Arguments:
+            x (float): The x-coordinate of the rectangle's left edge.
+            y (float): The y-coordinate of the rectangle's top edge.
+            width (float, optional): The width of the rectangle.
+            height (float, optional): The height of the rectangle.
+            enclosed (bool, optional): If True, returns the elements whose
+                bounding boxes are entirely within the rectangle instead.
+        Returns:
+            list[SVGGraphicsElement]: The elements in document order.
+        """
+        self._update()
+        elements = self._elements
+        return [elements[position]
+                for position in self._tree.search(x, y, width, height,
+                                                  enclosed)]
+
+    def search_point(self, x, y):
+        """Returns the rendered elements whose bounding boxes contain the
+        point.
+
+        Arguments:
+            x (float): The x-coordinate of the point.
+            y (float): The y-coordinate of the point.
+        Returns:
+            list[SVGGraphicsElement]: The elements in document order.
+        """
+        return self.search(x, y)
@@ -15,11 +15,41 @@
 
 import array
 
+import numpy as np
+
 from ._ffi_api import dlopen, ffi
 from .freetype import FTFace
 
 lib = dlopen(ffi, ['harfbuzz', 'libharfbuzz-0'])
 
+# numpy data type of 'hb_glyph_info_t'
+HB_GLYPH_INFO_DTYPE = np.dtype([
+    ('codepoint', np.uint32),
+    ('mask', np.uint32),
+    ('cluster', np.uint32),
+    ('var1', np.uint32),
+    ('var2', np.uint32),
+])
+
+# numpy data type of 'hb_glyph_position_t'
+HB_GLYPH_POSITION_DTYPE = np.dtype([
+    ('x_advance', np.int32),
+    ('y_advance', np.int32),
+    ('x_offset', np.int32),
+    ('y_offset', np.int32),
+    ('var', np.int32),
+])
+
+assert HB_GLYPH_INFO_DTYPE.itemsize == ffi.sizeof('hb_glyph_info_t')
+assert HB_GLYPH_POSITION_DTYPE.itemsize == ffi.sizeof('hb_glyph_position_t')
+
+
+def _as_structured_array(cdata, length, dtype):
+    if length == 0 or cdata == ffi.NULL:
+        return np.empty(0, dtype=dtype)
+    buf = ffi.buffer(cdata, length * dtype.itemsize)
+    return np.frombuffer(buf, dtype=dtype, count=length)
+
 
 def hb_shape(font, buffer, features=None):
     if features is None:
@@ -331,7 +361,9 @@ class HBFTFont(HBFont):
             HBFTFont: A new HBFTFont object.
         """
         hb_font = lib.hb_ft_font_create(face.ft_face, ffi.NULL)
-        return HBFTFont(hb_font)
+        font = HBFTFont(hb_font)
+        font._ft_face = face  # keep a reference
+        return font
 
     def get_face(self):
         face = lib.hb_ft_font_get_face(self._font)
@@ -500,6 +532,21 @@ class HBBuffer(object):
             infos.append(HBGlyphInfo(hb_glyph_infos[i]))
         return infos
 
+    def get_glyph_infos_array(self):
+        """Returns the glyph information of the buffer as a numpy structured
+        array.
+        The returned array is a view over the internal memory of the buffer.
+        It becomes invalid when the buffer is modified or destroyed.
+
+        Returns:
+            numpy.ndarray: An array of HB_GLYPH_INFO_DTYPE.
+        """
+        length = ffi.new('unsigned int *')
+        hb_glyph_infos = lib.hb_buffer_get_glyph_infos(self._buffer, length)
+        return _as_structured_array(hb_glyph_infos,
+                                    length[0],
+                                    HB_GLYPH_INFO_DTYPE)
+
     def get_glyph_positions(self):
         length = ffi.new('unsigned int *')
         hb_glyph_positions = lib.hb_buffer_get_glyph_positions(
@@ -509,6 +556,22 @@ class HBBuffer(object):
             positions.append(HBGlyphPosition(hb_glyph_positions[i]))
         return positions
 
+    def get_glyph_positions_array(self):
+        """Returns the glyph positions of the buffer as a numpy structured
+        array.
+        The returned array is a view over the internal memory of the buffer.
+        It becomes invalid when the buffer is modified or destroyed.
+
+        Returns:
+            numpy.ndarray: An array of HB_GLYPH_POSITION_DTYPE.
+        """
+        length = ffi.new('unsigned int *')
+        hb_glyph_positions = lib.hb_buffer_get_glyph_positions(
+            self._buffer, length)
+        return _as_structured_array(hb_glyph_positions,
+                                    length[0],
+                                    HB_GLYPH_POSITION_DTYPE)
+
     def get_language(self):
         language = lib.hb_buffer_get_language(self._buffer)
         return HBLanguage(language)
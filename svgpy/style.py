@@ -13,6 +13,10 @@
 # limitations under the License.
 
 
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from logging import getLogger
 
 from lxml import cssselect, etree
@@ -69,9 +73,22 @@ symbol {
 # }
 # '''
 
+# the combinators that make a selector depend on the siblings
+_RE_SIBLING_COMBINATOR = re.compile(r'[+~](?!=)')
+
 logger = getLogger(__name__)
 
 
+class _StyleContext(threading.local):
+    """Holds the shared styles of the current thread."""
+
+    def __init__(self):
+        self.styles = None
+
+
+_style_context = _StyleContext()
+
+
 def flatten_css_rules(element, css_rules):
     doc = element.owner_document
     win = doc.default_view if doc is not None else None
@@ -110,7 +127,34 @@ def flatten_css_rules(element, css_rules):
     return flattened
 
 
+def has_sibling_selectors(css_rules):
+    """Returns True if any of the style rules has a selector that depends on
+    the preceding siblings of the elements ('+' or '~' combinator).
+
+    Arguments:
+        css_rules (list[CSSRule]): A list of the CSS rules.
+    Returns:
+        bool: True if the style of an element may depend on the attributes
+            of its siblings.
+    """
+    return any(css_rule.type == CSSRule.STYLE_RULE
+               and _RE_SIBLING_COMBINATOR.search(css_rule.selector_text)
+               for css_rule in css_rules)
+
+
 def get_css_rules(element):
+    styles = _style_context.styles
+    if styles is not None:
+        key = 'css_rules', element.getroottree().getroot()
+        css_rules = styles.get(key)
+        if css_rules is None:
+            css_rules = _get_css_rules(element)
+            styles[key] = css_rules
+        return css_rules
+    return _get_css_rules(element)
+
+
+def _get_css_rules(element):
     css_rules = list()
     style_sheets = get_css_style_sheets(element)
     for css_style_sheet in style_sheets:
@@ -265,7 +309,29 @@ def get_css_style_sheets_from_xml_stylesheet(root):
     return style_sheets
 
 
+@lru_cache(maxsize=1024)
+def _compile_selector(selector_text, namespaces):
+    # matches the element itself, instead of the descendant-or-self elements
+    # of it
+    path = cssselect.LxmlTranslator().css_to_xpath(selector_text,
+                                                   prefix='self::')
+    return etree.XPath(path, namespaces=dict(namespaces))
+
+
 def get_css_style(element, css_rules):
+    styles = _style_context.styles
+    if styles is not None:
+        # shares the results for the style rules that are shared
+        key = 'css_style', element, id(css_rules)
+        cached = styles.get(key)
+        if cached is None:
+            cached = _get_css_style(element, css_rules)
+            styles[key] = cached
+        return dict(cached[0]), dict(cached[1])
+    return _get_css_style(element, css_rules)
+
+
+def _get_css_style(element, css_rules):
     style = dict()
     style_important = dict()
     namespaces = element.nsmap.copy()
@@ -275,10 +341,10 @@ def get_css_style(element, css_rules):
     for css_rule in css_rules:
         if css_rule.type == CSSRule.STYLE_RULE:
             try:
-                selector = cssselect.CSSSelector(css_rule.selector_text,
-                                                 namespaces=namespaces)
-                matched = selector(element)
-                if len(matched) > 0 and element in matched:
+                selector = _compile_selector(
+                    css_rule.selector_text,
+                    tuple(sorted(namespaces.items())))
+                if len(selector(element)) > 0:
                     for key, value in css_rule.style.items():
                         style[key] = value
                         priority = css_rule.style.get_property_priority(key)
@@ -305,3 +371,33 @@ def get_css_style(element, css_rules):
                     prefix = 'svg'
                 namespaces[prefix] = css_rule.namespace_uri
     return style, style_important
+
+
+@contextmanager
+def shared_styles(styles=None):
+    """Shares the style sheets and the cascaded styles of the elements in
+    the current thread while the context is active. The style sheets are
+    parsed, and the style rules are matched against each element, only once.
+    The trees must not be modified while the context is active.
+
+    Arguments:
+        styles (dict, optional): The shared styles that are returned by a
+            previous context. If not specified, the shared styles of the
+            enclosing context, or a new dict, are used.
+    Returns:
+        dict: The shared styles.
+
+    Examples:
+        >>> from svgpy.style import shared_styles
+        >>> with shared_styles():
+        ...     styles = [element.get_computed_style()
+        ...               for element in root.iter(SVGElement)]
+    """
+    previous = _style_context.styles
+    if styles is None:
+        styles = previous if previous is not None else dict()
+    _style_context.styles = styles
+    try:
+        yield styles
+    finally:
+        _style_context.styles = previous
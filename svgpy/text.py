@@ -15,17 +15,71 @@
 
 import copy
 
+import numpy as np
+
 from .base import SVGElement, SVGGraphicsElement, SVGPathDataSettings
-from .core import CSSUtils, Font, SVGLength
+from .core import CSSUtils, Font, SVGLength, _shaping_context
 from .dom import Element, Node
 from .freetype import FreeType
 from .geometry.matrix import DOMMatrix
 from .geometry.rect import DOMRect
-from .harfbuzz import HBBuffer, HBDirection, HBFeature, HBFTFont, HBLanguage, \
-    HBScript
-from .icu import UBiDi, UBreakIterator, ULocale
-from .opentype import features_from_style, iso639_codes_from_language_tag
+from .harfbuzz import HBFeature
+from .icu import UBiDi
+from .opentype import features_from_style
 from .path import PathParser
+from .utils import TreeContext
+
+# document white space characters: tab, line feed, carriage return and space
+_WHITE_SPACE_CODE_POINTS = [0x09, 0x0A, 0x0D, 0x20]
+
+
+def _accumulate_positions(values, increments, initial):
+    """Returns the running positions of the glyphs.
+    The position restarts from values[i] if it is not NaN, otherwise it
+    continues from the previous position.
+    """
+    sums = np.cumsum(increments)
+    defined = ~np.isnan(values)
+    if not defined.any():
+        return initial + sums
+    indices = np.where(defined, np.arange(len(values)), -1)
+    np.maximum.accumulate(indices, out=indices)
+    bases = np.where(indices >= 0,
+                     values[indices] - (sums - increments)[indices],
+                     initial)
+    return bases + sums
+
+
+def _get_glyph_bounds(bboxes, origin_x, origin_y, rotates):
+    """Returns the bounds of the glyph bounding boxes that are rotated around
+    the glyph origins.
+    """
+    x, y, width, height = bboxes
+    valid = (width > 0) & (height > 0)
+    left = x
+    top = y
+    right = np.where(valid, x + width, x)
+    bottom = np.where(valid, y + height, y)
+    rotated = valid & (rotates != 0)
+    if rotated.any():
+        radians = np.radians(rotates[rotated])
+        cos = np.cos(radians)
+        sin = np.sin(radians)
+        ox = origin_x[rotated]
+        oy = origin_y[rotated]
+        px = np.stack((left[rotated], right[rotated],
+                       right[rotated], left[rotated])) - ox
+        py = np.stack((top[rotated], top[rotated],
+                       bottom[rotated], bottom[rotated])) - oy
+        rx = ox + px * cos - py * sin
+        ry = oy + px * sin + py * cos
+        left = left.copy()
+        top = top.copy()
+        left[rotated] = rx.min(axis=0)
+        top[rotated] = ry.min(axis=0)
+        right[rotated] = rx.max(axis=0)
+        bottom[rotated] = ry.max(axis=0)
+    return left, top, right, bottom
 
 
 class SVGTextContentElement(SVGGraphicsElement):
@@ -39,14 +93,72 @@ class SVGTextContentElement(SVGGraphicsElement):
     _CHARS_BBOX = 5
     _CHARS_ELEMENT = 6
 
-    def _get_chars_info(self):
+    _LAYOUT_CHARS = 0
+    _LAYOUT_METRICS = 1
+    _LAYOUT_RENDER = 2
+
+    def _get_chars_info(self, level=_LAYOUT_RENDER):
+        """Returns the addressable characters of the nearest text element.
+        The result is cached on the text element and shared with its
+        descendants.
+
+        Arguments:
+            level (int, optional): The level of the layout.
+                _LAYOUT_CHARS: The characters only.
+                _LAYOUT_METRICS: The characters, the advances and the bounding
+                boxes.
+                _LAYOUT_RENDER: The metrics and the path data.
+        Returns:
+            list: The addressable characters.
+        """
         root = self.get_nearest_text_element()
         if root is None:
             return []
 
-        chars_info = SVGTextContentElement._get_descendant_chars_info(
-            root, first=True, is_display=True, is_render=True)
-        return chars_info
+        key = SVGTextContentElement._get_layout_key(root)
+        cache = TreeContext.of(root).lookup(root, 'text_layout',
+                                            lambda _: [None])
+        layout = cache[0]
+        if layout is None or layout[0] != key or layout[1] < level:
+            chars_info = SVGTextContentElement._get_descendant_chars_info(
+                root,
+                first=True,
+                is_display=True,
+                is_measure=level >= SVGTextContentElement._LAYOUT_METRICS,
+                is_render=level >= SVGTextContentElement._LAYOUT_RENDER)
+            layout = key, level, chars_info
+            cache[0] = layout
+        return layout[2]
+
+    @staticmethod
+    def _get_layout_key(root):
+        """Returns a key to validate the cached layout of the text element.
+
+        The key changes when the text, the attributes (including the inline
+        style) or the structure of the subtree of the text element, the
+        attributes of its ancestors or the embedded style sheets of the
+        document are changed.
+
+        Arguments:
+            root (SVGElement): The text element.
+        Returns:
+            tuple: A key of the layout.
+        """
+        key = list()
+        for element in root.iter():
+            key.append((element,
+                        tuple(element.attrib.items())
+                        if element.node_type == Node.ELEMENT_NODE else None,
+                        element.text,
+                        element.tail if element is not root else None))
+        parent = root.getparent()
+        while parent is not None:
+            key.append((parent, tuple(parent.attrib.items())))
+            parent = parent.getparent()
+        document_element = root.getroottree().getroot()
+        for element in document_element.iter(tag='{*}style'):
+            key.append((element, element.text))
+        return tuple(key)
 
     @staticmethod
     def _get_descendant_chars(element, style_map=None,
@@ -141,6 +253,8 @@ class SVGTextContentElement(SVGGraphicsElement):
             **kwargs: See below.
         Keyword Arguments:
             is_display (bool, optional):
+            is_measure (bool, optional): If True, computes the advances and
+                the bounding boxes without the path data.
             is_render (bool, optional):
         Returns:
             list[list[int, str, dict, list[SVGPathSegment], list[float],
@@ -158,7 +272,8 @@ class SVGTextContentElement(SVGGraphicsElement):
             item[SVGTextContentElement._CHARS_TEXT] = text
 
             is_render = kwargs.get('is_render', False)
-            if is_render:
+            is_measure = kwargs.get('is_measure', False)
+            if is_render or is_measure:
                 style = chars_info[0][SVGTextContentElement._CHARS_STYLE]
                 x_list = style['x']
                 if x_list is None:
@@ -174,25 +289,113 @@ class SVGTextContentElement(SVGGraphicsElement):
                 style_map = dict()
                 for info in iter(chars_info):
                     key = info[SVGTextContentElement._CHARS_ID]
-                    style = info[SVGTextContentElement._CHARS_STYLE]
-                    style_map[key] = copy.deepcopy(style)
+                    style_map[key] = info[SVGTextContentElement._CHARS_STYLE]
+                char_positions = \
+                    SVGTextContentElement._resolve_char_positions(
+                        chars_info, style_map)
 
+                start = 0
                 for info in iter(chars_info):
+                    out_text = info[SVGTextContentElement._CHARS_TEXT]
+                    end = start + len(out_text)
                     path_data, advance_list, bbox, (x, y) = \
                         SVGTextContentElement._get_text_path_data(
                             info[SVGTextContentElement._CHARS_ELEMENT],
                             style_map,
-                            info[SVGTextContentElement._CHARS_TEXT],
-                            x, y)
+                            out_text,
+                            x, y,
+                            char_positions[:, start:end],
+                            is_render)
                     info[SVGTextContentElement._CHARS_PATH_DATA] = path_data
                     info[SVGTextContentElement._CHARS_ADVANCE_LIST] = \
                         advance_list
                     info[SVGTextContentElement._CHARS_BBOX] = bbox
+                    start = end
 
         return chars_info
 
     @staticmethod
-    def _get_text_path_data(element, style_map, out_text, start_x, start_y):
+    def _resolve_char_positions(chars_info, style_map):
+        """Resolves the 'x', 'y', 'dx', 'dy' and 'rotate' attributes of the
+        text content elements to the addressable characters.
+
+        Arguments:
+            chars_info (list): The addressable characters.
+            style_map (dict): The computed styles.
+        Returns:
+            numpy.ndarray: A 5xN array of the absolute x-coordinates, the
+                absolute y-coordinates, the shifts along the x-axis, the
+                shifts along the y-axis and the supplemental rotations of N
+                addressable characters.
+                An unspecified absolute coordinate is NaN.
+        """
+        # character range of each element: [start, end, depth, element]
+        # a space that is collapsed between two text chunks belongs to the
+        # nearest common ancestor of both chunks.
+        ranges = dict()
+        start = 0
+        prev_ancestors = None
+        for info in iter(chars_info):
+            out_text = info[SVGTextContentElement._CHARS_TEXT]
+            element = info[SVGTextContentElement._CHARS_ELEMENT]
+            ancestors = list()
+            while element is not None:
+                ancestors.append(element)
+                if element.local_name == 'text':
+                    break
+                element = element.getparent()
+            ancestors.reverse()
+            segments = list()
+            if (prev_ancestors is not None
+                    and out_text.startswith(' ')
+                    and info[SVGTextContentElement._CHARS_STYLE][
+                        'white-space'] not in ['pre', 'pre-wrap']):
+                common = list()
+                for ancestor, prev_ancestor in zip(ancestors, prev_ancestors):
+                    if ancestor is not prev_ancestor:
+                        break
+                    common.append(ancestor)
+                segments.append((common, start + 1))
+            segments.append((ancestors, start + len(out_text)))
+            for segment_ancestors, end in segments:
+                if end == start:
+                    continue
+                for depth, element in enumerate(segment_ancestors):
+                    item = ranges.get(hash(element))
+                    if item is None:
+                        ranges[hash(element)] = [start, end, depth, element]
+                    else:
+                        item[1] = end
+                start = end
+            prev_ancestors = ancestors
+
+        # an element overrides the values of its ancestors
+        char_positions = np.zeros((5, start))
+        char_positions[:2] = np.nan
+        for start, end, _, element in sorted(ranges.values(),
+                                             key=lambda x: (x[0], x[2])):
+            if (element.node_type != Node.ELEMENT_NODE
+                    or not element.istext()
+                    or not element.isdisplay()):
+                continue
+            style = style_map.get(hash(element))
+            if style is None:
+                style = element.get_computed_style()
+                style_map[hash(element)] = style
+            for row, key in enumerate(['x', 'y', 'dx', 'dy', 'rotate']):
+                values = style.get(key)
+                if values is None or len(values) == 0:
+                    continue
+                length = min(len(values), end - start)
+                char_positions[row, start:start + length] = values[:length]
+                if key == 'rotate' and length < end - start:
+                    # the last rotation applies to the remaining characters
+                    char_positions[row, start + length:end] = values[-1]
+        return char_positions
+
+    @staticmethod
+    def _get_text_path_data(element, style_map, out_text, start_x, start_y,
+                            char_positions, is_render=True):
         """Returns the addressable characters.
 
         Arguments:
@@ -201,42 +404,26 @@ class SVGTextContentElement(SVGGraphicsElement):
             out_text (str): A text for rendering.
             start_x (float):
             start_y (float):
+            char_positions (numpy.ndarray): The resolved positioning of
+                'out_text'. See SVGTextContentElement._resolve_char_positions.
+            is_render (bool, optional): If False, returns an empty path data
+                without loading the glyph outlines.
         Returns:
             list[SVGPathSegment]:
             list[float]:
             DOMRect:
             tuple[float, float]:
         """
-
-        def _get_inherited_attribute(_element, _style_map, _key,
-                                     _default=None):
-            while _element is not None:
-                if (_element.node_type == Node.ELEMENT_NODE
-                        and _element.istext()
-                        and _element.isdisplay()):
-                    _style = _style_map.get(hash(_element))
-                    if _style is None:
-                        _style = _element.get_computed_style()
-                        _style_map[hash(_element)] = _style
-                    _value = _style.get(_key)
-                    if _value is not None:
-                        return _value
-                _element = _element.getparent()
-            return _default
-
         # TODO: support line-breaking and word-breaking.
-        x_list = _get_inherited_attribute(element, style_map, 'x', [])
-        y_list = _get_inherited_attribute(element, style_map, 'y', [])
-        dx_list = _get_inherited_attribute(element, style_map, 'dx', [])
-        dy_list = _get_inherited_attribute(element, style_map, 'dy', [])
-        rotate_list = _get_inherited_attribute(
-            element, style_map, 'rotate', [])
+        x_list, y_list, dx_list, dy_list, rotate_list = char_positions
+        dx_sums = np.concatenate(([0], np.cumsum(dx_list)))
+        dy_sums = np.concatenate(([0], np.cumsum(dy_list)))
 
         style = style_map.get(hash(element))  # computed style
         assert style is not None
         font = Font(element)
         face = font.face
-        hb_font = HBFTFont.create(face)
+        hb_font = font.hb_font
 
         # alignment_baseline = style['alignment-baseline']
         # baseline_shift = style['baseline-shift']
@@ -280,44 +467,13 @@ class SVGTextContentElement(SVGGraphicsElement):
             'horizontal-tb', 'lr', 'lr-tb', 'rl', 'rl-tb'] else False
         sideways = True if writing_mode.startswith('sideways') else False
 
-        buf = HBBuffer.create()
-        buf.set_cluster_level(HBBuffer.CLUSTER_LEVEL_MONOTONE_CHARACTERS)
-        if horizontal:
-            if ltr:
-                hb_direction = HBDirection(HBDirection.HB_DIRECTION_LTR)
-            else:
-                hb_direction = HBDirection(HBDirection.HB_DIRECTION_RTL)
-        else:
-            hb_direction = HBDirection(HBDirection.HB_DIRECTION_TTB)
-        buf.set_direction(hb_direction)
-
-        locale = None
-        font_language_override = style['font-language-override']
-        if font_language_override != 'normal':
-            codes = iso639_codes_from_language_tag(font_language_override)
-            if codes is not None:
-                # FIXME: use correct language code.
-                locale = ULocale(codes[0])
-        else:
-            xml_lang = style.get(Element.XML_LANG)
-            if xml_lang is None:
-                xml_lang = style.get('lang')
-            if xml_lang is not None:
-                locale = ULocale(xml_lang)
-        if locale is None:
-            locale = ULocale.get_default()
-        hb_language = HBLanguage.fromstring(locale.get_language())
-        buf.set_language(hb_language)
-        script = locale.get_script()
-        if script is not None and len(script) == 4:
-            hb_script = HBScript.fromstring(script)
-            buf.set_script(hb_script)
-        else:
-            hb_script = buf.get_script()
+        locale, hb_language, hb_script = _shaping_context.get_language(
+            style)
 
         current_x = start_x
         current_y = start_y
-        rotate = 0
+        pending_dx = 0
+        pending_dy = 0
         matrix = DOMMatrix()
         path_data_list = list()
         advance_list = list()
@@ -326,147 +482,160 @@ class SVGTextContentElement(SVGGraphicsElement):
         glyph_width = metrics.x_ppem
         glyph_height = metrics.height / 64
         descender = metrics.descender / 64
+        load_flags = FreeType.FT_LOAD_NO_BITMAP
+        if not horizontal:
+            load_flags |= FreeType.FT_LOAD_VERTICAL_LAYOUT
 
-        para = UBiDi()
+        para = _shaping_context.bidi
         para.set_para(out_text,
                       UBiDi.UBIDI_DEFAULT_LTR if ltr
                       else UBiDi.UBIDI_DEFAULT_RTL)
         max_limit = para.get_processed_length()
-        bi = UBreakIterator(UBreakIterator.UBRK_LINE, locale.locale)
+        bi = _shaping_context.get_line_break_iterator(locale.locale)
         logical_start = 0
         while logical_start < max_limit:
             limit, para_level = para.get_logical_run(logical_start)
             para_level &= 1
             paragraph = out_text[logical_start:limit]
             bi.set_text(paragraph)
-            if ((not ltr and para_level == UBiDi.UBIDI_LTR)
-                    or (ltr and para_level == UBiDi.UBIDI_RTL)):
-                iterable = reversed(bi)
-            else:
-                iterable = bi
-            for line in iterable:
-                buf.clear_contents()
-                buf.set_language(hb_language)
-                buf.set_script(hb_script)
-                buf.add_utf8(line)
-                buf.guess_segment_properties()
-                buf.shape(hb_font, hb_features)
-                infos = buf.get_glyph_infos()
-                positions = buf.get_glyph_positions()
-                if infos[0].cluster > infos[-1].cluster:
-                    infos = list(reversed(infos))
-                    positions = list(reversed(positions))
-
-                # re-positioning
-                if len(infos) != len(line):
-                    clusters = [x.cluster for x in infos]
-                    cluster_min = min(clusters)
-                    cluster_max = max(clusters)
-                    cluster_inc = max(
-                        (cluster_max - cluster_min) // len(clusters), 1)
-                    # try to find ligatures
-                    last_cluster = None
-                    for offset, cluster in enumerate(clusters):
-                        if last_cluster is None:
-                            pass
-                        elif last_cluster == cluster:
-                            pass  # decompose
-                        elif last_cluster + cluster_inc == cluster:
-                            pass  # do nothing
-                        else:
-                            # ligature
-                            index = logical_start + offset
-                            if index < len(x_list):
-                                _ = x_list.pop(index)
-                            if index < len(y_list):
-                                _ = y_list.pop(index)
-                            dx_length = len(dx_list)
-                            if index < dx_length:
-                                dx = dx_list.pop(index)
-                                if index < dx_length - 1:
-                                    dx_list[index] += dx
-                            dy_length = len(dy_list)
-                            if index < dy_length:
-                                dy = dy_list.pop(index)
-                                if index < dy_length - 1:
-                                    dy_list[index] += dy
-                            rotate_length = len(rotate_list)
-                            if rotate_length > 1 and index < rotate_length:
-                                _ = rotate_list.pop(index)
-                        last_cluster = cluster
+            lines = list()
+            line_start = logical_start
+            for line in bi:
+                lines.append((line_start, line))
+                line_start += len(line)
+            reverse_line = ((not ltr and para_level == UBiDi.UBIDI_LTR)
+                            or (ltr and para_level == UBiDi.UBIDI_RTL))
+            if reverse_line:
+                lines.reverse()
+            for line_start, line in lines:
+                buf = _shaping_context.shape(line, hb_font, hb_features,
+                                             hb_language, hb_script)
+                infos = buf.get_glyph_infos_array()
+                positions = buf.get_glyph_positions_array()
+                if infos['cluster'][0] > infos['cluster'][-1]:
+                    infos = infos[::-1]
+                    positions = positions[::-1]
+                number_of_glyphs = len(infos)
+
+                # map clusters (UTF-8 byte offsets) to character indices
+                clusters = infos['cluster'].astype(np.int64)
+                code_points = np.frombuffer(
+                    line.encode('utf-32-le', 'surrogatepass'),
+                    dtype='<u4')
+                utf8_lengths = (1
+                                + (code_points >= 0x80).astype(np.int64)
+                                + (code_points >= 0x800)
+                                + (code_points >= 0x10000))
+                byte_offsets = np.cumsum(utf8_lengths) - utf8_lengths
+                indices = line_start + np.searchsorted(
+                    byte_offsets, clusters, side='right') - 1
+                cluster_starts = np.ones(number_of_glyphs, dtype=bool)
+                cluster_starts[1:] = clusters[1:] != clusters[:-1]
+
+                # resolve the glyph positioning: the first glyph of a cluster
+                # takes the values of the first character of the cluster,
+                # and the relative shifts of the characters that are merged
+                # into a ligature are carried over to the next cluster.
+                glyph_x = np.where(cluster_starts, x_list[indices], np.nan)
+                glyph_y = np.where(cluster_starts, y_list[indices], np.nan)
+                rotates = rotate_list[indices]
+                starts = indices[cluster_starts]
+                previous_starts = np.empty_like(starts)
+                previous_starts[0] = line_start - 1
+                previous_starts[1:] = starts[:-1]
+                glyph_dx = np.zeros(number_of_glyphs)
+                glyph_dy = np.zeros(number_of_glyphs)
+                glyph_dx[cluster_starts] = (dx_sums[starts + 1]
+                                            - dx_sums[previous_starts + 1])
+                glyph_dy[cluster_starts] = (dy_sums[starts + 1]
+                                            - dy_sums[previous_starts + 1])
+                glyph_dx[0] += pending_dx
+                glyph_dy[0] += pending_dy
+                line_end = line_start + len(line)
+                pending_dx = dx_sums[line_end] - dx_sums[starts[-1] + 1]
+                pending_dy = dy_sums[line_end] - dy_sums[starts[-1] + 1]
+
+                x_offsets = positions['x_offset'] / 64
+                y_offsets = positions['y_offset'] / 64
+                zeros = np.zeros(number_of_glyphs)
+                if horizontal:
+                    advances = positions['x_advance'] / 64
+                    x_advances = advances
+                    y_advances = zeros
+                else:
+                    advances = -positions['y_advance'] / 64
+                    x_advances = zeros
+                    y_advances = advances
+                if horizontal and para_level == UBiDi.UBIDI_RTL:
+                    pre_x = -advances
+                else:
+                    pre_x = zeros
+                if para_level == UBiDi.UBIDI_LTR:
+                    post_x = x_advances - x_offsets
+                else:
+                    post_x = zeros
+                origin_x = _accumulate_positions(
+                    glyph_x,
+                    glyph_dx + x_offsets + pre_x + post_x,
+                    current_x) - post_x
+                origin_y = _accumulate_positions(
+                    glyph_y,
+                    glyph_dy + y_advances,
+                    current_y) - y_advances - y_offsets
+                current_x = float(origin_x[-1] + post_x[-1])
+                current_y = float(
+                    origin_y[-1] + y_advances[-1] + y_offsets[-1])
+                advance_list += advances.tolist()
+
+                # glyph bounding boxes
+                if horizontal:
+                    glyph_bboxes = (origin_x,
+                                    origin_y - glyph_height - descender,
+                                    advances,
+                                    zeros + glyph_height)
+                elif sideways:
+                    # TODO: fix bbox for vertical text.
+                    glyph_bboxes = (origin_x,
+                                    origin_y,
+                                    zeros + glyph_width,
+                                    positions['x_advance'] / 64)
+                else:
+                    glyph_bboxes = (origin_x,
+                                    origin_y + y_offsets,
+                                    zeros + glyph_width,
+                                    advances)
+                left, top, right, bottom = _get_glyph_bounds(
+                    glyph_bboxes, origin_x, origin_y, rotates)
+                line_left = float(left.min())
+                line_right = float(right.max())
+
+                # the glyph cells of white space do not extend the bounding
+                # box, as well as the path data.
+                inked = ~np.isin(code_points[indices - line_start],
+                                 _WHITE_SPACE_CODE_POINTS)
+                if inked.any():
+                    x1 = float(left[inked].min())
+                    y1 = float(top[inked].min())
+                    line_bbox = DOMRect(x1,
+                                        y1,
+                                        float(right[inked].max()) - x1,
+                                        float(bottom[inked].max()) - y1)
+                else:
+                    line_bbox = DOMRect()
 
                 # render line
                 line_path_data = list()
-                line_bbox = DOMRect()
-                for info, position in zip(infos, positions):
-                    if len(x_list) > 0:
-                        x = x_list.pop(0)
-                    else:
-                        x = current_x
-                    if len(y_list) > 0:
-                        y = y_list.pop(0)
-                    else:
-                        y = current_y
-                    if len(dx_list) > 0:
-                        dx = dx_list.pop(0)
-                    else:
-                        dx = 0
-                    if len(dy_list) > 0:
-                        dy = dy_list.pop(0)
-                    else:
-                        dy = 0
-                    rotate_length = len(rotate_list)
-                    if rotate_length == 1:
-                        rotate = rotate_list[0]
-                    elif rotate_length > 1:
-                        rotate = rotate_list.pop(0)
-
-                    x_offset = position.x_offset / 64
-                    y_offset = position.y_offset / 64
-                    x += dx + x_offset
-                    y += dy - y_offset
-                    if horizontal:
-                        advance = position.x_advance / 64
-                        if para_level == UBiDi.UBIDI_RTL:
-                            x -= advance
-                        glyph_bbox = DOMRect(x,
-                                             y - glyph_height - descender,
-                                             advance,
-                                             glyph_height)
-                        x_advance = advance
-                        y_advance = 0
-                    else:
-                        # TODO: fix bbox for vertical text.
-                        advance = -position.y_advance / 64
-                        if sideways:
-                            glyph_bbox = DOMRect(x,
-                                                 y,
-                                                 glyph_width,
-                                                 position.x_advance / 64)
-                        else:
-                            glyph_bbox = DOMRect(x,
-                                                 y - advance + advance + y_offset,
-                                                 glyph_width,
-                                                 advance)
-                        x_advance = 0
-                        y_advance = advance
-                    advance_list.append(advance)
-                    if rotate != 0:
-                        matrix.clear()
-                        matrix.translate_self(x, y)
-                        matrix.rotate_self(rot_z=rotate)
-                        matrix.translate_self(-x, -y)
-                        glyph_bbox.transform_self(matrix)
-
+                glyphs = zip(infos['codepoint'].tolist(),
+                             origin_x.tolist(),
+                             origin_y.tolist(),
+                             rotates.tolist()) if is_render else ()
+                for codepoint, x, y, rotate in glyphs:
                     matrix.clear()
                     if rotate != 0:
                         matrix.rotate_self(rot_z=rotate)
                     matrix.translate_self(x, -y)
 
-                    load_flags = FreeType.FT_LOAD_NO_BITMAP
-                    if not horizontal:
-                        load_flags |= FreeType.FT_LOAD_VERTICAL_LAYOUT
-                    face.load_glyph(info.codepoint, load_flags)
+                    face.load_glyph(codepoint, load_flags)
                     glyph = face.glyph
                     if force_embolden:
                         glyph.embolden()
@@ -476,26 +645,20 @@ class SVGTextContentElement(SVGGraphicsElement):
                     if len(path_data) > 0:
                         line_path_data += path_data
 
-                    if para_level == UBiDi.UBIDI_LTR:
-                        x += x_advance - x_offset
-                    y += y_advance + y_offset
-                    line_bbox |= glyph_bbox
-                    current_x = x
-                    current_y = y
-                if horizontal:
-                    if ((not ltr and para_level == UBiDi.UBIDI_LTR)
-                            or (ltr and para_level == UBiDi.UBIDI_RTL)):
-                        k = -1 if not ltr else 1
-                        width = line_bbox.width
+                if horizontal and reverse_line:
+                    k = -1 if not ltr else 1
+                    width = line_right - line_left
+                    if inked.any():
                         line_bbox.translate_self(k * width, 0)
+                    if len(line_path_data) > 0:
                         matrix.clear()
                         matrix.translate_self(k * width, 0)
-                        line_path_data = PathParser.transform(line_path_data,
-                                                              matrix)
-                        if not ltr:
-                            current_x = line_bbox.left
-                        else:
-                            current_x = line_bbox.right
+                        line_path_data = PathParser.transform(
+                            line_path_data, matrix)
+                    if not ltr:
+                        current_x = line_left - width
+                    else:
+                        current_x = line_right + width
                 path_data_list += line_path_data
                 text_bbox |= line_bbox
 
@@ -615,12 +778,12 @@ class SVGTextContentElement(SVGGraphicsElement):
         Returns:
             str: The addressable characters or None.
         """
-        root = self.get_nearest_text_element()
-        if root is None:
+        if self.get_nearest_text_element() is None:
             return None
 
-        chars_info = SVGTextContentElement._get_descendant_chars_info(
-            root, first=True, is_display=True)
+        chars_info = self._get_chars_info(
+            SVGTextContentElement._LAYOUT_CHARS)
+
         local_name = self.local_name
         if local_name == 'text':
             out = ''.join([x[SVGTextContentElement._CHARS_TEXT]
@@ -636,12 +799,7 @@ class SVGTextContentElement(SVGGraphicsElement):
         return None
 
     def get_nearest_text_element(self):
-        element = self
-        while element is not None:
-            if element.local_name == 'text':
-                return element
-            element = element.getparent()
-        return None
+        return self._lookup_ancestor(('text',))
 
     def get_number_of_chars(self):
         """Returns the total number of addressable characters available for
@@ -682,12 +840,11 @@ class SVGTextContentElement(SVGGraphicsElement):
         return path_data
 
     def get_sub_string_length(self, char_num=0, nchars=-1):
-        root = self.get_nearest_text_element()
-        if root is None:
+        if self.get_nearest_text_element() is None:
             return 0
 
-        chars_info = SVGTextContentElement._get_descendant_chars_info(
-            root, first=True, is_display=True, is_render=True)
+        chars_info = self._get_chars_info(
+            SVGTextContentElement._LAYOUT_METRICS)
         local_name = self.local_name
         advance_list = list()
         if local_name == 'text':
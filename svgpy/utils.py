@@ -14,17 +14,25 @@
 
 
 import base64
+import itertools
 import os
 import re
+import threading
+import weakref
 from collections.abc import MutableMapping
+from functools import lru_cache
 from pathlib import PurePath
 from urllib.parse import unquote
 from urllib.request import urlopen
 
+from lxml import etree
+
 from .url import Location, URL
 
 _ASCII_WHITESPACE = '\t\n\f\r\x20'
 
+_XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+
 _RE_QUALIFIED_NAME = re.compile(
     r'{(?P<namespace>[^}]*)}(?P<local_name>.*)')
 
@@ -70,6 +78,12 @@ def get_element_by_id(element, element_id, nsmap=None):
         Element: The first matching sub-element. Returns None if there is
             no such element.
     """
+    found = ElementIndex.of(element).get_element_by_id(element_id)
+    if found is None:
+        return None
+    elif found is element or element in found.iterancestors():
+        return found
+    # the first matching element of the tree is not in the subtree
     elements = element.xpath('descendant-or-self::*[@id = $element_id]',
                              namespaces=nsmap,
                              element_id=element_id)
@@ -92,6 +106,10 @@ def get_elements_by_class_name(element, class_names, nsmap=None,
     names = class_names.split()
     if len(names) == 0:
         return []
+    elements = ElementIndex.of(element).get_elements_by_class_name(
+        element, names, include_self=include_self)
+    if elements is not None:
+        return elements
     if include_self:
         axis = 'descendant-or-self'
     else:
@@ -116,6 +134,15 @@ def get_elements_by_tag_name(element, qualified_name, nsmap=None,
     Returns:
         list[Element]: A list of elements.
     """
+    if qualified_name != '*':
+        local_name = qualified_name.rpartition(':')[2]
+        elements = ElementIndex.of(element).get_elements_by_local_name(
+            element, local_name, include_self=include_self)
+        if elements is not None:
+            return [x for x in elements
+                    if (local_name if x.prefix is None
+                        else '{}:{}'.format(x.prefix, local_name))
+                    == qualified_name]
     if include_self:
         axis = 'descendant-or-self'
     else:
@@ -142,6 +169,14 @@ def get_elements_by_tag_name_ns(element, namespace, local_name,
     Returns:
         list[Element]: A list of elements.
     """
+    if local_name != '*':
+        elements = ElementIndex.of(element).get_elements_by_local_name(
+            element, local_name, include_self=include_self)
+        if elements is not None:
+            if namespace is None or namespace == '*':
+                return elements
+            return [x for x in elements
+                    if etree.QName(x).namespace == namespace]
     if include_self:
         axis = 'descendant-or-self'
     else:
@@ -201,6 +236,45 @@ def load(src, encoding=None, **kwargs):
         return data, headers
 
 
+def load_chunks(src, chunk_size=65536, **kwargs):
+    """Opens the resource, and returns the response headers and an iterator
+    that reads the content in chunks as they arrive.
+
+    Arguments:
+        src (str, URL): An URL of the resource.
+        chunk_size (int, optional): The maximum size of a chunk in bytes.
+        **kwargs: See urllib.request.urlopen().
+    Returns:
+        iterator[bytes]: An iterator of the content. The response is closed
+            when the iterator is exhausted or closed.
+        CaseInsensitiveMapping: The response headers.
+    """
+    if isinstance(src, URL):
+        url = src
+    elif isinstance(src, str):
+        url = URL(src)
+    else:
+        raise TypeError('Expected str or URL, got {}'.format(src))
+    if url.protocol == 'data:':
+        data, headers = load(url)
+        return iter([] if data is None else [data]), headers
+
+    response = urlopen(url.href, **kwargs)
+    headers = CaseInsensitiveMapping()
+    if hasattr(response, 'getheaders'):
+        headers.update(response.getheaders())
+
+    def _read_chunks():
+        with response:
+            while True:
+                chunk = response.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+
+    return _read_chunks(), headers
+
+
 def normalize_url(src, base=None):
     """Normalizes an URL.
 
@@ -228,8 +302,19 @@ def remove_quotes(src):
     return src
 
 
+@lru_cache(maxsize=4096)
+def _parse_style(text):
+    items = [x.split(':') for x in iter(text.strip().split(';'))]
+    if [''] in items:
+        items.remove([''])
+    return tuple(dict((key.strip(), value.strip())
+                      for key, value in iter(items)).items())
+
+
 def style_to_dict(text):
     """Converts the style attribute's value to a dictionary.
+    The parsed declarations are cached by the value, and a new dictionary is
+    returned for each call.
 
     Arguments:
         text (str): The style attributes's value to be converted.
@@ -238,10 +323,7 @@ def style_to_dict(text):
     """
     if text is None:
         return {}
-    items = [x.split(':') for x in iter(text.strip().split(';'))]
-    if [''] in items:
-        items.remove([''])
-    return {key.strip(): value.strip() for key, value in iter(items)}
+    return dict(_parse_style(text))
 
 
 class CaseInsensitiveMapping(MutableMapping):
@@ -283,6 +365,219 @@ class CaseInsensitiveMapping(MutableMapping):
         return key.lower() if isinstance(key, str) else key
 
 
+class ElementIndex(object):
+    """Maps the ids, the class names and the local names to the elements of
+    a tree.
+
+    The index is stored in the context of the tree (see TreeContext), which
+    hands it over to the next context of the same root element, and is built
+    lazily on first lookup. The DOM mutation methods keep the id index
+    current, and a lookup that misses or finds a stale entry rebuilds it, so
+    that the id index also recovers from raw lxml mutations.
+
+    The class name and local name indexes are optional. They are discarded by
+    the DOM mutation methods and rebuilt on the next query, but elements
+    added to the tree by raw lxml mutations are not detected. Enable them
+    only for trees that are modified through the DOM methods.
+    """
+
+    INDEXED_ATTRIBUTES = ('class', 'id')
+
+    # The default value of ElementIndex.use_name_indexes.
+    use_name_indexes = False
+
+    def __init__(self, root):
+        """Constructs an ElementIndex object.
+
+        Arguments:
+            root (Element): The root element of the tree.
+        """
+        self._root = root
+        self._ids = None
+        self._class_names = None
+        self._local_names = None
+
+    @staticmethod
+    def of(element):
+        """Returns the index of the tree that contains the element.
+
+        Arguments:
+            element (Element): An element of the tree.
+        Returns:
+            ElementIndex: The index of the tree.
+        """
+        context = TreeContext.of(element)
+        index = context._element_index
+        if index is None:
+            index = ElementIndex(context._root)
+            context._element_index = index
+        return index
+
+    def _build_ids(self):
+        ids = dict()
+        for element in self._root.iter(etree.Element):
+            element_id = element.get('id')
+            if element_id is not None and element_id not in ids:
+                ids[element_id] = element
+        self._ids = ids
+
+    def _build_names(self):
+        class_names = dict()
+        local_names = dict()
+        for element in self._root.iter(etree.Element):
+            local_name = etree.QName(element).localname
+            local_names.setdefault(local_name, []).append(element)
+            for class_name in set(element.get('class', '').split()):
+                class_names.setdefault(class_name, []).append(element)
+        self._class_names = class_names
+        self._local_names = local_names
+
+    @staticmethod
+    def _in_subtree(element, root, include_self):
+        if element is root:
+            return include_self
+        return root in element.iterancestors()
+
+    def _is_valid(self, element, element_id):
+        return (element.get('id') == element_id
+                and (element is self._root
+                     or self._root in element.iterancestors()))
+
+    def clear(self):
+        """Discards the index. It is rebuilt on the next lookup."""
+        self._ids = None
+        self._class_names = None
+        self._local_names = None
+
+    def get_element_by_id(self, element_id):
+        """Finds the first matching element of the tree, by id.
+
+        Arguments:
+            element_id (str): The id of the element.
+        Returns:
+            Element: The first matching element. Returns None if there is no
+                such element.
+        """
+        if self._ids is not None:
+            element = self._ids.get(element_id)
+            if element is not None and self._is_valid(element, element_id):
+                return element
+        self._build_ids()
+        return self._ids.get(element_id)
+
+    def get_elements_by_class_name(self, root, class_names,
+                                   include_self=False):
+        """Finds all matching elements of the subtree, by class names.
+
+        Arguments:
+            root (Element): The root element of the subtree.
+            class_names (list[str]): A list of class names.
+            include_self (bool, optional): If True, includes the root element
+                of the subtree.
+        Returns:
+            list[Element]: A list of elements in document order. Returns None
+                if the name indexes are disabled.
+        """
+        if not self.use_name_indexes:
+            return None
+        if self._class_names is None:
+            self._build_names()
+        candidates = [self._class_names.get(x, []) for x in class_names]
+        names = set(class_names)
+        return [element for element in min(candidates, key=len)
+                if names.issubset(element.get('class', '').split())
+                and self._in_subtree(element, root, include_self)]
+
+    def get_elements_by_local_name(self, root, local_name,
+                                   include_self=False):
+        """Finds all matching elements of the subtree, by the local name.
+
+        Arguments:
+            root (Element): The root element of the subtree.
+            local_name (str): The local name.
+            include_self (bool, optional): If True, includes the root element
+                of the subtree.
+        Returns:
+            list[Element]: A list of elements in document order. Returns None
+                if the name indexes are disabled.
+        """
+        if not self.use_name_indexes:
+            return None
+        if self._local_names is None:
+            self._build_names()
+        return [element for element in self._local_names.get(local_name, [])
+                if etree.QName(element).localname == local_name
+                and self._in_subtree(element, root, include_self)]
+
+    def insert_subtree(self, element):
+        """Updates the index for the subtree that has been inserted into the
+        tree.
+
+        Arguments:
+            element (Element): The root of the inserted subtree.
+        """
+        self._class_names = None
+        self._local_names = None
+        ids = self._ids
+        if ids is None:
+            return
+        for child in element.iter(etree.Element):
+            element_id = child.get('id')
+            if element_id is None:
+                continue
+            other = ids.get(element_id)
+            if other is None or not self._is_valid(other, element_id):
+                ids[element_id] = child
+            elif other is not child:
+                # duplicated id: needs the document order
+                self._ids = None
+                return
+
+    def remove_subtree(self, element):
+        """Updates the index for the subtree that is being removed from the
+        tree.
+
+        Arguments:
+            element (Element): The root of the subtree to be removed.
+        """
+        self._class_names = None
+        self._local_names = None
+        ids = self._ids
+        if ids is None:
+            return
+        for child in element.iter(etree.Element):
+            element_id = child.get('id')
+            if element_id is not None and ids.get(element_id) is child:
+                del ids[element_id]
+
+    def set_attribute(self, element, name, old_value, new_value):
+        """Updates the index for the attribute of the element.
+
+        Arguments:
+            element (Element): An element of the tree.
+            name (str): The qualified name of the attribute.
+            old_value (str, None): The previous value of the attribute.
+            new_value (str, None): The new value of the attribute.
+        """
+        if name == 'class':
+            self._class_names = None
+            return
+        ids = self._ids
+        if name != 'id' or ids is None or old_value == new_value:
+            return
+        if old_value is not None and ids.get(old_value) is element:
+            del ids[old_value]
+        if new_value is not None:
+            other = ids.get(new_value)
+            if (other is None
+                    or other is element
+                    or not self._is_valid(other, new_value)):
+                ids[new_value] = element
+            else:
+                # duplicated id: needs the document order
+                self._ids = None
+
+
 class QualifiedName(object):
     """Utility class for the qualified name."""
 
@@ -345,3 +640,295 @@ class QualifiedName(object):
     def namespace_uri(self):
         """str: The namespace URI or None."""
         return self._namespace
+
+
+class TreeContext(object):
+    """Caches the owner document, the ancestor lookups and the geometry of
+    the elements of a tree.
+
+    The context of a tree is held by the root element of the tree and by
+    every element that it has been looked up for, so it lives as long as
+    the tree is in use and is released with it. The context keeps the
+    looked-up elements (and so their lxml proxies) alive, so that it
+    survives the recreation of the other proxies. Every structural mutation
+    made through the DOM methods, and every change of the associated
+    document, invalidates the contexts of the trees involved. Call
+    TreeContext.invalidate() after moving elements with raw lxml methods
+    that are not reimplemented by Element (e.g., slice assignment).
+
+    The lookups that also depend on the attribute values (e.g., the bounding
+    boxes) are validated on each lookup against the attributes of the
+    element and its ancestors, and against the other state that they depend
+    on (e.g., the attributes of the descendants), so that they also recover
+    from the changes made through lxml.etree._Element.attrib. They are also
+    discarded by TreeContext.touch(), when it is called with the 'style'
+    element after editing a style sheet, or for any element of a tree whose
+    style sheets have selectors that depend on the siblings.
+
+    TreeContext.touch() is called by Element.set() and the other DOM
+    attribute methods, and notifies the observers registered by
+    TreeContext.add_observer() (e.g., the spatial indexes) of the changed
+    element. Call it after changing the attributes through
+    lxml.etree._Element.attrib to notify them.
+    """
+
+    # The contexts of all the trees, which are held by the elements of the
+    # trees.
+    _contexts = weakref.WeakSet()
+
+    # Guards TreeContext._contexts, the creation of the contexts and the
+    # changes of the revisions.
+    _lock = threading.RLock()
+
+    def __init__(self, root):
+        """Constructs a TreeContext object.
+
+        Arguments:
+            root (Element): The root element of the tree.
+        """
+        self._root = root
+        self._element_index = None
+        self._lookups = dict()
+        self._observers = weakref.WeakSet()
+        self._referrers = None
+        self._revision = 0  # the revision of the style sheets
+        self._valid = True
+
+        # True if the style sheets of the tree have selectors that depend on
+        # the siblings (see Element.get_inherited_style())
+        self.has_sibling_selectors = False
+
+    @staticmethod
+    def _attach(element, context):
+        try:
+            element._tree_context = context
+        except AttributeError:
+            pass  # the element is not an instance of svgpy.dom.Element
+
+    @staticmethod
+    def _find(element, root=None):
+        context = getattr(element, '_tree_context', None)
+        if context is not None and context._valid:
+            return context
+        if root is None:
+            root = TreeContext._get_root(element)
+        context = getattr(root, '_tree_context', None)
+        if context is not None and context._valid and context._root is root:
+            return context
+        return None
+
+    @staticmethod
+    def _get_root(element):
+        root = element
+        for root in element.iterancestors():
+            pass
+        return root
+
+    def _get_stamp(self, element):
+        # the state that the volatile lookups of the element depend on
+        return self._revision, tuple(
+            tuple(target.attrib.items())
+            for target in itertools.chain((element,),
+                                          element.iterancestors()))
+
+    def add_observer(self, observer):
+        """Registers an observer of the attribute changes of the tree.
+        The observer is held by a weak reference.
+
+        Arguments:
+            observer (object): An object that has an element_changed(element)
+                method. The method takes the changed element, or None if it
+                is unknown.
+        """
+        self._observers.add(observer)
+
+    def get_referrers(self, element_id):
+        """Returns the elements of the tree that refer to an element by the
+        'href' attribute (e.g., the 'use' elements).
+        The referrers are collected once per tree, and updated by
+        TreeContext.touch().
+
+        Arguments:
+            element_id (str): The id of the referenced element.
+        Returns:
+            list[Element]: A list of the referring elements.
+        """
+        if self._referrers is None:
+            referrers = dict()
+            for element in self._root.iter(etree.Element):
+                href = element.get('href') or element.get(_XLINK_HREF)
+                if href is not None and href.startswith('#'):
+                    referrers.setdefault(href[1:], []).append(element)
+            self._referrers = referrers
+        elements = self._referrers.get(element_id)
+        if elements is None:
+            return []
+        href = '#' + element_id
+        referrers = [element for element in elements
+                     if (element.get('href')
+                         or element.get(_XLINK_HREF)) == href]
+        if len(referrers) != len(elements):
+            self._referrers[element_id] = referrers
+        return referrers
+
+    @staticmethod
+    def invalidate(element=None):
+        """Discards the cached lookups of the tree that contains the element.
+
+        Arguments:
+            element (Element, optional): An element of the tree. If None,
+                discards the cached lookups of all trees.
+        """
+        with TreeContext._lock:
+            if element is None:
+                contexts = list(TreeContext._contexts)
+            else:
+                contexts = [
+                    getattr(element, '_tree_context', None),
+                    getattr(TreeContext._get_root(element), '_tree_context',
+                            None)]
+            for context in contexts:
+                if context is not None:
+                    context._valid = False
+                    TreeContext._contexts.discard(context)
+
+    @staticmethod
+    def of(element):
+        """Returns the context of the tree that contains the element.
+
+        Arguments:
+            element (Element): An element of the tree.
+        Returns:
+            TreeContext: The context of the tree.
+        """
+        context = getattr(element, '_tree_context', None)
+        if context is not None and context._valid:
+            return context
+        root = TreeContext._get_root(element)
+        with TreeContext._lock:
+            context = TreeContext._find(root, root)
+            if context is None:
+                previous = getattr(root, '_tree_context', None)
+                context = TreeContext(root)
+                if previous is not None and previous._root is root:
+                    # the element index is kept current by the DOM methods
+                    context._element_index = previous._element_index
+                TreeContext._attach(root, context)
+                TreeContext._contexts.add(context)
+            TreeContext._attach(element, context)
+        return context
+
+    def lookup(self, element, key, func, volatile=False, state=None):
+        """Returns the cached result of func(element).
+
+        Arguments:
+            element (Element): An element of the tree.
+            key (hashable): The name of the lookup.
+            func (callable): A function that takes the element and returns
+                the result of the lookup.
+            volatile (bool, optional): If True, the result also depends on
+                the attribute values of the element and its ancestors, and
+                is recomputed after they are changed.
+            state (callable, optional): A function that takes the element
+                and returns the other state that the result depends on (e.g.,
+                the attribute values of the descendants). The result is
+                recomputed after the state is changed. Used only if volatile
+                is True.
+        Returns:
+            object: The result of the lookup.
+        """
+        if volatile:
+            stamp = self._get_stamp(element)
+            if state is not None:
+                stamp = stamp, state(element)
+        else:
+            stamp = None
+        lookups = self._lookups.get(element)
+        if lookups is None:
+            lookups = dict()
+            self._lookups[element] = lookups
+        else:
+            entry = lookups.get(key)
+            if entry is not None and entry[1] == stamp:
+                return entry[0]
+        value = func(element)
+        lookups[key] = value, stamp
+        return value
+
+    @staticmethod
+    def release(element):
+        """Discards the cached lookups, the referrers and the index entries
+        of the subtree of the element, which is about to be removed from the
+        tree without the DOM methods (e.g., by SVGParser.iterparse()).
+        Unlike TreeContext.invalidate(), the other lookups of the tree are
+        kept.
+
+        Arguments:
+            element (Element): The root of the subtree to be removed.
+        """
+        if len(TreeContext._contexts) == 0:
+            return
+        context = TreeContext._find(element)
+        if context is None:
+            return
+        with TreeContext._lock:
+            lookups = context._lookups
+            referrers = context._referrers
+            for target in element.iter(etree.Element):
+                lookups.pop(target, None)
+                if referrers is None:
+                    continue
+                href = target.get('href') or target.get(_XLINK_HREF)
+                if href is not None and href.startswith('#'):
+                    elements = referrers.get(href[1:])
+                    if elements is not None and target in elements:
+                        elements.remove(target)
+            if context._element_index is not None:
+                context._element_index.remove_subtree(element)
+
+    def remove_observer(self, observer):
+        """Unregisters an observer of the attribute changes of the tree.
+
+        Arguments:
+            observer (object): An observer registered by
+                TreeContext.add_observer().
+        """
+        self._observers.discard(observer)
+
+    @staticmethod
+    def touch(element=None):
+        """Notifies the observers of the tree that the attributes of the
+        element are changed, and updates the referrers of the tree.
+        Discards the volatile lookups of the tree if a style sheet is
+        changed, or if the tree has selectors that depend on the siblings.
+
+        Arguments:
+            element (Element, optional): The element whose attributes are
+                changed. If None, discards the volatile lookups of all
+                trees.
+        """
+        if element is None:
+            with TreeContext._lock:
+                contexts = list(TreeContext._contexts)
+                for context in contexts:
+                    context._revision += 1
+        elif len(TreeContext._contexts) == 0:
+            return
+        else:
+            context = TreeContext._find(element)
+            if context is None:
+                return
+            with TreeContext._lock:
+                if (context.has_sibling_selectors
+                        or etree.QName(element).localname == 'style'):
+                    context._revision += 1
+                href = element.get('href') or element.get(_XLINK_HREF)
+                if (context._referrers is not None
+                        and href is not None and href.startswith('#')):
+                    referrers = context._referrers.setdefault(href[1:], [])
+                    if element not in referrers:
+                        referrers.append(element)
+            contexts = [context]
+        for context in contexts:
+            for observer in list(context._observers):
+                observer.element_changed(element)
@@ -13,8 +13,10 @@
 # limitations under the License.
 
 
+import threading
 from abc import ABC, abstractmethod
 from collections.abc import Iterable
+from contextlib import contextmanager
 from fractions import Fraction
 from io import StringIO
 from logging import getLogger
@@ -28,9 +30,9 @@ from .element import SVGParser
 from .screen import Screen
 from .style import get_css_style_sheets
 from .url import Location
-from .utils import get_content_type, get_element_by_id, \
+from .utils import TreeContext, get_content_type, get_element_by_id, \
     get_elements_by_class_name, get_elements_by_tag_name, \
-    get_elements_by_tag_name_ns, load, normalize_url
+    get_elements_by_tag_name_ns, load_chunks, normalize_url
 
 
 class BrowsingContext(object):
@@ -47,8 +49,7 @@ class BrowsingContext(object):
         """
         self._document = document
         if window_ is None:
-            global window
-            window_ = window
+            window_ = get_active_window()
         self._window = window_
 
     @property
@@ -771,16 +772,19 @@ class SVGDOMImplementation(DOMImplementation):
             Element: A root element of the document.
         """
         if isinstance(source, str):
-            data, headers = load(source)
+            # parse the response as it arrives
+            chunks, headers = load_chunks(source)
             content_type = get_content_type(headers)
             if content_type is None:
-                charset = 'utf-8'
+                charset = None
             else:
-                charset = content_type.get('charset', 'utf-8')
-            data = StringIO(data.decode(charset))
-        else:
-            data = source
-        tree = self._parser.parse(data)
+                charset = content_type.get('charset')
+            parser = self._parser.create_pull_parser(events=(),
+                                                     encoding=charset)
+            for chunk in chunks:
+                parser.feed(chunk)
+            return parser.close()
+        tree = self._parser.parse(source)
         return tree.getroot()
 
 
@@ -826,6 +830,7 @@ class Window(object):
     @inner_height.setter
     def inner_height(self, height):
         self._inner_height = int(height)
+        TreeContext.touch()  # the viewport sizes are changed
 
     @property
     def inner_width(self):
@@ -835,6 +840,7 @@ class Window(object):
     @inner_width.setter
     def inner_width(self, width):
         self._inner_width = int(width)
+        TreeContext.touch()  # the viewport sizes are changed
 
     @property
     def location(self):
@@ -884,4 +890,65 @@ class XMLDocument(Document):
     pass
 
 
+class _WindowContext(threading.local):
+    """Holds the active window of the current thread."""
+
+    def __init__(self):
+        self.window = None
+
+
+_window_context = _WindowContext()
+
+
+@contextmanager
+def active_window(window_=None, **kwargs):
+    """Activates a window in the current thread while the context is active.
+    A document created without a default view is associated with the active
+    window of the thread that created it. If no window is active, the
+    module-level window is used.
+
+    Each thread that processes documents concurrently should activate its
+    own window. The window has its own SVGParser, which also becomes the
+    default parser of lxml in the current thread (lxml's default parser is
+    thread-local).
+
+    Arguments:
+        window_ (Window, optional): The window to be activated. If not
+            specified, a new window is created.
+        **kwargs: See SVGParser.__init__(). Used only to create a new
+            window.
+    Returns:
+        Window: The active window.
+
+    Examples:
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> from svgpy.window import active_window
+        >>> def job(source):
+        ...     with active_window() as win:
+        ...         root = win.document.implementation.parse(source)
+        ...         return root.get_bbox()
+        >>> with ThreadPoolExecutor() as executor:
+        ...     results = list(executor.map(job, sources))
+    """
+    if window_ is None:
+        window_ = Window(SVGDOMImplementation(**kwargs))
+    previous = _window_context.window
+    _window_context.window = window_
+    try:
+        yield window_
+    finally:
+        _window_context.window = previous
+
+
+def get_active_window():
+    """Returns the active window of the current thread.
+
+    Returns:
+        Window: The window activated by active_window(), or the module-level
+            window if no window is active in the current thread.
+    """
+    window_ = _window_context.window
+    return window_ if window_ is not None else window
+
+
 window = Window(SVGDOMImplementation())
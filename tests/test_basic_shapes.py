@@ -13,7 +13,8 @@ from svgpy.element import HTMLAudioElement, HTMLVideoElement, \
 from svgpy import Comment, DOMMatrix, DOMRect, Element, Font, HTMLElement, \
     Node, PathParser, SVGLength, SVGParser, \
     SVGPathDataSettings, SVGPreserveAspectRatio, SVGZoomAndPan, window, \
-    formatter
+    compute_ctms, formatter
+from svgpy.utils import TreeContext
 
 SVG_ARCS02 = '''
 <svg width="12cm" height="5.25cm" viewBox="0 0 1200 525" version="1.1"
@@ -647,6 +648,44 @@ class BasicShapesTestCase(unittest.TestCase):
         self.assertEqual(100 * 2, bbox.width)
         self.assertEqual(200 * 2, bbox.height)
 
+    def test_compute_ctms(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg"'
+            ' width="200" height="200" viewBox="0 0 100 100">'
+            '<g id="g1" transform="translate(10 20)">'
+            '<svg id="svg2" x="5" y="5" width="50" height="50"'
+            ' viewBox="0 0 100 100">'
+            '<rect id="rect1" transform="scale(2)"'
+            ' width="10" height="10"/>'
+            '</svg>'
+            '</g>'
+            '</svg>')
+        g = root.get_element_by_id('g1')
+        svg = root.get_element_by_id('svg2')
+        rect = root.get_element_by_id('rect1')
+        ctms = compute_ctms(root)
+        self.assertEqual(4, len(ctms))
+        self.assertEqual(DOMMatrix([2, 0, 0, 2, 20, 40]), ctms[g])
+        self.assertEqual(DOMMatrix([1, 0, 0, 1, 10, 10]), ctms[svg])
+        self.assertEqual(DOMMatrix([1, 0, 0, 1, 5, 5]), ctms[rect])
+        self.assertEqual(ctms[rect], rect.get_ctm())
+        self.assertEqual(DOMMatrix([2, 0, 0, 2, 10, 10]),
+                         rect.get_screen_ctm())
+
+        # the cached matrices are not modified
+        ctm = rect.get_ctm()
+        ctm.translate_self(100, 100)
+        self.assertEqual(ctms[rect], rect.get_ctm())
+
+        root.current_scale = 2
+        self.assertEqual(DOMMatrix([2, 0, 0, 2, 0, 0]) * ctms[g],
+                         g.get_screen_ctm())
+        self.assertEqual(ctms[g], g.get_ctm())
+
+        rect.set('transform', 'scale(4)')
+        self.assertEqual(DOMMatrix([2, 0, 0, 2, 5, 5]), rect.get_ctm())
+
     def test_ellipse_get_total_length01(self):
         # ellipse: initial value
         parser = SVGParser()
@@ -1011,6 +1050,79 @@ class BasicShapesTestCase(unittest.TestCase):
         self.assertAlmostEqual(77.798, bbox.height, msg=element.id,
                                delta=delta)
 
+    def test_get_bbox_cache(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<g id="g1" transform="translate(10)">'
+            '<rect id="rect1" x="10" y="20" width="30" height="40"/>'
+            '</g>'
+            '</svg>')
+        g = root.get_element_by_id('g1')
+        rect = root.get_element_by_id('rect1')
+        bbox = root.get_bbox()
+        self.assertEqual(DOMRect(20, 20, 30, 40), bbox)
+        bbox.x = 0  # the cached bounding box is not modified
+        self.assertEqual(DOMRect(20, 20, 30, 40), root.get_bbox())
+        self.assertEqual(DOMRect(10, 20, 30, 40), g.get_bbox())
+
+        rect.set('width', '50')
+        self.assertEqual(DOMRect(20, 20, 50, 40), root.get_bbox())
+
+        g.set('transform', 'translate(20)')
+        self.assertEqual(DOMRect(30, 20, 50, 40), root.get_bbox())
+        self.assertEqual(DOMRect(10, 20, 50, 40), g.get_bbox())
+
+        rect.remove_attribute('x')
+        self.assertEqual(DOMRect(20, 20, 50, 40), root.get_bbox())
+
+        circle = root.create_sub_element('circle')
+        circle.attributes.update({'cx': '100', 'cy': '100', 'r': '10'})
+        self.assertEqual(DOMRect(20, 20, 90, 90), root.get_bbox())
+
+        g.remove(rect)
+        self.assertEqual(DOMRect(90, 90, 20, 20), root.get_bbox())
+
+        # the cached bounding boxes are validated against the attributes
+        # of the elements they depend on
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<g id="g1"><rect id="rect1" width="10" height="10"/></g>'
+            '<rect id="rect2" x="20" width="10" height="10"/>'
+            '<use id="use1" href="#g1" y="20"/>'
+            '<text id="text1" x="40" y="40" font-size="20">A</text>'
+            '</svg>')
+        rect1 = root.get_element_by_id('rect1')
+        rect2 = root.get_element_by_id('rect2')
+        use1 = root.get_element_by_id('use1')
+        text1 = root.get_element_by_id('text1')
+        self.assertEqual(DOMRect(0, 20, 10, 10), use1.get_bbox())
+        self.assertEqual(DOMRect(20, 0, 10, 10), rect2.get_bbox())
+        width = text1.get_bbox().width
+        root.get_bbox()
+        lookups = TreeContext.of(root)._lookups
+        cached = lookups[rect2][('bbox', False)]
+
+        rect1.set('width', '15')
+        self.assertEqual(DOMRect(0, 20, 15, 10), use1.get_bbox())
+        self.assertEqual(DOMRect(0, 0, 53.6875, 45), root.get_bbox())
+        self.assertEqual(DOMRect(20, 0, 10, 10), rect2.get_bbox())
+        self.assertIs(cached, lookups[rect2][('bbox', False)])
+
+        # raw lxml attribute writes
+        rect1.attrib['height'] = '5'
+        self.assertEqual(DOMRect(0, 20, 15, 5), use1.get_bbox())
+        rect2.attrib['y'] = '100'
+        self.assertEqual(DOMRect(20, 100, 10, 10), rect2.get_bbox())
+        self.assertEqual(110, root.get_bbox().bottom)
+        root[0].attrib['transform'] = 'translate(0 100)'
+        self.assertEqual(DOMRect(0, 120, 15, 5), use1.get_bbox())
+        self.assertEqual(125, root.get_bbox().bottom)
+
+        text1.text = 'AA'  # not tracked by TreeContext.touch()
+        self.assertGreater(text1.get_bbox().width, width)
+        self.assertEqual(text1.get_bbox().right, root.get_bbox().right)
+
     def test_get_computed_style02(self):
         # See also: Units.html
         # Relative units
@@ -1972,6 +2084,49 @@ class BasicShapesTestCase(unittest.TestCase):
         elements = parent.get_elements_by_tag_name_ns(namespace, local_name)
         self.assertEqual(0, len(elements))
 
+    def test_get_path_data_cache(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        circle = root.create_sub_element('circle')
+        circle.attributes.update({
+            'cx': '600',
+            'cy': '200',
+            'r': '100',
+        })
+        settings = SVGPathDataSettings()
+        settings.normalize = True
+
+        path_data = circle.get_path_data(settings)
+        self.assertEqual('MCCCCZ', ''.join(x.type for x in path_data))
+        path_data.clear()  # returns a copy of the cached path data
+        path_data = circle.get_path_data(settings)
+        self.assertEqual(6, len(path_data))
+        self.assertEqual('AAAA', ''.join(
+            x.type for x in circle.get_path_data()[1:-1]))
+
+        circle.set('r', '50')
+        path_data = circle.get_path_data(settings)
+        self.assertEqual((650, 200), path_data[0].values)
+        self.assertEqual((650, 227.614, 627.614, 250, 600, 250),
+                         tuple(round(x, 3) for x in path_data[1].values))
+
+        rect = root.create_sub_element('rect')
+        rect.attributes.update({
+            'x': '10',
+            'y': '20',
+            'width': '100',
+            'height': '50',
+            'rx': '10',
+        })
+        path_data = rect.get_path_data(settings)
+        expected = PathParser.normalize(rect.get_path_data())
+        self.assertEqual(PathParser.tostring(expected),
+                         PathParser.tostring(path_data))
+        rect.set('width', '200')
+        self.assertEqual(PathParser.get_bbox(path_data).width + 100,
+                         PathParser.get_bbox(
+                             rect.get_path_data(settings)).width)
+
     def test_group_get_ctm(self):
         # See also: RotateScale.html
         parser = SVGParser()
@@ -3316,6 +3471,110 @@ class BasicShapesTestCase(unittest.TestCase):
         expected = 0, 0
         self.assertEqual(expected, translate)
 
+    def test_svg_get_intersection_list(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg"'
+            ' width="200" height="200" viewBox="0 0 100 100">'
+            '<g id="g1" transform="translate(10 20)">'
+            '<rect id="rect1" width="10" height="20"/>'
+            '<circle id="circle1" cx="50" cy="50" r="10"/>'
+            '</g>'
+            '<rect id="rect2" x="80" y="0" width="10" height="10"/>'
+            '</svg>')
+        g1 = root.get_element_by_id('g1')
+        rect1 = root.get_element_by_id('rect1')
+        circle1 = root.get_element_by_id('circle1')
+        rect2 = root.get_element_by_id('rect2')
+
+        # the rectangles are in the user space of the 'svg' element
+        rect = DOMRect(0, 0, 100, 100)
+        self.assertEqual([rect1, circle1, rect2],
+                         root.get_intersection_list(rect))
+        self.assertEqual([rect1, circle1],
+                         root.get_intersection_list(rect, g1))
+        self.assertEqual([rect1, circle1, rect2],
+                         root.get_enclosure_list(rect))
+
+        rect = DOMRect(15, 35, 60, 60)
+        self.assertEqual([rect1, circle1], root.get_intersection_list(rect))
+        self.assertEqual([circle1], root.get_enclosure_list(rect))
+        self.assertEqual([], root.get_enclosure_list(rect, rect2))
+        self.assertTrue(root.check_intersection(rect1, rect))
+        self.assertFalse(root.check_enclosure(rect1, rect))
+        self.assertTrue(root.check_enclosure(circle1, rect))
+        self.assertFalse(root.check_intersection(rect2, rect))
+        self.assertFalse(root.check_intersection(
+            root.get_element_by_id('nil'), rect))
+
+        rect2.set('x', '70')
+        rect2.set('y', '40')
+        self.assertTrue(root.check_intersection(rect2, rect))
+        self.assertEqual([rect1, circle1, rect2],
+                         root.get_intersection_list(rect))
+
+    def test_use_get_path_data(self):
+        parser = SVGParser()
+        root = parser.fromstring("""
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:xlink="http://www.w3.org/1999/xlink">
+  <defs>
+    <rect id="base" width="10" height="20"/>
+    <g id="loop1"><rect width="1" height="1"/><use xlink:href="#loop2"/></g>
+    <g id="loop2"><use id="use3" xlink:href="#loop1"/></g>
+    <rect id="moved" width="10" height="20" transform="translate(5,5)"/>
+  </defs>
+  <use id="use1" xlink:href="#base" x="5"/>
+  <use id="use2" xlink:href="#base" y="5" transform="scale(2)"/>
+  <use id="use4" xlink:href="#loop1"/>
+  <use id="use5" xlink:href="#moved" x="100" transform="scale(2)"/>
+  <use id="use6" xlink:href="#moved" x="100" transform="rotate(30)"/>
+  <g id="expanded">
+    <g transform="rotate(30) translate(100)">
+      <rect width="10" height="20" transform="translate(5,5)"/>
+    </g>
+  </g>
+</svg>
+""")
+        use1 = root.get_element_by_id('use1')
+        use2 = root.get_element_by_id('use2')
+        self.assertEqual('M5,0 L15,0 15,20 5,20 5,0 Z',
+                         PathParser.tostring(use1.get_path_data()))
+        self.assertEqual('M0,10 L20,10 20,50 0,50 0,10 Z',
+                         PathParser.tostring(use2.get_path_data()))
+        self.assertEqual((5, 0, 10, 20),
+                         tuple(use1.get_bbox().tojson().values()))
+
+        # the referenced element is shared by the instances
+        base = root.get_element_by_id('base')
+        base.set('width', '30')
+        self.assertEqual('M5,0 L35,0 35,20 5,20 5,0 Z',
+                         PathParser.tostring(use1.get_path_data()))
+        self.assertEqual((5, 0, 30, 20),
+                         tuple(use1.get_bbox().tojson().values()))
+
+        # circular references
+        use3 = root.get_element_by_id('use3')
+        self.assertEqual([], use3.get_path_data())
+        use4 = root.get_element_by_id('use4')
+        self.assertEqual('M0,0 H1 V1 H0 V0 Z',
+                         PathParser.tostring(use4.get_path_data()))
+
+        # the instance is placed by the 'x', 'y' and 'transform' attributes
+        # of the 'use' element, then by the 'transform' attribute of the
+        # referenced element
+        use5 = root.get_element_by_id('use5')
+        self.assertEqual('M210,10 L230,10 230,50 210,50 210,10 Z',
+                         PathParser.tostring(
+                             use5.get_transformed_path_data()))
+        self.assertEqual((210, 10, 20, 40),
+                         tuple(use5.get_bbox().tojson().values()))
+        use6 = root.get_element_by_id('use6')
+        expanded = root.get_element_by_id('expanded')
+        for actual, expected in zip(use6.get_bbox().tojson().values(),
+                                    expanded.get_bbox().tojson().values()):
+            self.assertAlmostEqual(expected, actual, places=4)
+
     def test_view_box01(self):
         # See also: ViewBox.html
         # https://svgwg.org/svg2-draft/coords.html#ViewBoxAttribute
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.extend(['.', '..'])
+
+from svgpy import DOMRect, SVGParser
+from svgpy.batch import BatchProcessor, PackedPathData, parallel_extract, \
+    process
+from svgpy.geometry.extraction import extract
+
+SVG_TEMPLATE = '''
+<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400">
+  <rect id="rect1" x="{0}" y="10" width="20" height="30"/>
+  <path d="M{0},100 l30,40"/>
+</svg>
+'''
+
+
+def count_elements(root):
+    return len(list(root.iter()))
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_batch_map(self):
+        sources = [SVG_TEMPLATE.format(x * 10).encode() for x in range(10)]
+        sources.append(b'<svg')
+        with BatchProcessor(max_workers=2, chunk_size=3) as processor:
+            results = list(processor.map(['bbox', 'total_lengths'],
+                                         sources))
+            self.assertEqual(list(range(11)), [x.index for x in results])
+            for x, result in enumerate(results[:10]):
+                self.assertIsNone(result.error)
+                self.assertIsNone(result.source)
+                bbox = result.value['bbox']
+                self.assertIsInstance(bbox, DOMRect)
+                self.assertEqual((x * 10, 10, 30, 130),
+                                 (bbox.x, bbox.y, bbox.width, bbox.height))
+                self.assertEqual({'rect1': 100, '/*/*[2]': 50},
+                                 result.value['total_lengths'])
+            self.assertIsNone(results[10].value)
+            self.assertTrue(results[10].error.startswith('XMLSyntaxError'))
+
+            results = list(processor.map(count_elements, sources[:10],
+                                         ordered=False))
+            self.assertEqual(list(range(10)),
+                             sorted(x.index for x in results))
+            self.assertEqual([3] * 10, [x.value for x in results])
+
+            self.assertRaises(ValueError,
+                              lambda: list(processor.map('unknown',
+                                                         sources)))
+
+    def test_batch_process(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            filenames = list()
+            for x in range(3):
+                filename = os.path.join(dirname, '{}.svg'.format(x))
+                with open(filename, 'w') as fp:
+                    fp.write(SVG_TEMPLATE.format(x))
+                filenames.append(filename)
+            results = list(process('bbox', filenames, max_workers=1))
+        self.assertEqual(filenames, [x.source for x in results])
+        self.assertEqual([0, 1, 2], [x.value.x for x in results])
+
+    def test_packed_path_data(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<path d="M10,20 l30,40 a5,5 0 1 0 10,10 z"/></svg>')
+        path_data = root[0].get_path_data()
+        packed = PackedPathData.pack(path_data)
+        self.assertEqual(4, len(packed))
+        self.assertEqual('Mlaz', packed.types)
+        self.assertEqual([2, 2, 7, 0], packed.sizes.tolist())
+        self.assertEqual(path_data, packed.unpack())
+        unpickled = pickle.loads(pickle.dumps(packed))
+        self.assertEqual(packed, unpickled)
+        self.assertEqual(path_data, unpickled.unpack())
+
+        packed = PackedPathData.pack([])
+        self.assertEqual(0, len(packed))
+        self.assertEqual([], packed.unpack())
+
+    def test_parallel_extract(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400">'
+            '<style>.wide { stroke-width: 4px }</style>'
+            '<g id="g1" transform="translate(10 20)">'
+            '<defs><rect id="r1" width="5" height="6"/></defs>'
+            '<rect id="rect1" class="wide" x="1" y="2" width="3" height="4"/>'
+            '<g transform="scale(2)"><circle cx="5" cy="5" r="5"/></g>'
+            '<use id="use1" href="#ellipse1" x="100"/>'
+            '<use href="#r1" x="50"/>'
+            '<path d="M0,0 h10 v10"/>'
+            '<ellipse id="ellipse1" cx="5" cy="5" rx="3" ry="4"'
+            ' transform="rotate(30 5 5)"/>'
+            '<use href="#rect2" y="50" transform="scale(2)"/>'
+            '</g>'
+            '<rect id="rect2" width="5" height="5" transform="translate(5)"/>'
+            '</svg>')
+        g1 = root.get_element_by_id('g1')
+        text_root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400">'
+            '<style>.b:nth-child(3) { font-size: 40px }</style>'
+            '<text x="10" y="50">A</text>'
+            '<text class="b" x="10" y="100">A</text>'
+            '</svg>')
+        fields = ['id', 'tag', 'ctm', 'bbox', 'length', 'path']
+        with BatchProcessor(max_workers=2, chunk_size=1) as processor:
+            columns = parallel_extract(root, fields, processor)
+            # the ancestors of a subtree are copied into the fragments, and
+            # so are the elements referenced from outside the subtree
+            g1_columns = parallel_extract(g1, fields, processor)
+            # the selectors that depend on the siblings are matched in the
+            # calling process
+            text_columns = parallel_extract(text_root, ['bbox'], processor)
+        expected = extract(root, fields)
+        self.assertEqual(expected['id'].tolist(), columns['id'].tolist())
+        self.assertEqual(['svg', 'g', 'rect', 'g', 'circle', 'use', 'use',
+                          'path', 'ellipse', 'use', 'rect'],
+                         columns['tag'].tolist())
+        for field in ['ctm', 'bbox', 'length']:
+            np.testing.assert_allclose(expected[field], columns[field])
+        self.assertEqual([PackedPathData.pack(x) for x in expected['path']],
+                         columns['path'])
+        # the path data of the <use> element is the referenced ellipse
+        # moved by (100, 0)
+        self.assertEqual(columns['path'][8].types, columns['path'][5].types)
+        np.testing.assert_allclose(columns['bbox'][8] + (100, 0, 0, 0),
+                                   columns['bbox'][5])
+
+        expected = extract(g1, fields)
+        self.assertEqual(expected['id'].tolist(), g1_columns['id'].tolist())
+        for field in ['ctm', 'bbox', 'length']:
+            np.testing.assert_allclose(expected[field], g1_columns[field])
+        self.assertEqual([PackedPathData.pack(x) for x in expected['path']],
+                         g1_columns['path'])
+
+        np.testing.assert_allclose(extract(text_root, ['bbox'])['bbox'],
+                                   text_columns['bbox'])
+
+        # a leaf is extracted in the calling process
+        columns = parallel_extract(root.get_element_by_id('rect1'),
+                                   ['id', 'path'])
+        self.assertEqual(['rect1'], columns['id'].tolist())
+        self.assertEqual('MLLLLZ', columns['path'][0].types)
+
+        self.assertRaises(ValueError,
+                          lambda: parallel_extract(root, ['unknown']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -496,6 +496,40 @@ class CSSOMTestCase(unittest.TestCase):
         self.assertEqual('blue', value)
         self.assertEqual('important', priority)
 
+    def test_inline_style_batch(self):
+        parser = SVGParser()
+        rect = parser.create_element('rect')
+        rect.set('style', 'fill: red;')
+        writes = list()
+        rect_set = rect.set
+
+        def _set(key, value):
+            writes.append((key, value))
+            rect_set(key, value)
+
+        rect.set = _set
+        with rect.style.batch() as style:
+            self.assertIs(rect.style, style)
+            style['stroke'] = 'blue'
+            style['stroke-width'] = '5'
+            with style.batch():
+                style['fill'] = 'white'
+            del style['fill']
+            self.assertEqual(2, style.length)
+            self.assertEqual('blue', style['stroke'])
+            # not written yet
+            self.assertEqual('fill: red;', rect.get('style'))
+            self.assertEqual([], writes)
+        self.assertEqual([('style', 'stroke-width: 5; stroke: blue;')],
+                         writes)
+        self.assertEqual('stroke-width: 5; stroke: blue;', rect.get('style'))
+
+        with rect.style.batch() as style:
+            style['stroke'] = None
+            style['stroke-width'] = ''
+        self.assertIsNone(rect.get('style'))
+        self.assertEqual(0, rect.style.length)
+
     def test_link_style_sheet_link(self):
         # HTMLLinkElement#sheet
         doc = window.document
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
 
+import base64
+import gc
 import logging
 import os
 import sys
 import tempfile
 import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from lxml import etree
@@ -13,9 +17,10 @@ from lxml import etree
 sys.path.extend(['.', '..'])
 
 from svgpy import Attr, Comment, Element, Node, ProcessingInstruction
-from svgpy.element import HTMLVideoElement, SVGSVGElement
+from svgpy.element import HTMLVideoElement, SVGParser, SVGSVGElement
+from svgpy.utils import ElementIndex, TreeContext, get_element_by_id
 from svgpy.window import Document, SVGDOMImplementation, Window, XMLDocument, \
-    window
+    active_window, get_active_window, window
 
 # LOGGING_LEVEL = logging.DEBUG
 LOGGING_LEVEL = logging.WARNING
@@ -97,6 +102,28 @@ class DocumentTestCase(unittest.TestCase):
                             format=fmt)
         window.location = 'about:blank'
 
+    def test_active_window(self):
+        self.assertIs(window, get_active_window())
+        self.assertIs(window, XMLDocument().default_view)
+
+        with active_window() as win:
+            self.assertIsInstance(win, Window)
+            self.assertIsNot(window, win)
+            self.assertIs(win, get_active_window())
+            self.assertIs(win, XMLDocument().default_view)
+            self.assertIs(win, win.document.default_view)
+
+            # the window is active only in the current thread
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertIs(window,
+                              executor.submit(get_active_window).result())
+
+            other = Window(SVGDOMImplementation())
+            with active_window(other):
+                self.assertIs(other, XMLDocument().default_view)
+            self.assertIs(win, get_active_window())
+        self.assertIs(window, get_active_window())
+
     def test_document_append_child(self):
         impl = SVGDOMImplementation()
 
@@ -465,6 +492,61 @@ class DocumentTestCase(unittest.TestCase):
         self.assertEqual('style.css', pi.get('href'))
         self.assertEqual('text/css', pi.get('type'))
 
+    def test_document_get_element_by_id(self):
+        doc = window.document
+        doc.write(SVG_SVG)
+        root = doc.document_element
+        star = doc.get_element_by_id('svgstar')
+        self.assertEqual('g', star.local_name)
+
+        # DOM mutation methods
+        rect = doc.create_element('rect')
+        rect.id = 'rect01'
+        star.append_child(rect)
+        self.assertEqual(rect, doc.get_element_by_id('rect01'))
+
+        rect.id = 'rect02'
+        self.assertIsNone(doc.get_element_by_id('rect01'))
+        self.assertEqual(rect, doc.get_element_by_id('rect02'))
+
+        rect.attributes['id'] = 'rect03'
+        self.assertIsNone(doc.get_element_by_id('rect02'))
+        self.assertEqual(rect, doc.get_element_by_id('rect03'))
+
+        star.remove_child(rect)
+        self.assertIsNone(doc.get_element_by_id('rect03'))
+
+        # duplicated id: the first element in document order
+        circle = doc.create_element('circle')
+        circle.id = 'svgbar'
+        star.prepend(circle)
+        self.assertEqual(circle, doc.get_element_by_id('svgbar'))
+        star.remove_child(circle)
+        self.assertEqual('path', doc.get_element_by_id('svgbar').local_name)
+
+        # subtree
+        self.assertIsNone(get_element_by_id(star, 'gtop'))
+        self.assertEqual(star, get_element_by_id(star, 'svgstar'))
+        self.assertEqual(star, root.get_element_by_id('svgstar'))
+
+        # raw lxml mutations
+        use = doc.get_element_by_id('use1')
+        use.attrib['id'] = 'use4'
+        self.assertIsNone(doc.get_element_by_id('use1'))
+        self.assertEqual(use, doc.get_element_by_id('use4'))
+        etree.SubElement(star, 'line', id='line01')
+        self.assertEqual('line', doc.get_element_by_id('line01').local_name)
+
+        # the index survives the recreation of the proxy of the root element
+        root = SVGParser().fromstring(SVG_SVG.strip())
+        star = get_element_by_id(root, 'svgstar')
+        index = ElementIndex.of(star)
+        del root
+        gc.collect()
+        self.assertIs(index, ElementIndex.of(star))
+        star.append_child(doc.create_element('rect'))
+        self.assertIs(index, ElementIndex.of(star))
+
     def test_document_get_elements(self):
         doc = window.document
 
@@ -573,6 +655,58 @@ class DocumentTestCase(unittest.TestCase):
             'rect')
         self.assertEqual(0, len(elements))
 
+    def test_document_get_elements_indexed(self):
+        doc = window.document
+        doc.write(SVG_CUBIC01)
+        root = doc.document_element
+        queries = [
+            ('get_elements_by_class_name', ('EndPoint',)),
+            ('get_elements_by_class_name', ('Connect SamplePath',)),
+            ('get_elements_by_class_name', ('Label',)),
+            ('get_elements_by_tag_name', ('circle',)),
+            ('get_elements_by_tag_name', ('svg',)),
+            ('get_elements_by_tag_name_ns', (None, 'path')),
+            ('get_elements_by_tag_name_ns', (Element.SVG_NAMESPACE_URI,
+                                             'text')),
+            ('get_elements_by_tag_name_ns', (Element.XHTML_NAMESPACE_URI,
+                                             'text')),
+        ]
+        expected = [getattr(doc, name)(*args) for name, args in queries]
+        expected_locals = root.get_elements_by_local_name('polyline')
+
+        index = ElementIndex.of(root)
+        index.use_name_indexes = True
+        try:
+            for (name, args), elements in zip(queries, expected):
+                self.assertEqual(elements, getattr(doc, name)(*args),
+                                 msg=(name, args))
+            self.assertEqual(expected_locals,
+                             root.get_elements_by_local_name('polyline'))
+            self.assertIsNotNone(index._class_names)
+
+            # DOM mutation methods
+            circle = root.get_elements_by_tag_name('circle')[0]
+            circle.class_list.add('Selected')
+            self.assertEqual([circle],
+                             doc.get_elements_by_class_name('Selected'))
+            self.assertEqual([circle],
+                             doc.get_elements_by_class_name('EndPoint '
+                                                            'Selected'))
+            g = root.create_sub_element('g')
+            circle2 = g.create_sub_element('circle', attrib={
+                'class': 'Selected'})
+            self.assertEqual([circle, circle2],
+                             doc.get_elements_by_class_name('Selected'))
+            self.assertEqual([circle2],
+                             g.get_elements_by_class_name('Selected'))
+            self.assertEqual([circle2], g.get_elements_by_tag_name('circle'))
+            root.remove_child(circle)
+            self.assertEqual([circle2],
+                             doc.get_elements_by_class_name('Selected'))
+            self.assertEqual(7, len(doc.get_elements_by_tag_name('circle')))
+        finally:
+            index.use_name_indexes = False
+
     def test_document_init01(self):
         # Window: window
         # Document: Document()
@@ -1318,6 +1452,134 @@ class DocumentTestCase(unittest.TestCase):
         self.assertEqual('rect', children[0].node_name)
         self.assertEqual('rect', children[1].node_name)
 
+    def test_implementation_parse(self):
+        impl = SVGDOMImplementation()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'svg.svg')
+            path.write_text(SVG_SVG, encoding='utf-8')
+            root = impl.parse(path.as_uri())
+        self.assertIsInstance(root, SVGSVGElement)
+        self.assertEqual(['g', 'use'], [x.local_name for x in root])
+        self.assertEqual('svgbar', root.get_element_by_id('use1').href[1:])
+
+        root = impl.parse('data:image/svg+xml;base64,' + base64.b64encode(
+            SVG_SVG.strip().encode()).decode())
+        self.assertIsInstance(root, SVGSVGElement)
+        self.assertEqual(['g', 'use'], [x.local_name for x in root])
+
+    def test_tree_context(self):
+        impl = SVGDOMImplementation()
+        doc = impl.create_document(Element.SVG_NAMESPACE_URI)
+        root = doc.create_element('svg')
+        doc.append_child(root)
+        g = root.create_sub_element('g')
+        symbol = root.create_sub_element('symbol')
+        text = g.create_sub_element('text')
+        tspan = text.create_sub_element('tspan')
+        rect = g.create_sub_element('rect')
+        del text, tspan  # the proxies are recreated below
+
+        context = TreeContext.of(rect)
+        self.assertIs(context, TreeContext.of(root))
+        self.assertIs(doc, rect.owner_document)
+        self.assertIs(root, rect.get_nearest_viewport_element())
+        self.assertIs(root, rect.get_farthest_svg_element())
+        tspan = root.find('.//{*}tspan')
+        self.assertEqual('text', tspan.get_nearest_text_element().local_name)
+        self.assertIs(context, TreeContext.of(tspan))
+
+        # structural mutations invalidate the cached lookups
+        symbol.append_child(rect)
+        self.assertIsNot(context, TreeContext.of(rect))
+        self.assertIs(symbol, rect.get_nearest_viewport_element())
+        self.assertIs(root, rect.get_farthest_svg_element())
+        self.assertIs(doc, rect.owner_document)
+
+        symbol.remove_child(rect)
+        self.assertIs(doc, rect.owner_document)
+        self.assertIsNone(rect.get_nearest_viewport_element())
+        self.assertIs(rect, TreeContext.of(rect)._root)
+
+        other = SVGDOMImplementation().create_document(
+            Element.SVG_NAMESPACE_URI)
+        root.remove_child(g)
+        other.append_child(g)
+        self.assertIs(other, tspan.owner_document)
+        self.assertIsNone(tspan.get_nearest_viewport_element())
+        self.assertEqual('text', tspan.get_nearest_text_element().local_name)
+
+        # the contexts are kept per tree
+        context = TreeContext.of(tspan)
+        root.append_child(doc.create_element('circle'))
+        self.assertIs(context, TreeContext.of(tspan))
+
+        # the contexts survive the recreation of the proxies
+        del g, tspan
+        gc.collect()
+        tspan = other.document_element.find('.//{*}tspan')
+        self.assertIs(context, TreeContext.of(tspan))
+
+        # the contexts are released with their trees
+        other_root = doc.create_element('g')
+        other_root.create_sub_element('rect').get_bbox()
+        ref = weakref.ref(TreeContext.of(other_root))
+        del other_root
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertIs(context, TreeContext.of(tspan))
+
+        # the referrers are updated by TreeContext.touch()
+        use = root.create_sub_element('use')
+        use.set('href', '#g1')
+        context = TreeContext.of(root)
+        self.assertEqual([use], context.get_referrers('g1'))
+        use.set('href', '#g2')
+        self.assertEqual([], context.get_referrers('g1'))
+        self.assertEqual([use], context.get_referrers('g2'))
+        use.attrib['href'] = '#g1'  # not tracked by TreeContext.touch()
+        self.assertEqual([], context.get_referrers('g2'))
+
+        # the selectors that depend on the siblings
+        self.assertFalse(context.has_sibling_selectors)
+        style = root.create_sub_element('style')
+        style.text = 'circle + use { fill: red; }'
+        use.get_computed_style()
+        self.assertTrue(TreeContext.of(root).has_sibling_selectors)
+
+    def test_tree_context_threads(self):
+        # the contexts are looked up and invalidated concurrently
+        impl = SVGDOMImplementation()
+        roots = list()
+        for _ in range(4):
+            doc = impl.create_document(Element.SVG_NAMESPACE_URI)
+            root = doc.create_element('svg')
+            doc.append_child(root)
+            for _ in range(50):
+                root.create_sub_element('g').create_sub_element('rect')
+            roots.append(root)
+
+        def job(index):
+            root = roots[index % len(roots)]
+            contexts = set()
+            for _ in range(20):
+                for rect in root.iterfind('.//{*}rect'):
+                    contexts.add(TreeContext.of(rect))
+                    TreeContext.touch(rect)
+                if index % 2 == 0:
+                    TreeContext.invalidate(root)
+                else:
+                    TreeContext.touch()
+            return root, contexts
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(job, range(16)))
+        for root, contexts in results:
+            self.assertTrue(all(context._root is root
+                                for context in contexts))
+            context = TreeContext.of(root)
+            self.assertTrue(all(TreeContext.of(rect) is context
+                                for rect in root.iterfind('.//{*}rect')))
+
 
 if __name__ == '__main__':
     unittest.main()
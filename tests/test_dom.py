@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 
+import gzip
+import os
 import sys
+import tempfile
 import unittest
-from io import StringIO
+from io import BytesIO, StringIO
+
+from lxml import etree
 
 sys.path.extend(['.', '..'])
 
 from svgpy import Attr, Comment, DOMTokenList, Element, HTMLElement, \
     NamedNodeMap, Node, SVGElement, SVGParser, formatter, window
+from svgpy.element import SVGSVGElement
+from svgpy.utils import TreeContext
 
 SVG_CUBIC01 = '''
 <svg width="5cm" height="4cm" viewBox="0 0 500 400"
@@ -1661,6 +1668,26 @@ class DOMTestCase(unittest.TestCase):
         self.assertEqual(Element.XHTML_NAMESPACE_URI, video.namespace_uri)
         self.assertEqual('html', video.prefix)
 
+    def test_element_init_lazy(self):
+        parser = SVGParser()
+        root = parser.fromstring(SVG_CUBIC01)
+        path = root.get_element_by_id('path02')
+        # created on first access
+        self.assertIsNone(path._attributes)
+        self.assertIsNone(path._style)
+
+        attributes = path.attributes
+        self.assertIsInstance(attributes, NamedNodeMap)
+        self.assertIs(attributes, path.attributes)
+        self.assertEqual('pink', attributes['stroke'].value)
+        self.assertIsNone(path._style)
+
+        style = path.style
+        self.assertIs(style, path.style)
+        style['stroke'] = 'red'
+        self.assertEqual('stroke: red;', path.get('style'))
+        self.assertEqual('stroke: red;', path.attributes['style'].value)
+
     def test_element_insert(self):
         # Element.insert()
         parser = SVGParser()
@@ -2405,6 +2432,154 @@ class DOMTestCase(unittest.TestCase):
         self.assertEqual(local_name, old.local_name)
         self.assertEqual(old_value, old.value)
 
+    def test_parser_iterfeed(self):
+        parser = SVGParser()
+        data = SVG_CUBIC01.encode()
+        chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+        events = list(parser.iterfeed(chunks, events=('start', 'end')))
+        root = parser.fromstring(SVG_CUBIC01)
+        expected = [x.local_name for x in root.iter('{*}*')]
+        self.assertEqual(expected, [element.local_name
+                                    for event, element in events
+                                    if event == 'start'])
+        self.assertEqual(len(expected), len(events) // 2)
+        self.assertEqual(('end', 'svg'),
+                         (events[-1][0], events[-1][1].local_name))
+        for _, element in events:
+            self.assertIsInstance(element, Element)
+        path = events[-1][1].get_element_by_id('path01')
+        self.assertEqual(root.get_element_by_id('path01').get_bbox(),
+                         path.get_bbox())
+
+    def test_parser_iterparse(self):
+        src = '''
+<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400">
+  <style>.thick { stroke-width: 10px; }</style>
+  <defs><rect id="r0" width="10" height="10"/></defs>
+  <g transform="translate(100 50)">
+    <rect id="r1" x="10" y="10" width="20" height="20"/>
+    <g transform="scale(2)">
+      <rect id="r2" class="thick" x="10" y="10" width="20" height="20"/>
+      <rect id="r3" x="50" y="10" width="20" height="20"/>
+    </g>
+    <use id="u1" href="#r0" x="5"/>
+  </g>
+  <!-- a comment -->
+  <circle cx="10" cy="10" r="5"/>
+  <circle cx="20" cy="10" r="5"/>
+  <circle cx="30" cy="10" r="5"/>
+  <use id="u2" href="#r3" y="100"/>
+  <text id="t1" x="10" y="100">Hello, <tspan>World</tspan></text>
+</svg>
+'''
+        parser = SVGParser(remove_comments=True)
+        root = parser.fromstring(src)
+        expected = dict()
+        for element in root.iter('{*}rect', '{*}use', '{*}text'):
+            expected[element.id] = (element.local_name,
+                                    element.get_ctm(),
+                                    element.get_bbox(),
+                                    element.get_computed_style()[
+                                        'stroke-width'])
+
+        actual = dict()
+        max_children = 0
+        contexts = set()
+        for event, element in parser.iterparse(
+                BytesIO(src.encode()), tags=['rect', 'use', '{*}text']):
+            self.assertEqual('end', event)
+            contexts.add(TreeContext.of(element))
+            self.assertIsInstance(element, SVGElement)
+            actual[element.id] = (element.local_name,
+                                  element.get_ctm(),
+                                  element.get_bbox(),
+                                  element.get_computed_style()[
+                                      'stroke-width'])
+            max_children = max(max_children, len(element.getparent()))
+        self.assertEqual(expected, actual)
+        self.assertLess(max_children, len(root))
+        # the released elements do not invalidate the cached lookups
+        self.assertEqual(1, len(contexts))
+
+        # released siblings
+        events = list(parser.iterparse(BytesIO(src.encode()),
+                                       events=('start', 'end'),
+                                       tags=['{*}svg',
+                                             '{http://www.w3.org/2000/svg}g']))
+        self.assertEqual(
+            [('start', 'svg'), ('start', 'g'), ('start', 'g'), ('end', 'g'),
+             ('end', 'g'), ('end', 'svg')],
+            [(event, element.local_name) for event, element in events])
+        svg = events[-1][1]
+        # the referenced elements and the elements that contain them are
+        # kept
+        self.assertEqual(['style', 'defs', 'g', 'text'],
+                         [x.local_name for x in svg])
+        self.assertEqual(['g', 'use'], [x.local_name for x in svg[2]])
+        self.assertEqual(['r3'], [x.id for x in svg[2][0]])
+
+        # the source that can not be read twice
+        class Stream(object):
+            def __init__(self, data):
+                self._fp = BytesIO(data)
+
+            def read(self, size=-1):
+                return self._fp.read(size)
+
+        events = list(parser.iterparse(Stream(src.encode()),
+                                       events=('start', 'end'),
+                                       tags=['svg']))
+        svg = events[-1][1]
+        self.assertEqual(['style', 'defs', 'text'],
+                         [x.local_name for x in svg])
+        src2 = ('<svg xmlns="http://www.w3.org/2000/svg">'
+                '<use href="#r1"/><rect id="r1" width="10" height="10"/>'
+                '<rect id="r2" width="10" height="10"/><circle r="5"/>'
+                '</svg>')
+        events = list(parser.iterparse(Stream(src2.encode()),
+                                       events=('start', 'end'),
+                                       tags=['svg']))
+        svg = events[-1][1]
+        self.assertEqual(['r1', None], [x.get('id') for x in svg])
+
+        # the parser options are applied
+        events = list(parser.iterparse(BytesIO(src.encode()),
+                                       events=('comment',)))
+        self.assertEqual([], events)
+        events = list(parser.iterparse(BytesIO(src.encode()),
+                                       events=('comment',),
+                                       remove_comments=False))
+        self.assertEqual(1, len(events))
+
+    def test_parser_parse_mmap_svgz(self):
+        parser = SVGParser()
+        expected = etree.tostring(parser.fromstring(SVG_CUBIC01))
+        with tempfile.TemporaryDirectory() as dirname:
+            svg_path = os.path.join(dirname, 'cubic01.svg')
+            with open(svg_path, 'w', encoding='utf-8') as fp:
+                fp.write(SVG_CUBIC01)
+            svgz_path = os.path.join(dirname, 'cubic01.svgz')
+            with gzip.open(svgz_path, 'wt', encoding='utf-8') as fp:
+                fp.write(SVG_CUBIC01)
+
+            tree = parser.parse(svg_path, use_mmap=True)
+            root = tree.getroot()
+            self.assertIsInstance(root, SVGSVGElement)
+            self.assertEqual(expected, etree.tostring(root))
+            self.assertEqual(svg_path, tree.docinfo.URL)
+
+            tree = parser.parse(svgz_path)
+            root = tree.getroot()
+            self.assertIsInstance(root, SVGSVGElement)
+            self.assertEqual(expected, etree.tostring(root))
+
+            tree = parser.parse(svgz_path, use_mmap=True)
+            self.assertEqual(expected, etree.tostring(tree.getroot()))
+
+            ids = [element.id for _, element
+                   in parser.iterparse(svgz_path, tags=['path'])]
+            self.assertEqual(['path01', 'path02', 'path03'], ids)
+
     def test_pi_addnext(self):
         # ProcessingInstruction.addnext()
         parser = SVGParser()
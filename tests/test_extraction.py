@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import math
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.extend(['.', '..'])
+
+from svgpy import PathParser, SVGParser, SVGPathDataSettings
+from svgpy.geometry.extraction import extract
+
+SVG_SHAPES = '''
+<svg xmlns="http://www.w3.org/2000/svg"
+     width="200" height="200" viewBox="0 0 100 100">
+  <defs>
+    <rect id="rect0" width="5" height="5"/>
+  </defs>
+  <g id="g1" transform="translate(10 20)">
+    <rect id="rect1" width="10" height="20"/>
+    <circle id="circle1" cx="50" cy="50" r="10"/>
+    <path id="path1" d="M0,0 L30,40" display="none"/>
+  </g>
+  <use id="use1" href="#rect0" x="70" y="70"/>
+</svg>
+'''
+
+
+class ExtractionTestCase(unittest.TestCase):
+    def test_extract_columns(self):
+        parser = SVGParser()
+        root = parser.fromstring(SVG_SHAPES)
+        columns = extract(root)
+        self.assertEqual(['', 'g1', 'rect1', 'circle1', 'use1'],
+                         columns['id'].tolist())
+        self.assertEqual(['svg', 'g', 'rect', 'circle', 'use'],
+                         columns['tag'].tolist())
+        self.assertEqual((5, 6), columns['ctm'].shape)
+        self.assertEqual([2, 0, 0, 2, 20, 40], columns['ctm'][2].tolist())
+        for element_id, ctm in zip(columns['id'][1:], columns['ctm'][1:]):
+            self.assertEqual(
+                root.get_element_by_id(element_id).get_screen_ctm().tolist(),
+                ctm.tolist())
+        self.assertEqual([[20, 40, 130, 120],
+                          [20, 40, 120, 120],
+                          [20, 40, 20, 40],
+                          [100, 120, 40, 40],
+                          [140, 140, 10, 10]],
+                         columns['bbox'].tolist())
+        lengths = columns['length']
+        self.assertTrue(math.isnan(lengths[0]))
+        self.assertTrue(math.isnan(lengths[1]))
+        self.assertEqual(60, lengths[2])
+        self.assertAlmostEqual(2 * math.pi * 10, lengths[3], places=3)
+        self.assertTrue(math.isnan(lengths[4]))
+
+        columns = extract(root.get_element_by_id('path1'))
+        self.assertEqual((0, 4), columns['bbox'].shape)
+
+        self.assertRaises(ValueError, lambda: extract(root, ['unknown']))
+
+    def test_extract_length(self):
+        # the lengths are measured on the path data before it is normalized
+        parser = SVGParser()
+        root = parser.fromstring('''
+<svg xmlns="http://www.w3.org/2000/svg" width="200" height="200">
+  <path id="path1" d="M0,0 A10,5 30 0 1 20,10 q5,5 10,0 t10,0"/>
+  <ellipse id="ellipse1" cx="50" cy="50" rx="10" ry="4"/>
+  <rect id="rect1" width="10" height="5" rx="2"/>
+  <path id="path2" d=""/>
+</svg>
+''')
+        columns = extract(root, fields=['id', 'bbox', 'length'])
+        for element_id, bbox, length in zip(columns['id'][1:],
+                                            columns['bbox'][1:],
+                                            columns['length'][1:]):
+            element = root.get_element_by_id(element_id)
+            self.assertEqual(element.get_total_length(), length,
+                             msg=element_id)
+            if element_id == 'path2':
+                self.assertTrue(np.isnan(bbox).all())
+                continue
+            expected = element.get_bbox()
+            self.assertTrue(
+                np.allclose([expected.x, expected.y, expected.width,
+                             expected.height], bbox),
+                msg=element_id)
+
+    def test_extract_stream(self):
+        parser = SVGParser()
+        root = parser.fromstring(SVG_SHAPES)
+        records = list(extract(root, fields=['id', 'bbox'], stream=True))
+        self.assertEqual(['rect1', 'circle1', 'g1', 'use1', ''],
+                         [record['id'] for record in records])
+        self.assertEqual({'id': 'g1', 'bbox': (20, 40, 120, 120)},
+                         records[2])
+        self.assertEqual(['tag'],
+                         list(next(extract(root, 'tag', stream=True))))
+
+    def test_extract_text(self):
+        # the style sheets are shared by the whole traversal
+        source = '''
+<svg xmlns="http://www.w3.org/2000/svg" width="400" height="200"
+     font-family="DejaVu Sans">
+  <style>.large { font-size: 32px }</style>
+  <text id="text1" x="10" y="40">Hello</text>
+  <text id="text2" class="large" x="10" y="120">Hello</text>
+</svg>
+'''
+        parser = SVGParser()
+        root = parser.fromstring(source)
+        columns = extract(root, fields=['id', 'bbox'])
+        ids = columns['id'].tolist()
+        root = parser.fromstring(source)
+        settings = SVGPathDataSettings()
+        settings.normalize = True
+        for element_id in ['text1', 'text2']:
+            bbox = PathParser.get_bbox(
+                root.get_element_by_id(element_id).get_path_data(settings))
+            self.assertTrue(
+                np.allclose([bbox.x, bbox.y, bbox.width, bbox.height],
+                            columns['bbox'][ids.index(element_id)]),
+                msg=element_id)
+        self.assertGreater(columns['bbox'][ids.index('text2')][2],
+                           columns['bbox'][ids.index('text1')][2] * 1.5)
+
+    def test_extract_use(self):
+        # the referenced elements have their own transforms
+        parser = SVGParser()
+        root = parser.fromstring('''
+<svg xmlns="http://www.w3.org/2000/svg"
+     width="200" height="200" viewBox="0 0 100 100">
+  <defs>
+    <path id="path0" d="M0,0 H10 V10 H0 Z" transform="translate(5,5)"/>
+    <rect id="rect0" width="10" height="5" transform="rotate(30)"/>
+  </defs>
+  <use id="use1" href="#path0" x="10" y="20"/>
+  <use id="use2" href="#rect0" x="10" transform="scale(2)"/>
+  <g transform="scale(2) translate(10)">
+    <rect id="rect2" width="10" height="5" transform="rotate(30)"/>
+  </g>
+</svg>
+''')
+        columns = extract(root, fields=['id', 'bbox', 'path'])
+        ids = columns['id'].tolist()
+        bboxes = columns['bbox']
+        self.assertEqual([30, 50, 20, 20],
+                         bboxes[ids.index('use1')].tolist())
+        self.assertTrue(np.allclose(bboxes[ids.index('rect2')],
+                                    bboxes[ids.index('use2')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,10 @@ import unittest
 
 sys.path.extend(['.', '..'])
 
-from svgpy.harfbuzz import HBDirection
+from svgpy.fontconfig import FontConfig
+from svgpy.freetype import FTFace
+from svgpy.harfbuzz import HB_GLYPH_INFO_DTYPE, HB_GLYPH_POSITION_DTYPE, \
+    HBBuffer, HBDirection, HBFTFont
 
 
 class HarfBuzzTestCase(unittest.TestCase):
@@ -68,6 +71,37 @@ class HarfBuzzTestCase(unittest.TestCase):
         self.assertTrue(direction.is_vertical())
         self.assertTrue(direction.is_valid())
 
+    def test_glyph_arrays(self):
+        filename = FontConfig.match('sans-serif', '%{file}')[0]
+        face = FTFace.new_face(filename)
+        face.set_char_size(0, 16 * 64)
+        font = HBFTFont.create(face)
+        buf = HBBuffer.create()
+        buf.add_utf8('Hello, World')
+        buf.guess_segment_properties()
+        buf.shape(font)
+
+        infos = buf.get_glyph_infos()
+        positions = buf.get_glyph_positions()
+        info_array = buf.get_glyph_infos_array()
+        position_array = buf.get_glyph_positions_array()
+        self.assertEqual(HB_GLYPH_INFO_DTYPE, info_array.dtype)
+        self.assertEqual(HB_GLYPH_POSITION_DTYPE, position_array.dtype)
+        self.assertEqual(len(infos), len(info_array))
+        self.assertEqual(len(positions), len(position_array))
+        self.assertEqual([x.codepoint for x in infos],
+                         info_array['codepoint'].tolist())
+        self.assertEqual([x.cluster for x in infos],
+                         info_array['cluster'].tolist())
+        self.assertEqual([x.x_advance for x in positions],
+                         position_array['x_advance'].tolist())
+        self.assertEqual([x.y_offset for x in positions],
+                         position_array['y_offset'].tolist())
+
+        buf.clear_contents()
+        self.assertEqual(0, len(buf.get_glyph_infos_array()))
+        self.assertEqual(0, len(buf.get_glyph_positions_array()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -813,6 +813,35 @@ class MatrixTestCase(unittest.TestCase):
             'matrix(1.5, 0, 0, 1.5, 200, 40)',
             m.tostring())
 
+    def test_promote(self):
+        m = DOMMatrix([2, 0, 0, 4, 10, 20])
+        m.translate_self(5, 5).scale_self(0.5)
+        self.assertEqual((20, 40), m.get_translate())
+        self.assertEqual((30, 60), m.transform_point(10, 10))
+        self.assertEqual([1, 0, 0, 0.5, -20, -20],
+                         m.inverse().tolist())
+        self.assertTrue(m.is2d)
+
+        m.m43 = 7
+        self.assertFalse(m.is2d)
+        self.assertEqual((30, 60, 7, 1), m.transform_point(10, 10))
+        self.assertEqual(7, m.matrix[2, 3])
+        i = m.inverse()
+        self.assertFalse(i.is2d)
+        for expected, actual in zip((10, 10, 0, 1),
+                                    i.transform_point(30, 60, 7)):
+            self.assertAlmostEqual(expected, actual, places=places)
+
+        # a 2d matrix with the 3d matrix flag
+        m = DOMMatrix(e=10, is2d=False)
+        self.assertFalse(m.is2d)
+        self.assertEqual((11, 1, 0, 1), m.transform_point(1, 1))
+        self.assertTrue((matrix2d(1, 0, 0, 1, 10, 0) == m.matrix).all())
+        self.assertEqual(m, DOMMatrix([1, 0, 0, 0,
+                                       0, 1, 0, 0,
+                                       0, 0, 1, 0,
+                                       10, 0, 0, 1]))
+
     def test_property_2d(self):
         a = 11
         b = 12
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.extend(['.', '..'])
+
+from svgpy import SVGParser
+from svgpy.geometry.polyline import FlattenedPath
+from svgpy.path import PathParser
+
+
+class PolylineTestCase(unittest.TestCase):
+    def test_are_points_in_fill(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        circle = root.create_sub_element('circle')
+        circle.attributes.update({'cx': '50', 'cy': '50', 'r': '40'})
+
+        xs, ys = np.meshgrid(np.arange(0, 100, 1.5), np.arange(0, 100, 1.5))
+        points = np.column_stack((xs.ravel(), ys.ravel()))
+        distances = np.hypot(points[:, 0] - 50, points[:, 1] - 50)
+
+        result = circle.are_points_in_fill(points)
+        self.assertEqual((len(points),), result.shape)
+        self.assertTrue(np.all(result[distances < 39.5]))
+        self.assertFalse(np.any(result[distances > 40.5]))
+
+        result = circle.are_points_in_stroke(points)
+        self.assertTrue(np.all(result[np.abs(distances - 40) < 0.3]))
+        self.assertFalse(np.any(result[np.abs(distances - 40) > 0.7]))
+
+        circle.attributes.update({'r': '10'})
+        self.assertFalse(circle.is_point_in_fill(30, 50))
+        self.assertTrue(circle.is_point_in_fill(45, 50))
+
+    def test_fill_rule(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        path = root.create_sub_element('path')
+        path.attributes.update({
+            'd': 'M0,0 H100 V100 H0 Z M25,25 H75 V75 H25 Z',
+        })
+        self.assertTrue(path.is_point_in_fill(50, 50))
+        self.assertTrue(path.is_point_in_fill(10, 50))
+        self.assertFalse(path.is_point_in_fill(150, 50))
+        self.assertFalse(path.is_point_in_fill(50, -1))
+
+        path.attributes.update({'fill-rule': 'evenodd'})
+        self.assertFalse(path.is_point_in_fill(50, 50))
+        self.assertTrue(path.is_point_in_fill(10, 50))
+
+        # the inner subpath in the opposite direction
+        path.attributes.update({
+            'd': 'M0,0 H100 V100 H0 Z M25,25 V75 H75 V25 Z',
+            'fill-rule': 'nonzero',
+        })
+        self.assertFalse(path.is_point_in_fill(50, 50))
+        self.assertTrue(path.is_point_in_fill(10, 50))
+
+        # an open subpath is filled as if it were closed
+        path.attributes.update({'d': 'M0,0 L100,0 L100,100'})
+        self.assertTrue(path.is_point_in_fill(60, 40))
+        self.assertFalse(path.is_point_in_fill(40, 60))
+
+    def test_flattened_path(self):
+        path_data = PathParser.normalize(
+            PathParser.parse('M0,0 c0,100 100,100 100,0 z'))
+        flattened_path = FlattenedPath(path_data, tolerance=0.01)
+        self.assertGreater(len(flattened_path), 10)
+        # the curve passes (50, 75)
+        self.assertEqual([True, False],
+                         flattened_path.contains([(50, 74.9),
+                                                  (50, 75.1)]).tolist())
+
+        flattened_path = FlattenedPath(list())
+        self.assertEqual(0, len(flattened_path))
+        self.assertEqual([False], flattened_path.contains([(0, 0)]).tolist())
+        self.assertEqual(
+            [False], flattened_path.stroke_contains([(0, 0)]).tolist())
+
+    def test_stroke_caps(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        line = root.create_sub_element('line')
+        line.attributes.update({
+            'x1': '0', 'y1': '0', 'x2': '100', 'y2': '0',
+            'stroke-width': '10',
+        })
+        points = [(50, 4), (50, 6), (-4, 0), (104, 0), (-4, 4), (-6, 0)]
+        self.assertEqual([True, False, False, False, False, False],
+                         line.are_points_in_stroke(points).tolist())
+
+        line.attributes.update({'stroke-linecap': 'round'})
+        self.assertEqual([True, False, True, True, False, False],
+                         line.are_points_in_stroke(points).tolist())
+
+        line.attributes.update({'stroke-linecap': 'square'})
+        self.assertEqual([True, False, True, True, True, False],
+                         line.are_points_in_stroke(points).tolist())
+
+        # a zero-length subpath is painted with round or square caps
+        path = root.create_sub_element('path')
+        path.attributes.update({
+            'd': 'M50,50 Z',
+            'stroke-width': '10',
+            'stroke-linecap': 'square',
+        })
+        self.assertTrue(path.is_point_in_stroke(54, 54))
+        path.attributes.update({'stroke-linecap': 'round'})
+        self.assertFalse(path.is_point_in_stroke(54, 54))
+        self.assertTrue(path.is_point_in_stroke(50, 54))
+        path.attributes.update({'stroke-linecap': 'butt'})
+        self.assertFalse(path.is_point_in_stroke(50, 54))
+
+    def test_stroke_joins(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        polyline = root.create_sub_element('polyline')
+        polyline.attributes.update({
+            'points': '0,0 100,0 100,100',
+            'stroke-width': '10',
+        })
+        # the outer corner is (105, -5)
+        points = [(104, -4), (104, -6), (102, -2), (103, -3), (96, 4)]
+        self.assertEqual([True, False, True, True, True],
+                         polyline.are_points_in_stroke(points).tolist())
+
+        polyline.attributes.update({'stroke-linejoin': 'bevel'})
+        self.assertEqual([False, False, True, False, True],
+                         polyline.are_points_in_stroke(points).tolist())
+
+        polyline.attributes.update({'stroke-linejoin': 'round'})
+        self.assertEqual([False, False, True, True, True],
+                         polyline.are_points_in_stroke(points).tolist())
+
+        # the miter length exceeds the limit at a sharp corner
+        polyline.attributes.update({
+            'points': '0,0 100,0 0,10',
+            'stroke-linejoin': 'miter',
+        })
+        self.assertFalse(polyline.is_point_in_stroke(110, -1))
+        polyline.attributes.update({'stroke-miterlimit': '30'})
+        self.assertTrue(polyline.is_point_in_stroke(110, -1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.extend(['.', '..'])
+
+from svgpy import DOMRectReadOnly, SVGParser
+from svgpy.geometry.rtree import RTree
+
+
+class RTreeTestCase(unittest.TestCase):
+    def test_rtree_search(self):
+        rng = np.random.RandomState(0)
+        count = 2000
+        bboxes = np.column_stack((rng.uniform(0, 1000, count),
+                                  rng.uniform(0, 1000, count),
+                                  rng.uniform(0, 10, count),
+                                  rng.uniform(0, 10, count)))
+        bboxes[10] = np.nan
+
+        def search(x, y, width=0, height=0):
+            x2 = bboxes[:, 0] + bboxes[:, 2]
+            y2 = bboxes[:, 1] + bboxes[:, 3]
+            return np.flatnonzero((bboxes[:, 0] <= x + width) & (x2 >= x)
+                                  & (bboxes[:, 1] <= y + height) & (y2 >= y))
+
+        tree = RTree(bboxes, node_capacity=8)
+        self.assertEqual(count, len(tree))
+        queries = [(100, 100, 50, 50), (500, 500), (-10, -10, 5, 5),
+                   (-10, -10, 2000, 2000)]
+        for query in queries:
+            self.assertEqual(search(*query).tolist(),
+                             tree.search(*query).tolist(), msg=query)
+
+        items = [1, 2, 3, 10]
+        bboxes[items] = [(500, 500, 1, 1), (600, 600, 1, 1),
+                         (np.nan,) * 4, (700, 700, 1, 1)]
+        tree.update(items, bboxes[items])
+        for query in queries + [(600, 600), (700, 700)]:
+            self.assertEqual(search(*query).tolist(),
+                             tree.search(*query).tolist(), msg=query)
+
+        items = np.arange(500)
+        bboxes[items, :2] += 1
+        tree.update(items, bboxes[items])  # repacked
+        for query in queries:
+            self.assertEqual(search(*query).tolist(),
+                             tree.search(*query).tolist(), msg=query)
+
+        self.assertEqual([], RTree([]).search(0, 0, 10, 10).tolist())
+        self.assertTrue(np.allclose(bboxes[items], tree.get_bboxes(items),
+                                    equal_nan=True))
+
+    def test_spatial_index(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg"'
+            ' width="200" height="200" viewBox="0 0 100 100">'
+            '<g id="g1" transform="translate(10 20)">'
+            '<rect id="rect1" width="10" height="20"/>'
+            '<circle id="circle1" cx="50" cy="50" r="10"/>'
+            '</g>'
+            '<rect id="rect2" x="80" y="0" width="10" height="10"/>'
+            '<defs><g id="g0"><rect id="rect0" width="5" height="5"/></g>'
+            '</defs>'
+            '<use id="use1" href="#g0" x="50" y="50"/>'
+            '</svg>')
+        g1 = root.get_element_by_id('g1')
+        rect1 = root.get_element_by_id('rect1')
+        circle1 = root.get_element_by_id('circle1')
+        rect2 = root.get_element_by_id('rect2')
+        use1 = root.get_element_by_id('use1')
+        index = root.get_spatial_index()
+        self.assertIs(index, root.get_spatial_index())
+        self.assertEqual(6, len(index))
+        self.assertEqual(DOMRectReadOnly(100, 100, 10, 10),
+                         index.get_bbox(use1))
+        self.assertEqual(DOMRectReadOnly(20, 40, 120, 120),
+                         index.get_bbox(g1))
+        self.assertIsNone(index.get_bbox(root.get_element_by_id('nil')))
+        self.assertEqual([root, g1, rect1], index.search_point(30, 50))
+        self.assertEqual([root, rect2], index.search(150, 0, 20, 20))
+
+        # incremental updates
+        rect2.set('y', '100')
+        self.assertEqual([], index.search(150, 0, 20, 20))
+        self.assertEqual([root, rect2], index.search_point(160, 200))
+        self.assertEqual(DOMRectReadOnly(20, 40, 160, 180),
+                         index.get_bbox(root))
+        g1.set('transform', 'translate(0 0)')
+        self.assertEqual([root, g1, rect1], index.search_point(10, 10))
+        self.assertEqual(DOMRectReadOnly(0, 0, 120, 120),
+                         index.get_bbox(g1))
+
+        # the referring 'use' elements are updated
+        self.assertEqual([root, g1, circle1, use1],
+                         index.search_point(105, 105))
+        self.assertEqual([root], index.search_point(125, 105))
+        root.get_element_by_id('rect0').set('width', '10')
+        root.get_element_by_id('g0').set('transform', 'translate(5)')
+        self.assertEqual(DOMRectReadOnly(110, 100, 20, 10),
+                         index.get_bbox(use1))
+        self.assertEqual([root, g1, circle1], index.search_point(105, 105))
+        self.assertEqual([root, use1], index.search_point(125, 105))
+
+        # the changes of other trees are ignored
+        other = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<rect id="rect3" width="10" height="10"/>'
+            '</svg>')
+        other.get_element_by_id('rect3').set('width', '20')
+        other.append_child(other.create_sub_element('circle'))
+        self.assertEqual(6, len(index))
+        self.assertEqual([root, use1], index.search_point(125, 105))
+        self.assertEqual([root, g1, rect1], index.search_point(10, 10))
+
+        # rebuilt
+        circle1.set('display', 'none')
+        self.assertEqual(5, len(index))
+        self.assertEqual(DOMRectReadOnly(0, 0, 20, 40), index.get_bbox(g1))
+        g1.remove(rect1)
+        index = root.get_spatial_index()
+        self.assertEqual(4, len(index))
+        self.assertEqual([root, rect2], index.search(150, 0, 50, 220))
+
+    def test_spatial_index_repack(self):
+        # the R-tree is repacked after many elements are updated at once
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<g id="g1">'
+            + ''.join('<rect x="{}" y="0" width="5" height="5"/>'.format(
+                10 * i) for i in range(100))
+            + '</g>'
+            '<rect id="rect1" x="0" y="100" width="5" height="5"/>'
+            '</svg>')
+        g1 = root.get_element_by_id('g1')
+        rect1 = root.get_element_by_id('rect1')
+        rects = list(g1)
+        index = root.get_spatial_index()
+        self.assertEqual(103, len(index))
+        self.assertEqual([root, g1, rects[3]], index.search_point(32, 2))
+        self.assertEqual([root, rect1], index.search_point(2, 102))
+
+        g1.set('transform', 'translate(0 200)')
+        self.assertEqual([], index.search(0, 0, 1000, 10))
+        self.assertEqual([root, g1, rects[3]], index.search_point(32, 202))
+        self.assertEqual([root, g1] + rects[:10],
+                         index.search(0, 200, 95, 5))
+        self.assertEqual([root, rect1], index.search_point(2, 102))
+        self.assertEqual([rect1], index.search(0, 100, 5, 5, enclosed=True))
+
+        # updates after the repack
+        rect1.set('y', '300')
+        self.assertEqual([], index.search_point(2, 102))
+        self.assertEqual([root, rect1], index.search_point(2, 302))
+        self.assertEqual([root, g1, rects[3]], index.search_point(32, 202))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,7 +14,7 @@ sys.path.extend(['.', '..'])
 from svgpy import Font, SVGParser, window
 from svgpy.css import CSSRule
 from svgpy.style import get_css_rules, get_css_style_sheets_from_svg_document, \
-    get_css_style_sheets_from_xml_stylesheet, get_css_style
+    get_css_style_sheets_from_xml_stylesheet, get_css_style, shared_styles
 from svgpy.utils import get_content_type, load
 
 # LOGGING_LEVEL = logging.DEBUG
@@ -573,6 +573,34 @@ hhx4dbgYKAAA7'''
         self.assertIsInstance(data, bytes)
         self.assertEqual(273, len(data))
 
+    def test_shared_styles(self):
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg">'
+            '<style>.a { fill: red }</style>'
+            '<g class="a"><rect id="rect1"/></g>'
+            '</svg>')
+        g = root[1]
+        rect = root.get_element_by_id('rect1')
+        self.assertIsNot(get_css_rules(g), get_css_rules(rect))
+
+        with shared_styles() as styles:
+            css_rules = get_css_rules(g)
+            self.assertIs(css_rules, get_css_rules(rect))
+            css_style, _ = get_css_style(g, css_rules)
+            self.assertEqual('red', css_style['fill'])
+            css_style['fill'] = 'blue'  # returns a copy
+            self.assertEqual('red', get_css_style(g, css_rules)[0]['fill'])
+            self.assertEqual('red', rect.get_computed_style()['fill'])
+            with shared_styles() as inner_styles:
+                self.assertIs(styles, inner_styles)
+
+        # the context is not active anymore
+        root[0].text = '.a { fill: green }'
+        self.assertEqual('green', rect.get_computed_style()['fill'])
+        with shared_styles(styles):
+            self.assertIs(css_rules, get_css_rules(rect))
+
 
 if __name__ == '__main__':
     unittest.main()
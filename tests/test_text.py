@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 
+import gc
 import sys
 import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 
 sys.path.extend(['.', '..'])
 
 from svgpy import Element, Font, Node, PathParser, SVGParser, \
-    formatter
-from svgpy.core import CSSUtils
+    SVGTextContentElement, formatter
+from svgpy.core import CSSUtils, FontManager, _FacePool, _face_pool
+from svgpy.harfbuzz import HBBuffer
+from svgpy.window import active_window
 
 SVG_ROTATE_SCALE = '''
 <svg width="400px" height="120px" version="1.1"
@@ -443,6 +448,76 @@ class TextTestCase(unittest.TestCase):
         rect = PathParser.get_bbox(normalized)
         self.assertTrue(rect.isvalid(), msg=repr(rect))
 
+    def test_font_face02(self):
+        # font faces and HarfBuzz fonts are shared
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        root.attributes.update({
+            'font-family': 'DejaVu Sans, sans-serif',
+            'font-size': '20',
+        })
+        text1 = root.create_sub_element('text')
+        text2 = root.create_sub_element('text')
+        text3 = root.create_sub_element('text')
+        text3.attributes.update({'font-size': '30'})
+
+        font1 = Font(text1)
+        font2 = Font(text2)
+        font3 = Font(text3)
+        self.assertIs(font1.face, font2.face)
+        self.assertIs(font1.hb_font, font2.hb_font)
+        self.assertIsNot(font1.face, font3.face)
+        self.assertIsNot(font1.hb_font, font3.hb_font)
+
+        height = font1.line_height
+        font2.set_point_size(0, 30 * 64)
+        self.assertIsNot(font1.face, font2.face)
+        self.assertEqual(height, font1.line_height)
+
+    def test_font_face_pool(self):
+        # the least recently used sized faces are released
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        root.attributes.update({'font-family': 'DejaVu Sans, sans-serif'})
+        text = root.create_sub_element('text')
+        face = FontManager.get_face(text.get_computed_style(), None)
+        max_sized_faces = _FacePool.MAX_SIZED_FACES
+        try:
+            _FacePool.MAX_SIZED_FACES = 4
+            faces = [FontManager.get_sized_face(face, 0, size * 64)
+                     for size in range(10, 15)]
+            self.assertEqual(4, len(_face_pool.sized_faces))
+            self.assertNotIn(face, _face_pool.sized_faces.values())
+            self.assertNotIn(faces[0], _face_pool.sized_faces.values())
+            self.assertIs(faces[4],
+                          FontManager.get_sized_face(face, 0, 14 * 64))
+            # an evicted face is not resized
+            sized_face = FontManager.get_sized_face(faces[0], 0, 10 * 64)
+            self.assertIsNot(faces[0], sized_face)
+            self.assertIsNot(face, FontManager.get_sized_face(face, 0, 640))
+
+            # a HarfBuzz font keeps its face alive after the eviction
+            hb_font = FontManager.get_hb_font(faces[4])
+            self.assertIs(hb_font, FontManager.get_hb_font(faces[4]))
+            face_ref = weakref.ref(faces[4])
+            del faces, sized_face
+            for size in range(20, 25):
+                FontManager.get_sized_face(face, 0, size * 64)
+            gc.collect()
+            self.assertIsNotNone(face_ref())
+            buf = HBBuffer.create()
+            buf.add_utf8('Hello')
+            buf.guess_segment_properties()
+            buf.shape(hb_font)
+            self.assertEqual(5, len(buf.get_glyph_infos()))
+
+            # the face is released with the HarfBuzz font
+            del hb_font
+            gc.collect()
+            self.assertIsNone(face_ref())
+        finally:
+            _FacePool.MAX_SIZED_FACES = max_sized_faces
+
     def test_font_prop01(self):
         # 'font' property
         # https://drafts.csswg.org/css-fonts-3/#font-prop
@@ -1354,6 +1429,117 @@ class TextTestCase(unittest.TestCase):
         self.assertAlmostEqual(width, bbox.width, delta=delta)
         self.assertAlmostEqual(height, bbox.height, delta=delta)
 
+    def test_get_bbox_char_positions01(self):
+        # character positioning: the values of 'x' and 'dx' are indexed by
+        # the addressable characters of the element and its descendants
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        text = root.create_sub_element('text')
+        text.attributes.update({
+            'font-family': 'DejaVu Sans, sans-serif',
+            'font-size': '20',
+            'x': '10 20 30 40 50 60 70',
+            'y': '50',
+            'dx': '0 0 0 0 0 0 7',
+        })
+        text.text = 'ab'
+        tspan1 = text.create_sub_element('tspan')
+        tspan1.attributes.update({'x': '0'})
+        tspan1.text = 'c'
+        tspan2 = text.create_sub_element('tspan')
+        tspan2.text = 'de'
+        self.assertEqual('ab c de', text.get_chars())
+
+        # 'a': x=10, 'b': x=20, ' ': x=30, 'c': x=0, ' ': x=50, 'd': x=60,
+        # 'e': x=70 dx=7
+        bbox = text.get_bbox()
+        self.assertAlmostEqual(0, bbox.x)
+        self.assertAlmostEqual(77 + tspan2.get_sub_string_length(2, 1),
+                               bbox.right)
+
+    def test_get_bbox_char_positions02(self):
+        # character positioning: the values of a tspan element override
+        # the values of its ancestors, and a space between two text chunks
+        # belongs to their nearest common ancestor
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        root.attributes.update({
+            'font-family': 'DejaVu Sans, sans-serif',
+            'font-size': '20',
+        })
+        text1 = root.create_sub_element('text')
+        text1.attributes.update({'x': '0 10 20 30 40 50'})
+        text1.text = 'lll'
+        tspan1 = text1.create_sub_element('tspan')
+        tspan1.attributes.update({'x': '100'})
+        tspan1.text = 'll'
+        tspan1.tail = 'l'
+        text2 = root.create_sub_element('text')
+        text2.attributes.update({'x': '0 10 20 30 100 50'})
+        text2.text = 'lll ll l'
+        self.assertEqual(text2.get_chars(), text1.get_chars())
+
+        bbox1 = text1.get_bbox()
+        bbox2 = text2.get_bbox()
+        self.assertAlmostEqual(bbox2.x, bbox1.x)
+        self.assertAlmostEqual(bbox2.width, bbox1.width)
+        self.assertAlmostEqual(100 + tspan1.get_sub_string_length(1, 1),
+                               bbox1.right)
+        path_data1 = text1.get_path_data()
+        path_data2 = text2.get_path_data()
+        self.assertEqual(PathParser.tostring(path_data2),
+                         PathParser.tostring(path_data1))
+        path_bbox = PathParser.get_bbox(PathParser.normalize(path_data1))
+        self.assertGreater(path_bbox.right, 100)
+        self.assertLess(path_bbox.right, bbox1.right)
+
+        text1.attributes.update({'x': '0', 'dx': '1 2 4 8'})
+        text1.text = 'abc '
+        tspan1.attributes.pop('x')
+        tspan1.attributes.update({'dx': '16'})
+        tspan1.text = 'de'
+        tspan1.tail = ' f'
+        text2.attributes.update({'x': '0', 'dx': '1 2 4 8 16'})
+        text2.text = 'abc de f'
+        self.assertEqual(text2.get_chars(), text1.get_chars())
+
+        # ' ': dx=8, 'd': dx=16
+        bbox1 = text1.get_bbox()
+        bbox2 = text2.get_bbox()
+        self.assertAlmostEqual(bbox2.x, bbox1.x)
+        self.assertAlmostEqual(bbox2.width, bbox1.width)
+        self.assertAlmostEqual(31 + text2.get_computed_text_length(),
+                               bbox1.right)
+        path_data1 = text1.get_path_data()
+        path_data2 = text2.get_path_data()
+        self.assertEqual(PathParser.tostring(path_data2),
+                         PathParser.tostring(path_data1))
+
+    def test_get_bbox_char_positions03(self):
+        # the white space between tspan elements does not extend the
+        # bounding box
+        parser = SVGParser()
+        root = parser.fromstring(
+            '<svg xmlns="http://www.w3.org/2000/svg"'
+            ' font-family="DejaVu Sans, sans-serif" font-size="20">'
+            '<text>\n'
+            '    <tspan x="0" dy="20">abcdefgh</tspan>\n'
+            '    <tspan x="0" dy="20">abc</tspan>\n'
+            '</text>'
+            '</svg>')
+        text = root[0]
+        tspan1 = text[0]
+        self.assertEqual('abcdefgh abc', text.get_chars())
+
+        # 'abcdefgh ': y=20, 'abc': y=40
+        bbox = text.get_bbox()
+        self.assertAlmostEqual(0, bbox.x)
+        self.assertAlmostEqual(tspan1.get_computed_text_length(),
+                               bbox.width)
+        path_bbox = PathParser.get_bbox(
+            PathParser.normalize(text.get_path_data()))
+        self.assertLess(path_bbox.right, bbox.right)
+
     def test_get_computed_text_length_tspan04(self):
         # See also: tspan04.html
         parser = SVGParser()
@@ -2344,13 +2530,13 @@ class TextTestCase(unittest.TestCase):
             " 359.92,84.42 361.48,85.77 363.73,85.38 365.98,84.97" \
             " 367,83.17 368.02,81.38 367.53,78.61 367.03,75.83" \
             " 365.47,74.48 363.91,73.14 361.66,73.55 359.41,73.94" \
-            " 358.39,75.73 357.39,77.53 357.89,80.31 M405.17,88.7" \
-            " Q404.83,88.36 404.42,87.95 404.02,87.55 403.53,87.06" \
-            " 401.81,85.34 399.84,85.44 397.89,85.55 395.97,87.47" \
-            " L389.34,94.09 387.31,92.06 400.05,79.33 402.08,81.36" \
-            " 399.95,83.48 Q401.67,83.05 403.22,83.55 404.78,84.06" \
-            " 406.25,85.53 406.45,85.73 406.7,85.98 406.97,86.25" \
-            " 407.28,86.56 L405.17,88.7 M415.62,89.42 Q414.3,87.52" \
+            " 358.39,75.73 357.39,77.53 357.89,80.31 M405.09,92.17" \
+            " Q404.81,91.78 404.48,91.31 404.16,90.84 403.77,90.28" \
+            " 402.38,88.28 400.44,88.05 398.5,87.81 396.25,89.39" \
+            " L388.59,94.75 386.94,92.38 401.67,82.05 403.33,84.42" \
+            " 400.88,86.16 Q402.62,86.02 404.06,86.78 405.52,87.55" \
+            " 406.7,89.23 406.88,89.48 407.08,89.78 407.28,90.08" \
+            " 407.53,90.44 L405.09,92.17 M415.62,89.42 Q414.3,87.52" \
             " 412.2,87.34 410.12,87.17 407.83,88.77 405.55,90.38 405,92.39" \
             " 404.45,94.41 405.8,96.31 407.11,98.19 409.19,98.36" \
             " 411.28,98.53 413.56,96.94 415.83,95.36 416.38,93.33" \
@@ -2481,6 +2667,90 @@ class TextTestCase(unittest.TestCase):
         for i, (e, a) in enumerate(zip(expected, advances)):
             self.assertAlmostEqual(e, a, places=places, msg=i)
 
+    def test_text_layout_cache01(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        text = root.create_sub_element('text')
+        text.attributes.update({
+            'font-family': 'DejaVu Sans, sans-serif',
+            'font-size': '20',
+        })
+        text.text = 'Hello, '
+        tspan = text.create_sub_element('tspan')
+        tspan.text = 'World'
+
+        # the layout is shared by the text element and its descendants
+        chars_info = text._get_chars_info()
+        self.assertIs(chars_info, tspan._get_chars_info())
+        self.assertIs(chars_info, text._get_chars_info(
+            SVGTextContentElement._LAYOUT_CHARS))
+        length = text.get_computed_text_length()
+        bbox = text.get_bbox()
+        self.assertIs(chars_info, text._get_chars_info())
+
+        # the layout outlives the Python references to the element
+        del text
+        text = root[0]
+        self.assertIs(chars_info, tspan._get_chars_info())
+
+        # text changes
+        tspan.text = 'World!'
+        self.assertIsNot(chars_info, tspan._get_chars_info(
+            SVGTextContentElement._LAYOUT_CHARS))
+        self.assertEqual(' World!', tspan.get_chars())
+        self.assertGreater(text.get_computed_text_length(), length)
+
+        # attribute changes
+        length = text.get_computed_text_length()
+        tspan.attributes['font-size'] = '40'
+        self.assertGreater(text.get_computed_text_length(), length)
+
+        # style changes of an ancestor
+        length = text.get_computed_text_length()
+        root.style['font-size'] = '10'
+        text.attributes.pop('font-size')
+        self.assertLess(text.get_computed_text_length(), length)
+
+        # structure changes
+        text.remove(tspan)
+        self.assertEqual('Hello,', text.get_chars())
+        self.assertLess(text.get_bbox().width, bbox.width)
+
+    def test_text_layout_cache02(self):
+        parser = SVGParser()
+        root = parser.create_element('svg')
+        text = root.create_sub_element('text')
+        text.attributes.update({
+            'font-family': 'DejaVu Sans, sans-serif',
+            'font-size': '20',
+        })
+        text.text = 'Hello, World'
+
+        # measurement does not render the glyph outlines
+        length = text.get_computed_text_length()
+        chars_info = text._get_chars_info(
+            SVGTextContentElement._LAYOUT_METRICS)
+        self.assertEqual(
+            [], chars_info[0][SVGTextContentElement._CHARS_PATH_DATA])
+
+        # rendering upgrades the cached layout
+        self.assertGreater(len(text.get_path_data()), 0)
+        self.assertAlmostEqual(length, text.get_computed_text_length())
+
+        style = text.get_computed_style()
+        self.assertAlmostEqual(length, Font.measure_text(text.text, style))
+        self.assertEqual(0, Font.measure_text('', style))
+
+        # the language and the script are set as in the text layout
+        text.attributes.update({
+            'lang': 'sr-Latn',
+            'font-feature-settings': '"liga" 0',
+        })
+        text.text = 'office affine'
+        style = text.get_computed_style()
+        self.assertAlmostEqual(text.get_computed_text_length(),
+                               Font.measure_text(text.text, style))
+
     def test_text_content01(self):
         # Node#nodeName
         # Node#nodeType
@@ -2944,6 +3214,33 @@ class TextTestCase(unittest.TestCase):
         print(('glyph.metrics.vert_bearing_x', glyph.metrics.vert_bearing_x / 64))
         print(('glyph.metrics.vert_bearing_y', glyph.metrics.vert_bearing_y / 64))
 
+    def test_text_threads(self):
+        src = '''
+<svg xmlns="http://www.w3.org/2000/svg" width="400" height="100">
+  <text x="10" y="50" font-family="DejaVu Sans, sans-serif" font-size="20"
+    >Hello, <tspan font-weight="bold">World</tspan>!</text>
+</svg>
+'''
+
+        def layout(_):
+            with active_window():
+                root = SVGParser().fromstring(src)
+                text = root[0]
+                face = FontManager.get_face(text.get_computed_style(), None)
+                bbox = text.get_bbox()
+                return (face,
+                        text.get_computed_text_length(),
+                        (bbox.x, bbox.y, bbox.width, bbox.height),
+                        len(text.get_path_data()))
+
+        main_face, *expected = layout(0)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(layout, range(16)))
+        for face, *actual in results:
+            # faces are not shared between threads
+            self.assertIsNot(main_face, face)
+            self.assertEqual(expected, actual)
+
     def test_white_space_prop01(self):
         # See also: white-space.html
         # 'white-space' property: normal